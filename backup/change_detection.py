@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+from hashlib import sha256
+from json import dumps, loads
+from os import path
+from re import compile
+
+from backup.encryption import plain_file
+from backup.metrics import written_atomically
+from backup.ssh_client import localpath
+
+export_header = compile(pattern=rb'^# .* by RouterOS ')  # carries the time of the export, not the configuration
+
+
+def export_fingerprint(filename, key=None):
+  fingerprint = sha256()
+  with plain_file(filename=filename, key=key) as export_script:
+    for line in export_script:
+      if not export_header.match(line):
+        fingerprint.update(line)
+  return fingerprint.hexdigest()
+
+
+def fingerprint_filename(device_id, backups_directory):
+  return str(localpath(
+    filename='{device_id}.fingerprint'.format(device_id=device_id),
+    backups_directory=backups_directory
+  ))
+
+
+def stored_fingerprint(filename):
+  try:
+    with open(filename) as fingerprint_file:
+      return loads(fingerprint_file.read())
+  except FileNotFoundError:
+    return {}
+
+
+def is_expired(stored, maximum_age_seconds):
+  if 'saved' not in stored:  # stored before the backups were dated, so its age is unknown
+    return True
+  return datetime.now() - datetime.fromisoformat(stored['saved']) > timedelta(seconds=maximum_age_seconds)
+
+
+def unchanged_backup(filename, fingerprint, maximum_age_seconds=604800):
+  stored = stored_fingerprint(filename=filename)
+  if (
+    fingerprint
+    and stored.get('fingerprint') == fingerprint
+    and path.exists(stored['backup'])
+    and not is_expired(stored=stored, maximum_age_seconds=maximum_age_seconds)  # /export misses users and keys
+  ):
+    return stored['backup']
+  return None
+
+
+def saved_fingerprint(filename, fingerprint, backup_localpath):
+  return written_atomically(
+    filename=filename,
+    content=dumps({'fingerprint': fingerprint, 'backup': str(backup_localpath), 'saved': datetime.now().isoformat()})
+  )
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+from hashlib import sha256
+from json import dumps, loads
+from os import fsync, path, remove
+from threading import Lock
+
+from backup.sweeper import swept_remote_files
+
+
+class CheckpointJournal:
+  def __init__(self, filename, max_age_seconds=86400):
+    self.filename = filename
+    self.lock = Lock()
+    self.finished_files = {}
+    self.interrupted = set()
+    entries = journal_entries(filename=filename)
+    if is_stale(entries=entries, max_age_seconds=max_age_seconds):  # the files finished then are not resumed
+      self.cleared()
+      entries = []
+    self.run_started = entries[0]['started'] if entries else None
+    for entry in entries[1:]:
+      if entry['status'] == 'started':
+        self.interrupted.add(entry['device'])
+      else:
+        self.interrupted.discard(entry['device'])
+        self.finished_files[entry['device']] = entry['files']
+
+  def written(self, entry):
+    with self.lock, open(self.filename, 'a') as journal:
+      if not self.run_started:  # the journal is dated by the run that starts it
+        self.run_started = datetime.now().isoformat()
+        journal.write('{entry}\n'.format(entry=dumps({'status': 'run', 'started': self.run_started})))
+      journal.write('{entry}\n'.format(entry=dumps(entry)))
+      journal.flush()
+      fsync(journal.fileno())  # must survive the restart of the host
+    return entry
+
+  def started(self, device):
+    return self.written(entry={'device': device, 'status': 'started'})
+
+  def finished(self, device, localpaths):
+    return self.written(entry={
+      'device': device,
+      'status': 'finished',
+      'files': [file_record(localpath=localpath) for localpath in localpaths]
+    })
+
+  def is_finished(self, device):
+    return device in self.finished_files and all(
+      path.exists(record['path']) and path.getsize(record['path']) == record['size']
+      for record in self.finished_files[device] if record
+    )
+
+  def finished_localpaths(self, device):
+    return [record['path'] if record else None for record in self.finished_files[device]]
+
+  def cleared(self):
+    if path.exists(self.filename):
+      remove(self.filename)
+    return self.filename
+
+
+def journal_entries(filename):
+  try:
+    with open(filename) as journal:
+      return [loads(line) for line in journal if line.endswith('\n')]  # the last line may be cut by a crash
+  except FileNotFoundError:
+    return []
+
+
+def is_stale(entries, max_age_seconds):
+  if not entries:
+    return False
+  if entries[0]['status'] != 'run':  # journaled before the runs were dated, so its age is unknown
+    return True
+  return datetime.now() - datetime.fromisoformat(entries[0]['started']) > timedelta(seconds=max_age_seconds)
+
+
+def file_checksum(localpath):
+  checksum = sha256()
+  with open(localpath, 'rb') as local_file:
+    for chunk in iter(lambda: local_file.read(65536), b''):
+      checksum.update(chunk)
+  return checksum.hexdigest()
+
+
+def file_record(localpath):
+  if not localpath:
+    return None
+  return {
+    'path': str(localpath),
+    'size': path.getsize(localpath),
+    'sha256': file_checksum(localpath=localpath)
+  }
+
+
+def reclaimed_leftovers(sftp, device_id, metrics):
+  return swept_remote_files(
+    sftp=sftp,
+    device_id=device_id,
+    sweep_options={'minimum_age_seconds': 0},  # nothing of the routerboard is running when it is resumed
+    metrics=metrics
+  )['files']
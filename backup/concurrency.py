@@ -0,0 +1,86 @@
+from collections import deque
+from contextlib import contextmanager
+from os import fsync, remove
+from tempfile import mkstemp
+from threading import Condition
+from time import perf_counter
+
+
+class AdaptiveConcurrency:
+  def __init__(
+    self,
+    floor,
+    ceiling,
+    initial=None,
+    decrease_factor=0.5,
+    error_window=20,
+    maximum_error_rate=0.2,
+    maximum_disk_write_latency_seconds=0.1,
+    minimum_throughput_ratio=0.5,
+    best_throughputs=None
+  ):
+    self.floor = floor
+    self.ceiling = ceiling
+    self.limit = initial or floor
+    self.decrease_factor = decrease_factor
+    self.outcomes = deque(maxlen=error_window)
+    self.maximum_error_rate = maximum_error_rate
+    self.maximum_disk_write_latency_seconds = maximum_disk_write_latency_seconds
+    self.minimum_throughput_ratio = minimum_throughput_ratio
+    self.best_throughputs = dict(best_throughputs or {})  # each run observes a device only once
+    self.in_flight = 0
+    self.epoch = 0
+    self.condition = Condition()
+
+  @property
+  def error_rate(self):
+    return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0
+
+  @contextmanager
+  def slot(self):
+    with self.condition:
+      self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+      self.in_flight += 1
+      epoch = self.epoch
+    try:
+      yield epoch
+    finally:
+      with self.condition:
+        self.in_flight -= 1
+        self.condition.notify_all()
+
+  def is_congested(self, device, throughput, disk_write_latency):
+    return (
+      self.error_rate > self.maximum_error_rate
+      or (disk_write_latency or 0) > self.maximum_disk_write_latency_seconds
+      or (  # a slow link is not congestion, only a device slower than it used to be
+        throughput is not None
+        and throughput < self.best_throughputs.get(device, 0) * self.minimum_throughput_ratio
+      )
+    )
+
+  def observed(self, epoch, failed, device=None, throughput=None, disk_write_latency=None):
+    with self.condition:
+      self.outcomes.append(failed)
+      if self.is_congested(device=device, throughput=throughput, disk_write_latency=disk_write_latency):
+        if epoch == self.epoch:  # jobs started before the last decrease do not decrease it again
+          self.limit = max(self.floor, self.limit * self.decrease_factor)
+          self.epoch += 1
+      else:
+        self.limit = min(self.ceiling, self.limit + 1 / self.limit)
+      self.best_throughputs[device] = max(self.best_throughputs.get(device, 0), throughput or 0)
+      self.condition.notify_all()
+      return self.limit
+
+
+def disk_write_latency(directory, size=4096):
+  descriptor, filename = mkstemp(dir=directory, prefix='.disk_write_latency_')
+  try:
+    start_time = perf_counter()
+    with open(descriptor, 'wb') as probe:
+      probe.write(bytes(size))
+      probe.flush()
+      fsync(probe.fileno())
+    return perf_counter() - start_time
+  finally:
+    remove(filename)
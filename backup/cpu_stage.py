@@ -0,0 +1,111 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from gzip import open as gzip_open
+from multiprocessing import get_context
+from os import cpu_count, path, remove
+from shutil import copyfileobj
+from threading import BoundedSemaphore
+
+from backup.checkpoint import file_checksum
+
+
+sidecar_extension = '.sha256'
+
+
+class PendingFile:
+  def __init__(self, localpath, future):
+    self.localpath = localpath
+    self.future = future
+
+  def resolved(self):
+    return type(self.localpath)(self.future.result())
+
+
+class CPUStage:
+  def __init__(self, jobs, workers=None, max_pending_jobs=None):
+    self.jobs = jobs
+    self.workers = workers or cpu_count()
+    self.pending = BoundedSemaphore(value=max_pending_jobs or 2 * self.workers)
+    self.executor = ProcessPoolExecutor(
+      max_workers=self.workers,
+      mp_context=get_context('spawn')  # the stage is used from the transfer threads, a fork would copy their locks
+    )
+
+  def submitted(self, localpath):
+    self.pending.acquire()  # the transfer thread, and so its next download, waits while the stage is behind
+    future = self.executor.submit(processed_file, localpath=str(localpath), jobs=self.jobs)
+    future.add_done_callback(lambda _: self.pending.release())
+    return future
+
+  def pending_files(self, localpaths):
+    return [
+      PendingFile(localpath=localpath, future=self.submitted(localpath=localpath)) if localpath else localpath
+      for localpath in localpaths
+    ]
+
+  def shutdown(self):
+    self.executor.shutdown()
+
+
+def gzipped_export(localpath):
+  if not localpath.endswith('.rsc'):  # the .backup is encrypted by the routerboard, it does not compress
+    return localpath
+  compressed = '{localpath}.gz'.format(localpath=localpath)
+  with open(localpath, 'rb') as plain, gzip_open(compressed, 'wb') as gzipped:
+    copyfileobj(plain, gzipped, 1024 * 1024)
+  remove(localpath)
+  return compressed
+
+
+def sidecar_filename(localpath):
+  return '{localpath}{extension}'.format(localpath=localpath, extension=sidecar_extension)
+
+
+def checksum_sidecar(localpath):
+  with open(sidecar_filename(localpath=localpath), 'w') as sidecar:
+    sidecar.write('{checksum}  {filename}\n'.format(  # as sha256sum writes it, sha256sum -c checks it
+      checksum=file_checksum(localpath=localpath),
+      filename=path.basename(localpath)
+    ))
+  return localpath
+
+
+cpu_jobs = {
+  'gzip': gzipped_export,
+  'sha256': checksum_sidecar
+}
+
+
+def processed_file(localpath, jobs):
+  for job in jobs:
+    localpath = cpu_jobs[job](localpath=localpath)
+  return localpath
+
+
+def is_processed(files):
+  return all(file.future.done() for file in files if isinstance(file, PendingFile))
+
+
+def resolved_files(files):
+  return [file.resolved() if isinstance(file, PendingFile) else file for file in files]
+
+
+def finished_results(unfinished_results, finished):
+  unfinished = []
+  for index, unfinished_result in unfinished_results:
+    unfinished.append((index, unfinished_result))
+    for processed in [entry for entry in unfinished if is_processed(files=entry[1]['files'])]:
+      unfinished.remove(processed)
+      yield processed[0], finished(unfinished=processed[1])
+  for index, unfinished_result in unfinished:  # the files still on the cpu stage are waited for in the end
+    yield index, finished(unfinished=unfinished_result)
+
+
+@contextmanager
+def open_cpu_stage(cpu_stage_options):
+  cpu_stage = CPUStage(**cpu_stage_options) if cpu_stage_options else None
+  try:
+    yield cpu_stage
+  finally:
+    if cpu_stage:
+      cpu_stage.shutdown()
@@ -0,0 +1,75 @@
+from os import O_RDONLY, close, fsync, open as open_descriptor, path, remove, replace
+from threading import Lock
+
+fsync_policies = {'none', 'file', 'directory'}
+
+
+class Durability:
+  def __init__(self, fsync='directory', directory_batch_size=64):
+    if fsync not in fsync_policies:
+      raise ValueError('Unknown fsync policy {fsync}'.format(fsync=fsync))
+    self.fsync = fsync
+    self.directory_batch_size = directory_batch_size
+    self.lock = Lock()
+    self.directories = set()
+    self.renames = 0
+
+  def synced_file(self, local_file):
+    if self.fsync != 'none':
+      local_file.flush()
+      fsync(local_file.fileno())  # the content is on disk before the name points to it
+    return local_file
+
+  def renamed(self, localpath):
+    if self.fsync != 'directory':
+      return []
+    with self.lock:
+      self.directories.add(path.dirname(path.abspath(localpath)))
+      self.renames += 1
+      if self.renames < self.directory_batch_size:
+        return []
+    return self.synced_directories()
+
+  def synced_directories(self):
+    with self.lock:
+      directories, self.directories, self.renames = self.directories, set(), 0
+    for directory in sorted(directories):  # one sync for every file renamed on the directory since the last one
+      descriptor = open_descriptor(directory, O_RDONLY)
+      try:
+        fsync(descriptor)
+      finally:
+        close(descriptor)
+    return sorted(directories)
+
+
+class AtomicFile:
+  def __init__(self, localpath, durability=None):
+    self.name = localpath
+    self.temporary_filename = '{localpath}.part'.format(localpath=localpath)
+    self.durability = durability
+    self.file = open(self.temporary_filename, 'wb')
+
+  def write(self, data):
+    return self.file.write(data)
+
+  def close(self):
+    if self.durability:
+      self.durability.synced_file(local_file=self.file)
+    self.file.close()
+    replace(self.temporary_filename, self.name)  # the file only has its name once it is complete
+    if self.durability:
+      self.durability.renamed(localpath=self.name)
+
+  def discarded(self):
+    self.file.close()
+    remove(self.temporary_filename)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exception_type, exception, traceback):
+    if exception_type:
+      self.discarded()
+    else:
+      self.close()
+
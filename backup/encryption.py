@@ -0,0 +1,114 @@
+from io import BytesIO
+from os import O_CREAT, O_EXCL, O_WRONLY, open as open_descriptor, urandom
+from struct import pack
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+magic = b'TASIAPE1'
+encrypted_extension = '.enc'
+key_size = 32
+nonce_prefix_size = 7
+plain_chunk_size = 65536
+tag_size = 16
+
+
+def generated_key(key_filename):
+  with open(open_descriptor(key_filename, O_WRONLY | O_CREAT | O_EXCL, 0o600), 'wb') as key_file:  # never replaced
+    key_file.write(urandom(key_size))
+  return key_filename
+
+
+def encryption_key(encryption):
+  if not encryption:
+    return None
+  with open(encryption['key_filename'], 'rb') as key_file:
+    key = key_file.read()
+  if len(key) != key_size:
+    raise ValueError('The encryption key must have {key_size} bytes'.format(key_size=key_size))
+  return key
+
+
+def local_filename(filename, key):
+  return '{filename}{extension}'.format(filename=filename, extension=encrypted_extension) if key else filename
+
+
+def chunk_nonce(prefix, counter, last):
+  return prefix + pack('>I?', counter, last)  # a chunk cut, moved or dropped does not authenticate
+
+
+class EncryptedFile:
+  def __init__(self, file, key):
+    self.file = file
+    self.name = file.name
+    self.cipher = AESGCM(key)
+    self.header = magic + urandom(nonce_prefix_size)
+    self.counter = 0
+    self.pending = bytearray()
+    file.write(self.header)
+
+  def sealed(self, data, last):
+    chunk = self.cipher.encrypt(
+      nonce=chunk_nonce(prefix=self.header[len(magic):], counter=self.counter, last=last),
+      data=bytes(data),
+      associated_data=self.header
+    )
+    self.counter += 1
+    return chunk
+
+  def write(self, data):
+    self.pending += data
+    while len(self.pending) > plain_chunk_size:  # the last chunk is only sealed on close
+      self.file.write(self.sealed(data=self.pending[:plain_chunk_size], last=False))
+      del self.pending[:plain_chunk_size]
+    return len(data)
+
+  def close(self):
+    self.file.write(self.sealed(data=self.pending, last=True))
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exception_type, exception, traceback):
+    if exception_type:
+      self.file.__exit__(exception_type, exception, traceback)  # without its last chunk it never decrypts
+    else:
+      self.close()
+
+
+def decrypted_chunks(encrypted_file, key):
+  header = encrypted_file.read(len(magic) + nonce_prefix_size)
+  if not header.startswith(magic):
+    raise ValueError('{filename} is not an encrypted backup file'.format(filename=encrypted_file.name))
+  cipher = AESGCM(key)
+  counter = 0
+  chunk = encrypted_file.read(plain_chunk_size + tag_size)
+  while True:
+    next_chunk = encrypted_file.read(plain_chunk_size + tag_size)
+    yield cipher.decrypt(
+      nonce=chunk_nonce(prefix=header[len(magic):], counter=counter, last=not next_chunk),
+      data=chunk,
+      associated_data=header
+    )
+    if not next_chunk:
+      return
+    chunk = next_chunk
+    counter += 1
+
+
+def plain_file(filename, key):
+  if not key:
+    return open(filename, 'rb')
+  with open(filename, 'rb') as encrypted_file:  # the exports are small, they are decrypted in memory, not on disk
+    return BytesIO(b''.join(decrypted_chunks(encrypted_file=encrypted_file, key=key)))
+
+
+def decrypted_file(filename, key):
+  if filename.endswith(encrypted_extension):
+    plain_filename = filename[:-len(encrypted_extension)]
+  else:
+    plain_filename = '{filename}.plain'.format(filename=filename)
+  with open(filename, 'rb') as encrypted_file, open(plain_filename, 'xb') as plain:
+    for chunk in decrypted_chunks(encrypted_file=encrypted_file, key=key):
+      plain.write(chunk)
+  return plain_filename
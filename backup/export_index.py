@@ -0,0 +1,156 @@
+from contextlib import closing
+from datetime import datetime
+from hashlib import sha256
+from io import TextIOWrapper
+from re import compile
+from sqlite3 import connect
+
+from backup.encryption import encryption_key, plain_file
+
+schema = '''
+  CREATE TABLE IF NOT EXISTS exports (
+    id INTEGER PRIMARY KEY, device TEXT NOT NULL, created TEXT NOT NULL, filename TEXT NOT NULL UNIQUE
+  );
+  CREATE INDEX IF NOT EXISTS exports_by_device ON exports (device, created);
+  CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY, section TEXT NOT NULL, line TEXT NOT NULL, UNIQUE (section, line)
+  );
+  CREATE TABLE IF NOT EXISTS export_records (
+    export_id INTEGER NOT NULL, record_id INTEGER NOT NULL, PRIMARY KEY (export_id, record_id)
+  ) WITHOUT ROWID;
+  CREATE INDEX IF NOT EXISTS export_records_by_record ON export_records (record_id);
+  CREATE TABLE IF NOT EXISTS postings (
+    token TEXT NOT NULL, record_id INTEGER NOT NULL, PRIMARY KEY (token, record_id)
+  ) WITHOUT ROWID;
+  CREATE TABLE IF NOT EXISTS sections (
+    export_id INTEGER NOT NULL, section TEXT NOT NULL, digest TEXT NOT NULL, PRIMARY KEY (export_id, section)
+  ) WITHOUT ROWID;
+'''
+
+token_pattern = compile(pattern=r'[^\s=]+="(?:[^"\\]|\\.)*"|\S+')
+
+
+def connected_index(filename):
+  connection = connect(filename, timeout=60)  # other threads may be indexing their exports
+  connection.executescript(schema)
+  return connection
+
+
+def export_records(lines):
+  section = ''
+  pending = ''
+  for line in lines:
+    line = pending + line.strip() if pending else line.rstrip()
+    if line.endswith('\\'):  # continues on the next line
+      pending = line[:-1]
+      continue
+    pending = ''
+    if not line or line.startswith('#'):
+      continue
+    if line.startswith('/'):
+      section = line
+      continue
+    yield section, line
+
+
+def tokens(line):
+  return set(token.lower() for token in token_pattern.findall(line))
+
+
+def section_digests(records):
+  digests = {}
+  for section, line in records:
+    digests.setdefault(section, sha256()).update('{line}\n'.format(line=line).encode())
+  return {section: digest.hexdigest() for section, digest in digests.items()}
+
+
+def record_id(connection, section, line):
+  found = connection.execute('SELECT id FROM records WHERE section = ? AND line = ?', (section, line)).fetchone()
+  if found:
+    return found[0]
+  new_record_id = connection.execute('INSERT INTO records (section, line) VALUES (?, ?)', (section, line)).lastrowid
+  connection.executemany(  # only new records are tokenized, the repeated ones are already on the postings
+    'INSERT INTO postings (token, record_id) VALUES (?, ?)',
+    [(token, new_record_id) for token in tokens(line=line)]
+  )
+  return new_record_id
+
+
+def indexed_export(connection, device_id, created, script_localpath, key=None):
+  with connection:
+    if connection.execute('SELECT 1 FROM exports WHERE filename = ?', (str(script_localpath),)).fetchone():
+      return None
+    export_id = connection.execute(
+      'INSERT INTO exports (device, created, filename) VALUES (?, ?, ?)',
+      (device_id, created.isoformat(), str(script_localpath))
+    ).lastrowid
+    with TextIOWrapper(plain_file(filename=script_localpath, key=key)) as script:
+      records = list(export_records(lines=script))
+    connection.executemany(
+      'INSERT OR IGNORE INTO export_records (export_id, record_id) VALUES (?, ?)',
+      [(export_id, record_id(connection=connection, section=section, line=line)) for section, line in records]
+    )
+    connection.executemany(
+      'INSERT INTO sections (export_id, section, digest) VALUES (?, ?, ?)',
+      [(export_id, section, digest) for section, digest in section_digests(records=records).items()]
+    )
+  return export_id
+
+
+def devices_with(connection, text, section=None):
+  query_tokens = sorted(tokens(line=text))
+  if not query_tokens:
+    return []
+  return [device for device, in connection.execute(
+    '''
+      WITH latest AS (
+        SELECT exports.id, exports.device FROM exports JOIN (
+          SELECT device, MAX(created) AS created FROM exports GROUP BY device
+        ) AS newest ON newest.device = exports.device AND newest.created = exports.created
+      ), matching AS (
+        SELECT record_id FROM postings WHERE token IN ({placeholders}) GROUP BY record_id HAVING COUNT(*) = ?
+      )
+      SELECT DISTINCT latest.device FROM latest
+      JOIN export_records ON export_records.export_id = latest.id
+      JOIN matching ON matching.record_id = export_records.record_id
+      JOIN records ON records.id = matching.record_id
+      WHERE ? IS NULL OR records.section = ?
+      ORDER BY latest.device
+    '''.format(placeholders=', '.join('?' * len(query_tokens))),
+    (*query_tokens, len(query_tokens), section, section)
+  )]
+
+
+def section_changes(connection, device_id, section):
+  changes = []
+  previous_digest = None
+  for created, digest in connection.execute(
+    '''
+      SELECT exports.created, sections.digest FROM exports
+      LEFT JOIN sections ON sections.export_id = exports.id AND sections.section = ?
+      WHERE exports.device = ? ORDER BY exports.created
+    ''',
+    (section, device_id)
+  ):
+    if digest != previous_digest:
+      changes.append({'created': created, 'digest': digest})
+    previous_digest = digest
+  return changes
+
+
+def encrypted_indexes(routerboards):
+  return [  # the index keeps the lines of the exports, and their tokens, in plain text
+    routerboard['name'] for routerboard in routerboards
+    if {'export_index', 'encryption'}.issubset(routerboard.get('backup_options', {}))
+  ]
+
+
+def routerboard_export_indexed(routerboard, script_localpath):
+  with closing(connected_index(filename=routerboard['backup_options']['export_index']['filename'])) as connection:
+    return indexed_export(
+      connection=connection,
+      device_id=routerboard['name'],
+      created=datetime.now(),
+      script_localpath=script_localpath,
+      key=encryption_key(encryption=routerboard['backup_options'].get('encryption'))
+    )
@@ -0,0 +1,131 @@
+from bisect import bisect_right
+from datetime import datetime
+from difflib import SequenceMatcher
+from io import TextIOWrapper
+from json import dumps, loads
+from os import makedirs, path
+
+from backup.durability import AtomicFile
+from backup.encryption import EncryptedFile, encrypted_extension, encryption_key, local_filename, plain_file
+from backup.metrics import written_atomically
+
+
+def device_store(directory, device_id):
+  return path.join(directory, device_id)
+
+
+def store_index(store):
+  try:
+    with open(path.join(store, 'index.jsonl')) as json_lines:
+      return [loads(line) for line in json_lines]
+  except FileNotFoundError:
+    return []
+
+
+def read_lines(filename, key=None):
+  with TextIOWrapper(plain_file(filename=filename, key=key), newline='') as text_file:
+    return text_file.readlines()
+
+
+def delta(base_lines, lines):
+  operations = []
+  for tag, base_start, base_end, start, end in SequenceMatcher(
+    a=base_lines,
+    b=lines,
+    autojunk=False
+  ).get_opcodes():
+    if tag == 'equal':
+      operations.append(['copy', base_start, base_end])
+    elif tag != 'delete':
+      operations.append(['insert', lines[start:end]])
+  return operations
+
+
+def patched(base_lines, operations):
+  lines = []
+  for operation in operations:
+    if operation[0] == 'copy':
+      lines.extend(base_lines[operation[1]:operation[2]])
+    else:
+      lines.extend(operation[1])
+  return lines
+
+
+def version_filename(store, entry):
+  return path.join(store, entry['filename'])
+
+
+def version_key(entry, key):
+  return key if entry['filename'].endswith(encrypted_extension) else None  # stored before the encryption was set
+
+
+def written_version(filename, content, key):
+  if not key:
+    return written_atomically(filename=filename, content=content)
+  with EncryptedFile(file=AtomicFile(localpath=filename), key=key) as version_file:  # never plain on the store
+    version_file.write(content.encode())
+  return filename
+
+
+def snapshot_lines(store, index, snapshot, key=None):
+  return read_lines(
+    filename=version_filename(store=store, entry=index[snapshot]),
+    key=version_key(entry=index[snapshot], key=key)
+  )
+
+
+def version_lines(store, index, entry, key=None):
+  if entry['snapshot'] == entry['version']:
+    return snapshot_lines(store=store, index=index, snapshot=entry['version'], key=key)
+  with plain_file(filename=version_filename(store=store, entry=entry), key=version_key(entry=entry, key=key)) as delta:
+    return patched(
+      base_lines=snapshot_lines(store=store, index=index, snapshot=entry['snapshot'], key=key),
+      operations=loads(delta.read())
+    )
+
+
+def stored_export(directory, device_id, script_localpath, created, snapshot_interval=10, key=None):
+  store = device_store(directory=directory, device_id=device_id)
+  makedirs(store, exist_ok=True)
+  index = store_index(store=store)
+  version = len(index)
+  lines = read_lines(filename=script_localpath, key=key)
+  last_snapshot = index[-1]['snapshot'] if index else None
+
+  if last_snapshot is None or version - last_snapshot >= snapshot_interval:
+    entry = {'version': version, 'snapshot': version, 'filename': '{version:08d}.rsc'.format(version=version)}
+    content = ''.join(lines)
+  else:
+    entry = {'version': version, 'snapshot': last_snapshot, 'filename': '{version:08d}.json'.format(version=version)}
+    content = dumps(delta(
+      base_lines=snapshot_lines(store=store, index=index, snapshot=last_snapshot, key=key),
+      lines=lines
+    ))
+
+  entry['filename'] = local_filename(filename=entry['filename'], key=key)
+  entry['created'] = created.isoformat()
+  written_version(filename=version_filename(store=store, entry=entry), content=content, key=key)
+  with open(path.join(store, 'index.jsonl'), 'a') as json_lines:  # only after the version is on disk
+    json_lines.write('{entry}\n'.format(entry=dumps(entry)))
+  return entry
+
+
+def export_at(directory, device_id, moment, key=None):
+  store = device_store(directory=directory, device_id=device_id)
+  index = store_index(store=store)
+  position = bisect_right([entry['created'] for entry in index], moment.isoformat())
+  if not position:
+    return None
+  return ''.join(version_lines(store=store, index=index, entry=index[position - 1], key=key))
+
+
+def routerboard_export_stored(routerboard, script_localpath):
+  export_store = routerboard['backup_options']['export_store']
+  return stored_export(
+    directory=export_store['directory'],
+    device_id=routerboard['name'],
+    script_localpath=script_localpath,
+    created=datetime.now(),
+    snapshot_interval=export_store.get('snapshot_interval', 10),
+    key=encryption_key(encryption=routerboard['backup_options'].get('encryption'))
+  )
@@ -0,0 +1,160 @@
+from contextlib import contextmanager
+from json import dumps
+from os import replace
+from threading import Lock
+from time import perf_counter
+
+
+class DeviceMetrics:
+  def __init__(self, device):
+    self.device = device
+    self.phases = {}
+    self.bytes_transferred = 0
+    self.polls = 0
+    self.reclaimed_bytes = 0
+    self.swept_bytes = 0
+    self.error = None
+
+  @contextmanager
+  def phase(self, name):
+    start = perf_counter()
+    try:
+      yield self
+    finally:
+      self.phases[name] = self.phases.get(name, 0.0) + perf_counter() - start
+
+  def polled(self):
+    self.polls += 1
+
+  def transferred(self, size):
+    self.bytes_transferred += size
+
+  def reclaimed(self, size):
+    self.reclaimed_bytes += size
+
+  def swept(self, size):
+    self.swept_bytes += size
+
+  def failed(self, error):
+    self.error = '{name}: {error}'.format(name=type(error).__name__, error=error)
+
+  @property
+  def throughput(self):
+    return self.bytes_transferred / self.phases['download'] if self.phases.get('download') else None
+
+  @property
+  def record(self):
+    return {
+      'device': self.device,
+      'phases': dict(self.phases),
+      'bytes_transferred': self.bytes_transferred,
+      'polls': self.polls,
+      'reclaimed_bytes': self.reclaimed_bytes,
+      'swept_bytes': self.swept_bytes,
+      'error': self.error
+    }
+
+
+class TransferProgress:
+  def __init__(self, metrics):
+    self.metrics = metrics
+    self.transferred = 0
+
+  def __call__(self, transferred, total):
+    self.metrics.transferred(size=transferred - self.transferred)
+    self.transferred = transferred
+
+
+def reported_metrics(metrics, hooks):
+  for hook in hooks:
+    hook(metrics=metrics)
+  return metrics
+
+
+def json_lines_hook(filename):
+  lock = Lock()
+
+  def hook(metrics):
+    with lock, open(filename, 'a') as json_lines:
+      json_lines.write('{record}\n'.format(record=dumps(metrics.record)))
+
+  return hook
+
+
+def prometheus_textfile_hook(filename):
+  lock = Lock()
+  records = {}
+
+  def hook(metrics):
+    with lock:
+      records[metrics.device] = metrics.record
+      written_atomically(filename=filename, content=prometheus_text(records=records.values()))
+
+  return hook
+
+
+def written_atomically(filename, content):
+  temporary_filename = '{filename}.tmp'.format(filename=filename)
+  with open(temporary_filename, 'w') as temporary_file:
+    temporary_file.write(content)
+  replace(temporary_filename, filename)
+  return filename
+
+
+def prometheus_label(value):
+  return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(records):
+  records = list(records)
+  return ''.join([
+    '# HELP tasiap_backup_phase_duration_seconds Duration of each phase of the last backup of the device.\n',
+    '# TYPE tasiap_backup_phase_duration_seconds gauge\n',
+    *[
+      'tasiap_backup_phase_duration_seconds{{device="{device}",phase="{phase}"}} {seconds}\n'.format(
+        device=prometheus_label(value=record['device']),
+        phase=prometheus_label(value=phase),
+        seconds=seconds
+      ) for record in records for phase, seconds in record['phases'].items()
+    ],
+    '# HELP tasiap_backup_transferred_bytes Bytes downloaded on the last backup of the device.\n',
+    '# TYPE tasiap_backup_transferred_bytes gauge\n',
+    *[
+      'tasiap_backup_transferred_bytes{{device="{device}"}} {size}\n'.format(
+        device=prometheus_label(value=record['device']),
+        size=record['bytes_transferred']
+      ) for record in records
+    ],
+    '# HELP tasiap_backup_polls Remote file polls made on the last backup of the device.\n',
+    '# TYPE tasiap_backup_polls gauge\n',
+    *[
+      'tasiap_backup_polls{{device="{device}"}} {polls}\n'.format(
+        device=prometheus_label(value=record['device']),
+        polls=record['polls']
+      ) for record in records
+    ],
+    '# HELP tasiap_backup_reclaimed_bytes Bytes of local backups deleted by the retention on the last backup.\n',
+    '# TYPE tasiap_backup_reclaimed_bytes gauge\n',
+    *[
+      'tasiap_backup_reclaimed_bytes{{device="{device}"}} {size}\n'.format(
+        device=prometheus_label(value=record['device']),
+        size=record['reclaimed_bytes']
+      ) for record in records
+    ],
+    '# HELP tasiap_backup_swept_bytes Bytes of stale remote files deleted from the device on the last backup.\n',
+    '# TYPE tasiap_backup_swept_bytes gauge\n',
+    *[
+      'tasiap_backup_swept_bytes{{device="{device}"}} {size}\n'.format(
+        device=prometheus_label(value=record['device']),
+        size=record['swept_bytes']
+      ) for record in records
+    ],
+    '# HELP tasiap_backup_failed Whether the last backup of the device failed.\n',
+    '# TYPE tasiap_backup_failed gauge\n',
+    *[
+      'tasiap_backup_failed{{device="{device}"}} {failed}\n'.format(
+        device=prometheus_label(value=record['device']),
+        failed=int(record['error'] is not None)
+      ) for record in records
+    ]
+  ])
@@ -1,8 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from itertools import chain, groupby
 from pathlib import PurePath
 from re import findall, match
 
-from backup.ssh_client import localpath, open_ssh_session, open_sftp
+from backup.cpu_stage import finished_results, open_cpu_stage, resolved_files
+from backup.encryption import encryption_key, local_filename
+from backup.metrics import DeviceMetrics, TransferProgress, reported_metrics
+from backup.retention import device_retention
+from backup.retry import retried_phase
+from backup.scheduler import in_original_order
+from backup.ssh_client import open_ssh_session, open_sftp_channels, shared_client_options, unlinked
+from backup.storage import FilesystemStorage, open_storage, unsupported_features
+from backup.transfer import retrieved
 
 
 class BackupFile:
@@ -53,29 +63,36 @@ class BackupFile:
     return None
 
 
-def are_not_corrupted(backup_files):
-  if backup_files:
-    return (
-      not is_corrupted(backup_file=backup_files.pop(), backup_files=backup_files.copy())
-      and are_not_corrupted(backup_files=backup_files)
+def creation_of(backup_file):
+  return backup_file.creation
+
+
+def with_largest_older_size(backup_files):
+  largest_older_size = 0
+  for _, backup_files_created_together in groupby(sorted(backup_files, key=creation_of), key=creation_of):
+    backup_files_created_together = list(backup_files_created_together)
+    for backup_file in backup_files_created_together:
+      yield backup_file, largest_older_size
+    largest_older_size = max(
+      largest_older_size,
+      *[backup_file.size for backup_file in backup_files_created_together]
     )
 
-  return True
 
+def are_not_corrupted(backup_files):
+  return not any(
+    is_corrupted(backup_file=backup_file, backup_files=[]) for backup_file in backup_files
+  ) and not any(
+    backup_file.size < largest_older_size
+    for backup_file, largest_older_size in with_largest_older_size(backup_files=backup_files)
+  )
 
-def is_smaller_than_older(backup_file, backup_files):
-  if backup_files:
-    return (
-      (
-        backup_file.is_newer_than(
-          other=(other_backup_file := backup_files.pop())
-        )
-        and backup_file.is_smaller_than(other=other_backup_file)
-      )
-      or is_smaller_than_older(backup_file=backup_file, backup_files=backup_files)
-    )
 
-  return False
+def is_smaller_than_older(backup_file, backup_files):
+  return any(
+    backup_file.is_newer_than(other=other_backup_file) and backup_file.is_smaller_than(other=other_backup_file)
+    for other_backup_file in backup_files
+  )
 
 
 def is_corrupted(backup_file, backup_files):
@@ -87,18 +104,11 @@ def is_corrupted(backup_file, backup_files):
 
 
 def newest_backup(backup_files):
-  return sorted(
-    backup_files,
-    key=lambda backup_file: backup_file.creation,
-    reverse=True
-  )[0] if backup_files else None
+  return max(backup_files, key=creation_of) if backup_files else None
 
 
 def disposable_backups(backup_files, keeping_quantity):
-  return sorted(
-    backup_files,
-    key=lambda backup_file: backup_file.creation
-  )[:len(backup_files) - keeping_quantity]
+  return sorted(backup_files, key=creation_of)[:len(backup_files) - keeping_quantity]
 
 
 def backup_files_found(sftp_attributes_from_files):
@@ -117,8 +127,21 @@ def is_valid_backup_filename(filename):
   return match(string=filename, pattern=r'backup.+\.+')
 
 
-def retrieved_file(current_remotepath, current_localpath, sftp):
-  sftp.get(remotepath=current_remotepath.as_posix(), localpath=current_localpath)
+def retrieved_file(current_remotepath, current_localpath, sftp, metrics, retry_policy, key=None, storage=None):
+  retried_phase(
+    operation=lambda: retrieved(
+      sftp=sftp,
+      remotepath=current_remotepath.as_posix(),
+      localpath=current_localpath,
+      callback=TransferProgress(metrics=metrics),
+      buckets=None,
+      key=key,
+      storage=storage
+    ),
+    retry_policy=retry_policy,
+    phase='download',
+    metrics=metrics
+  )
   return current_localpath
 
 
@@ -141,58 +164,227 @@ def labeled_backups(backup_files, keeping_quantity):
   }
 
 
-def deleted_remote_backup_files(remote_directory, backup_files, sftp):
+def deleted_remote_backup_files(remote_directory, backup_files, sftp, metrics, retry_policy):
   return [
     deleted_remote_file(
       file_remotepath=remotepath(
         remote_directory=remote_directory,
         filename=backup_file.filename),
-      sftp=sftp
+      sftp=sftp,
+      metrics=metrics,
+      retry_policy=retry_policy
     ) for backup_file in backup_files
   ]
 
 
-def deleted_remote_file(file_remotepath, sftp):
-  sftp.unlink(path=file_remotepath.as_posix())
+def deleted_remote_file(file_remotepath, sftp, metrics, retry_policy):
+  retried_phase(
+    operation=lambda: unlinked(sftp=sftp, path=file_remotepath.as_posix()),
+    retry_policy=retry_policy,
+    phase='delete',
+    metrics=metrics
+  )
   return file_remotepath
 
 
-def retrieved_and_deleted_backups(current_labeled_backups, backup_settings, sftp):
+def retrieved_and_deleted_backups(current_labeled_backups, backup_settings, sftp, metrics, storage=None):
+  key = encryption_key(encryption=backup_settings.get('encryption'))
   return {
     'retrieved_backup': retrieved_file(
       current_remotepath=remotepath(
         remote_directory=backup_settings['remote_backups_directory'],
         filename=current_labeled_backups['newest_backup'].filename
       ),
-      current_localpath=localpath(
-        backups_directory=backup_settings['local_backups_directory'],
-        filename=current_labeled_backups['newest_backup'].filename
+      current_localpath=(storage or FilesystemStorage()).location(
+        directory=backup_settings['local_backups_directory'],
+        filename=local_filename(filename=current_labeled_backups['newest_backup'].filename, key=key)
       ),
-      sftp=sftp
+      sftp=sftp,
+      metrics=metrics,
+      retry_policy=backup_settings.get('retry_policy', {}),
+      key=key,
+      storage=storage
     ),
     'deleted_backups': deleted_remote_backup_files(
       remote_directory=backup_settings['remote_backups_directory'],
       backup_files=current_labeled_backups['disposable_backups'],
-      sftp=sftp
+      sftp=sftp,
+      metrics=metrics,
+      retry_policy=backup_settings.get('retry_policy', {})
     )
   }
 
 
-def myauth_backup(myauth, ssh_client_options):
+def listed_backup_files(remote_directory, sftp, metrics, retry_policy):
+  return backup_files_found(sftp_attributes_from_files=retried_phase(
+    operation=lambda: sftp.listdir_attr(path=remote_directory),
+    retry_policy=retry_policy,
+    phase='list',
+    metrics=metrics
+  ))
+
+
+def retrieved_myauth_backups(myauth, ssh_client_options, metrics, cpu_stage=None, storage=None):
   with open_ssh_session(
     client_options=ssh_client_options,
-    credentials=myauth['credentials']
-  ) as ssh:
-    with open_sftp(ssh=ssh) as sftp:
-      return retrieved_and_deleted_backups(
-        current_labeled_backups=labeled_backups(
-          backup_files=backup_files_found(
-            sftp_attributes_from_files=sftp.listdir_attr(
-              path=myauth['backup_settings']['remote_backups_directory']
-            )
-          ),
-          keeping_quantity=myauth['backup_settings']['keeping_backups_quantity']
+    credentials=myauth['credentials'],
+    metrics=metrics
+  ) as ssh, open_sftp_channels(ssh=ssh) as channels:
+    current_backups = retrieved_and_deleted_backups(
+      current_labeled_backups=labeled_backups(
+        backup_files=listed_backup_files(
+          remote_directory=myauth['backup_settings']['remote_backups_directory'],
+          sftp=channels.sftp,
+          metrics=metrics,
+          retry_policy=myauth['backup_settings'].get('retry_policy', {})
         ),
-        backup_settings=myauth['backup_settings'],
-        sftp=sftp
+        keeping_quantity=myauth['backup_settings']['keeping_backups_quantity']
+      ),
+      backup_settings=myauth['backup_settings'],
+      sftp=channels.sftp,
+      metrics=metrics,
+      storage=storage
+    )
+  if cpu_stage:
+    with metrics.phase(name='process'):
+      current_backups = {
+        **current_backups,
+        'retrieved_backup': cpu_stage.pending_files(localpaths=[current_backups['retrieved_backup']])[0]
+      }
+  return current_backups
+
+
+def finished_myauth_backups(myauth, current_backups, metrics):
+  current_backups = {
+    **current_backups,
+    'retrieved_backup': resolved_files(files=[current_backups['retrieved_backup']])[0]
+  }
+  if 'retention' in myauth['backup_settings']:
+    device_retention(
+      retention=myauth['backup_settings']['retention'],
+      device_id=myauth['credentials']['hostname'],
+      filenames=[current_backups['retrieved_backup']],
+      metrics=metrics
+    )
+  return current_backups
+
+
+def myauth_backup(myauth, ssh_client_options, hooks=(), cpu_stage=None, storage=None):
+  metrics = DeviceMetrics(device=myauth['credentials']['hostname'])
+  current_backups = finished_myauth_backups(
+    myauth=myauth,
+    current_backups=retrieved_myauth_backups(
+      myauth=myauth,
+      ssh_client_options=ssh_client_options,
+      metrics=metrics,
+      cpu_stage=cpu_stage,
+      storage=storage
+    ),
+    metrics=metrics
+  )
+  reported_metrics(metrics=metrics, hooks=hooks)
+  return current_backups
+
+
+def started_myauth_backup(myauth, ssh_client_options, hooks, cpu_stage=None, storage=None):
+  unfinished = {
+    'myauth': myauth,
+    'hooks': hooks,
+    'metrics': DeviceMetrics(device=myauth['credentials']['hostname']),
+    'backups': None,
+    'files': [],
+    'error': None
+  }
+  try:
+    unfinished['backups'] = retrieved_myauth_backups(
+      myauth=myauth,
+      ssh_client_options=ssh_client_options,
+      metrics=unfinished['metrics'],
+      cpu_stage=cpu_stage,
+      storage=storage
+    )
+    unfinished['files'] = [unfinished['backups']['retrieved_backup']]  # may be still on the cpu stage
+  except Exception as error:
+    unfinished['error'] = error
+  return unfinished
+
+
+def myauth_backup_result(unfinished):
+  metrics = unfinished['metrics']
+  result = {'hostname': unfinished['myauth']['credentials']['hostname'], 'backups': None, 'error': unfinished['error']}
+  if not result['error']:
+    try:
+      result['backups'] = finished_myauth_backups(
+        myauth=unfinished['myauth'],
+        current_backups=unfinished['backups'],
+        metrics=metrics
       )
+    except Exception as error:
+      result['error'] = error
+  if result['error']:
+    metrics.failed(error=result['error'])
+  reported_metrics(metrics=metrics, hooks=unfinished['hooks'])
+  return result
+
+
+def iterated_myauths_backups(
+  myauths,
+  ssh_client_options,
+  max_workers=4,
+  hooks=(),
+  cpu_stage_options=None,
+  durability_options=None,
+  storage_options=None
+):
+  unsupported = unsupported_features(
+    storage_options=storage_options,
+    options=chain(
+      (option for myauth in myauths for option in myauth['backup_settings']),
+      ['cpu_stage'] if cpu_stage_options else []
+    )
+  )
+  if unsupported:
+    raise ValueError('{features} need the filesystem storage'.format(features=', '.join(unsupported)))
+  current_client_options = shared_client_options(client_options=ssh_client_options)
+  with open_cpu_stage(cpu_stage_options=cpu_stage_options) as cpu_stage, open_storage(
+    storage_options=storage_options,
+    durability_options=durability_options
+  ) as storage, ThreadPoolExecutor(max_workers=max_workers) as executor:
+    futures = {
+      executor.submit(
+        started_myauth_backup,
+        myauth=myauth,
+        ssh_client_options=current_client_options,
+        hooks=hooks,
+        cpu_stage=cpu_stage,
+        storage=storage
+      ): index for index, myauth in enumerate(myauths)
+    }
+    yield from finished_results(
+      unfinished_results=((futures.pop(future), future.result()) for future in as_completed(futures)),
+      finished=myauth_backup_result
+    )
+
+
+def myauths_backups(
+  myauths,
+  ssh_client_options,
+  max_workers=4,
+  hooks=(),
+  cpu_stage_options=None,
+  durability_options=None,
+  storage_options=None
+):
+  indexed_results = list(iterated_myauths_backups(
+    myauths=myauths,
+    ssh_client_options=ssh_client_options,
+    max_workers=max_workers,
+    hooks=hooks,
+    cpu_stage_options=cpu_stage_options,
+    durability_options=durability_options,
+    storage_options=storage_options
+  ))
+  return in_original_order(
+    results=[result for _, result in indexed_results],
+    order=[index for index, _ in indexed_results]
+  )
@@ -0,0 +1,124 @@
+from contextlib import closing
+from datetime import datetime
+from os import path, remove
+from sqlite3 import connect
+
+from backup.cpu_stage import sidecar_filename
+from backup.encryption import encrypted_extension
+
+schema = '''
+  CREATE TABLE IF NOT EXISTS files (
+    filename TEXT PRIMARY KEY, device TEXT NOT NULL, kind TEXT NOT NULL, created TEXT NOT NULL, size INTEGER NOT NULL
+  );
+  CREATE INDEX IF NOT EXISTS files_by_device ON files (device, kind, created);
+'''
+
+period_keys = {
+  'daily': lambda created: created.date(),
+  'weekly': lambda created: created.isocalendar()[:2],
+  'monthly': lambda created: (created.year, created.month),
+  'yearly': lambda created: created.year
+}
+
+
+def connected_catalogue(filename):
+  connection = connect(filename, timeout=60)  # other threads may be cataloguing their files
+  connection.executescript(schema)
+  return connection
+
+
+def file_kind(filename):
+  plain_filename, extension = path.splitext(filename)
+  if extension == encrypted_extension:  # an encrypted file is rotated with the plain ones of its kind
+    return path.splitext(plain_filename)[1]
+  return extension
+
+
+def catalogued_files(connection, device_id, filenames, created):
+  with connection:
+    connection.executemany(
+      'INSERT OR REPLACE INTO files (filename, device, kind, created, size) VALUES (?, ?, ?, ?, ?)',
+      [
+        (str(filename), device_id, file_kind(filename=str(filename)), created.isoformat(), path.getsize(filename))
+        for filename in filenames
+      ]
+    )
+  return filenames
+
+
+def kept_files(files, policy):
+  kept = set()
+  for period, quantity in policy.items():
+    periods = set()
+    for filename, created in sorted(files, key=lambda file: file[1], reverse=True):  # the newest of each period
+      key = period_keys[period](datetime.fromisoformat(created))
+      if key not in periods and len(periods) < quantity:
+        periods.add(key)
+        kept.add(filename)
+  return kept
+
+
+def disposable_files(connection, device_id, policy):
+  files_by_kind = {}
+  for kind, filename, created, size in connection.execute(
+    'SELECT kind, filename, created, size FROM files WHERE device = ?',
+    (device_id,)
+  ):
+    files_by_kind.setdefault(kind, []).append((filename, created, size))
+
+  disposable = []
+  for files in files_by_kind.values():
+    kept = kept_files(files=[(filename, created) for filename, created, _ in files], policy=policy)
+    disposable.extend((filename, size) for filename, _, size in files if filename not in kept)
+  return disposable
+
+
+def deleted_file(filename):
+  try:
+    remove(filename)
+  except FileNotFoundError:  # already gone, only the catalogue is behind
+    return False
+  return True
+
+
+def deleted_sidecar(filename):
+  sidecar = sidecar_filename(localpath=filename)  # written next to the file by the cpu stage, never catalogued
+  try:
+    size = path.getsize(sidecar)
+    remove(sidecar)
+  except FileNotFoundError:  # the file was not processed with a checksum
+    return 0
+  return size
+
+
+def pruned_files(connection, files, batch_size=100):
+  report = {'deleted_files': 0, 'reclaimed_bytes': 0}
+  for start in range(0, len(files), batch_size):
+    batch = files[start:start + batch_size]
+    for filename, size in batch:
+      if deleted_file(filename=filename):
+        report['deleted_files'] += 1
+        report['reclaimed_bytes'] += size
+      report['reclaimed_bytes'] += deleted_sidecar(filename=filename)
+    with connection:
+      connection.executemany('DELETE FROM files WHERE filename = ?', [(filename,) for filename, _ in batch])
+  return report
+
+
+def device_retention(retention, device_id, filenames, metrics):
+  with metrics.phase(name='retention'), closing(
+    connected_catalogue(filename=retention['catalogue_filename'])
+  ) as connection:
+    catalogued_files(
+      connection=connection,
+      device_id=device_id,
+      filenames=[filename for filename in filenames if filename],
+      created=datetime.now()
+    )
+    report = pruned_files(
+      connection=connection,
+      files=disposable_files(connection=connection, device_id=device_id, policy=retention['policy']),
+      batch_size=retention.get('batch_size', 100)
+    )
+  metrics.reclaimed(size=report['reclaimed_bytes'])
+  return report
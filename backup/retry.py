@@ -0,0 +1,56 @@
+from errno import EAGAIN, EBUSY
+from time import sleep
+
+from paramiko import AuthenticationException, BadHostKeyException, SSHException
+
+idempotent_phases = {
+  'connect': True,
+  'auth': True,
+  'list': True,
+  'download': True,  # the local file is written again from the start
+  'delete': True,  # a file already deleted counts as deleted
+  'generate': False  # would leave the file of the failed attempt on the device
+}
+retryable_kinds = {'network', 'remote_busy'}
+
+
+def error_kind(error):
+  if isinstance(error, (AuthenticationException, BadHostKeyException)):
+    return 'auth'
+  if isinstance(error, (FileNotFoundError, PermissionError)):
+    return 'other'
+  if isinstance(error, OSError) and (
+    error.errno in (EAGAIN, EBUSY) or str(error) == 'Failure'  # the generic sftp failure status
+  ):
+    return 'remote_busy'
+  if isinstance(error, (SSHException, EOFError, OSError)):
+    return 'network'
+  return 'other'
+
+
+def backoff_seconds(retry_policy, attempt):
+  return min(
+    retry_policy.get('maximum_backoff_seconds', 30),
+    retry_policy.get('backoff_seconds', 1) * retry_policy.get('backoff_factor', 2) ** attempt
+  )
+
+
+def retried(operation, retry_policy, phase):
+  attempt = 0
+  while True:
+    try:
+      return operation()
+    except Exception as error:
+      if (
+        not idempotent_phases.get(phase)
+        or error_kind(error=error) not in retryable_kinds
+        or attempt + 1 >= retry_policy.get('attempts', 1)
+      ):
+        raise
+      sleep(backoff_seconds(retry_policy=retry_policy, attempt=attempt))
+      attempt += 1
+
+
+def retried_phase(operation, retry_policy, phase, metrics):
+  with metrics.phase(name=phase):
+    return retried(operation=operation, retry_policy=retry_policy, phase=phase)
@@ -1,7 +1,35 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import closing
 from datetime import datetime, timedelta
+from functools import partial
+from itertools import chain
+from os import remove
 from pathlib import PurePath
-
-from backup.ssh_client import open_ssh_session, localpath
+from re import IGNORECASE, MULTILINE, compile
+
+from backup.checkpoint import CheckpointJournal, reclaimed_leftovers
+from backup.change_detection import export_fingerprint, fingerprint_filename, saved_fingerprint, unchanged_backup
+from backup.concurrency import AdaptiveConcurrency, disk_write_latency
+from backup.cpu_stage import CPUStage, finished_results, resolved_files
+from backup.encryption import encryption_key, local_filename
+from backup.export_index import encrypted_indexes, routerboard_export_indexed
+from backup.export_store import device_store, routerboard_export_stored, version_filename
+from backup.metrics import DeviceMetrics, TransferProgress, reported_metrics
+from backup.retention import device_retention
+from backup.retry import retried_phase
+from backup.scheduler import acquired_site_slot, historical_durations, historical_throughputs, in_original_order, \
+  released_site_slot, scheduled_order, site_slots
+from backup.ssh_client import RemoteCommandError, completed_command, open_sftp_channels, open_ssh_session, \
+  shared_client_options, unlinked
+from backup.storage import FilesystemStorage, storage_backend, unsupported_features
+from backup.sweeper import swept_remote_files
+from backup.transfer import bandwidth_buckets, retrieved, site_buckets
+
+
+routeros_error = compile(
+  pattern=r'^(failure:|.*\b(bad password|not enough space|syntax error|expected end of command|bad command name)\b)',
+  flags=IGNORECASE | MULTILINE
+)
 
 
 class RemotePath:
@@ -51,74 +79,263 @@ def export_command(device_id):
   }
 
 
-def generate_backup(device_id, backup_password, ssh):
-  current_backup_command = backup_command(device_id=device_id, backup_password=backup_password)
-  ssh.exec_command(command=current_backup_command['command'])
-  return current_backup_command['filename']
+def command_timeout(backup_options):
+  return backup_options.get('command_timeout_seconds', backup_options['assertion_options']['seconds_to_timeout'])
 
 
-def generate_export_script(device_id, ssh):
-  current_export_command = export_command(device_id=device_id)
-  ssh.exec_command(command=current_export_command['command'])
-  return current_export_command['filename']
+def executed_command(device_id, generation_command, ssh, seconds_to_timeout):
+  result = completed_command(ssh=ssh, command=generation_command['command'], seconds_to_timeout=seconds_to_timeout)
+  if result['exit_status'] or routeros_error.search(result['output']):
+    raise RemoteCommandError(str(  # the command is left out, it may carry the backup password
+      'The routerboard {device_id} failed to generate {filename} (exit status {exit_status}): {output}'
+    ).format(
+      device_id=device_id,
+      filename=generation_command['filename'],
+      exit_status=result['exit_status'],
+      output=result['output'].strip()
+    ))
+  return generation_command['filename']
 
 
-def retrieve_file(filename, backup_options, sftp):
-  current_localpath = localpath(
-    filename=filename,
-    backups_directory=backup_options['backups_directory']
+def generate_backup(device_id, backup_password, ssh, seconds_to_timeout):
+  return executed_command(
+    device_id=device_id,
+    generation_command=backup_command(device_id=device_id, backup_password=backup_password),
+    ssh=ssh,
+    seconds_to_timeout=seconds_to_timeout
+  )
+
+
+def generate_export_script(device_id, ssh, seconds_to_timeout):
+  return executed_command(
+    device_id=device_id,
+    generation_command=export_command(device_id=device_id),
+    ssh=ssh,
+    seconds_to_timeout=seconds_to_timeout
+  )
+
+
+def retrieve_file(filename, backup_options, sftp, metrics, buckets, storage=None):
+  key = encryption_key(encryption=backup_options.get('encryption'))
+  current_localpath = (storage or FilesystemStorage()).location(
+    directory=backup_options['backups_directory'],
+    filename=local_filename(filename=filename, key=key)
   )
   remotepath = RemotePath(path=filename)
-  if remote_file_is_ready_to_be_retrieved(
-          assertion_options=backup_options['assertion_options'],
-          remotepath=remotepath,
-          sftp=sftp
-  ):
-    sftp.get(remotepath=remotepath.without_root, localpath=str(current_localpath))
-    sftp.unlink(path=remotepath.without_root)
+  with metrics.phase(name='wait'):
+    is_ready = remote_file_is_ready_to_be_retrieved(
+      assertion_options=backup_options['assertion_options'],
+      remotepath=remotepath,
+      sftp=sftp,
+      metrics=metrics
+    )
+  if is_ready:
+    retry_policy = backup_options.get('retry_policy', {})
+    retried_phase(
+      operation=lambda: retrieved(
+        sftp=sftp,
+        remotepath=remotepath.without_root,
+        localpath=str(current_localpath),
+        callback=TransferProgress(metrics=metrics),
+        buckets=buckets,
+        key=key,
+        storage=storage
+      ),
+      retry_policy=retry_policy,
+      phase='download',
+      metrics=metrics
+    )
+    retried_phase(
+      operation=lambda: unlinked(sftp=sftp, path=remotepath.without_root),
+      retry_policy=retry_policy,
+      phase='delete',
+      metrics=metrics
+    )
     return current_localpath
   return None
 
 
-def remote_file_is_ready_to_be_retrieved(assertion_options, remotepath, sftp):
+def remote_file_is_ready_to_be_retrieved(assertion_options, remotepath, sftp, metrics):
   return assertion_on_remote_file(
     evaluation_params={
       'evaluation_function': remote_file_exists,
       'assertion_options': assertion_options
     },
     remotepath=remotepath,
-    sftp=sftp
+    sftp=sftp,
+    metrics=metrics
   ) and assertion_on_remote_file(
     evaluation_params={
       'evaluation_function': remote_file_size_is_greater_than,
       'assertion_options': assertion_options
     },
     remotepath=remotepath,
-    sftp=sftp
+    sftp=sftp,
+    metrics=metrics
   )
 
 
-def retrieve_backup_files(filenames, backup_options, sftp):
+def retrieve_backup_files(filenames, backup_options, sftp, metrics, buckets, storage=None):
   return [retrieve_file(
     filename=filename,
     backup_options=backup_options,
-    sftp=sftp
+    sftp=sftp,
+    metrics=metrics,
+    buckets=buckets,
+    storage=storage
   ) for filename in filenames]
 
 
-def backup(routerboard, ssh):
-  return retrieve_backup_files(
-    filenames=[
+def generated_files(routerboard, ssh, metrics):
+  seconds_to_timeout = command_timeout(backup_options=routerboard['backup_options'])
+  with metrics.phase(name='generate'):
+    return [
       generate_backup(
         device_id=routerboard['name'],
         backup_password=routerboard['backup_password'],
-        ssh=ssh
+        ssh=ssh,
+        seconds_to_timeout=seconds_to_timeout
       ),
-      generate_export_script(device_id=routerboard['name'], ssh=ssh)
-    ],
-    backup_options=routerboard['backup_options'],
-    sftp=ssh.open_sftp()
+      generate_export_script(device_id=routerboard['name'], ssh=ssh, seconds_to_timeout=seconds_to_timeout)
+    ]
+
+
+def changed_configuration_backup(routerboard, ssh, sftp, metrics, buckets, storage=None):
+  backup_options = routerboard['backup_options']
+  seconds_to_timeout = command_timeout(backup_options=backup_options)
+  with metrics.phase(name='generate'):
+    script = generate_export_script(device_id=routerboard['name'], ssh=ssh, seconds_to_timeout=seconds_to_timeout)
+  script_localpath = retrieve_file(
+    filename=script,
+    backup_options=backup_options,
+    sftp=sftp,
+    metrics=metrics,
+    buckets=buckets,
+    storage=storage
+  )
+  fingerprint = script_localpath and export_fingerprint(
+    filename=script_localpath,
+    key=encryption_key(encryption=backup_options.get('encryption'))
+  )
+  current_fingerprint_filename = fingerprint_filename(
+    device_id=routerboard['name'],
+    backups_directory=backup_options['backups_directory']
+  )
+  last_backup = unchanged_backup(
+    filename=current_fingerprint_filename,
+    fingerprint=fingerprint,
+    maximum_age_seconds=backup_options.get('maximum_unchanged_age_seconds', 604800)
+  )
+  if last_backup:
+    return [last_backup, script_localpath]
+
+  with metrics.phase(name='generate'):
+    backup_file = generate_backup(
+      device_id=routerboard['name'],
+      backup_password=routerboard['backup_password'],
+      ssh=ssh,
+      seconds_to_timeout=seconds_to_timeout
+    )
+  backup_localpath = retrieve_file(
+    filename=backup_file,
+    backup_options=backup_options,
+    sftp=sftp,
+    metrics=metrics,
+    buckets=buckets,
+    storage=storage
+  )
+  if backup_localpath and fingerprint:
+    saved_fingerprint(
+      filename=current_fingerprint_filename,
+      fingerprint=fingerprint,
+      backup_localpath=backup_localpath
+    )
+  return [backup_localpath, script_localpath]
+
+
+def with_indexed_export(routerboard, backup_files, metrics):
+  if 'export_index' in routerboard['backup_options'] and backup_files[1]:
+    with metrics.phase(name='index'):
+      routerboard_export_indexed(routerboard=routerboard, script_localpath=backup_files[1])
+  return backup_files
+
+
+def with_processed_files(routerboard, backup_files, metrics, cpu_stage):
+  if not cpu_stage:
+    return backup_files
+  with metrics.phase(name='process'):
+    if 'export_store' in routerboard['backup_options']:  # the export is stored from the plain file
+      return cpu_stage.pending_files(localpaths=backup_files[:1]) + backup_files[1:]
+    return cpu_stage.pending_files(localpaths=backup_files)
+
+
+def with_local_retention(routerboard, backup_files, metrics):
+  if 'retention' in routerboard['backup_options']:
+    device_retention(
+      retention=routerboard['backup_options']['retention'],
+      device_id=routerboard['name'],
+      filenames=backup_files,
+      metrics=metrics
+    )
+  return backup_files
+
+
+def with_stored_export(routerboard, backup_files, metrics):
+  backup_localpath, script_localpath = backup_files
+  export_store = routerboard['backup_options'].get('export_store')
+  if not export_store or not script_localpath:
+    return backup_files
+  with metrics.phase(name='store'):
+    entry = routerboard_export_stored(routerboard=routerboard, script_localpath=script_localpath)
+    if not export_store.get('remove_plain_exports'):
+      return backup_files
+    remove(script_localpath)
+  return [backup_localpath, version_filename(
+    store=device_store(directory=export_store['directory'], device_id=routerboard['name']),
+    entry=entry
+  )]
+
+
+def backup(routerboard, ssh, sftp, metrics, buckets, cpu_stage=None, storage=None):
+  if routerboard['backup_options'].get('skip_unchanged_backups'):
+    backup_files = changed_configuration_backup(
+      routerboard=routerboard,
+      ssh=ssh,
+      sftp=sftp,
+      metrics=metrics,
+      buckets=buckets,
+      storage=storage
+    )
+  else:
+    backup_files = retrieve_backup_files(
+      filenames=generated_files(routerboard=routerboard, ssh=ssh, metrics=metrics),
+      backup_options=routerboard['backup_options'],
+      sftp=sftp,
+      metrics=metrics,
+      buckets=buckets,
+      storage=storage
+    )
+  return with_processed_files(
+    routerboard=routerboard,
+    backup_files=with_indexed_export(routerboard=routerboard, backup_files=backup_files, metrics=metrics),
+    metrics=metrics,
+    cpu_stage=cpu_stage
+  )
+
+
+def finished_backup(routerboard, backup_files, journal, metrics):
+  current_backup = with_stored_export(
+    routerboard=routerboard,
+    backup_files=with_local_retention(
+      routerboard=routerboard,
+      backup_files=resolved_files(files=backup_files),
+      metrics=metrics
+    ),
+    metrics=metrics
   )
+  if journal:
+    journal.finished(device=routerboard['name'], localpaths=current_backup)
+  return current_backup
 
 
 def remote_file_exists(assertion_options, remotepath, sftp):
@@ -133,13 +350,23 @@ def timeout(start_time, seconds):
   return datetime.now() >= start_time + timedelta(seconds=seconds)
 
 
-def assertion_on_remote_file(evaluation_params, remotepath, sftp):
+def polled_evaluation(evaluation_params, remotepath, sftp, metrics):
+  metrics.polled()
+  return evaluation_params['evaluation_function'](
+    assertion_options=evaluation_params['assertion_options'],
+    remotepath=remotepath,
+    sftp=sftp
+  )
+
+
+def assertion_on_remote_file(evaluation_params, remotepath, sftp, metrics):
   start_time = datetime.now()
   while (
-          not evaluation_params['evaluation_function'](
-            assertion_options=evaluation_params['assertion_options'],
+          not polled_evaluation(
+            evaluation_params=evaluation_params,
             remotepath=remotepath,
-            sftp=sftp
+            sftp=sftp,
+            metrics=metrics
           ) and
           not timeout(
             start_time=start_time,
@@ -148,10 +375,11 @@ def assertion_on_remote_file(evaluation_params, remotepath, sftp):
   ):
     pass
 
-  return evaluation_params['evaluation_function'](
-    assertion_options=evaluation_params['assertion_options'],
+  return polled_evaluation(
+    evaluation_params=evaluation_params,
     remotepath=remotepath,
-    sftp=sftp
+    sftp=sftp,
+    metrics=metrics
   )
 
 
@@ -161,15 +389,268 @@ def remotepath_without_root(remotepath):
   return '.' if remotepath_str == root else remotepath_str.replace(root, '', 1).replace('\\', '/')
 
 
-def routerboards_backups(routerboards, ssh_client_options):
-  backups = []
-  for routerboard in routerboards:
-    with open_ssh_session(
-      client_options=ssh_client_options,
-      credentials=routerboard['credentials']
-    ) as ssh:
-      backups.append(backup(
+def fleet_storage(routerboards, fleet_options):
+  unsupported = unsupported_features(
+    storage_options=fleet_options.get('storage'),
+    options=chain(fleet_options, (option for routerboard in routerboards for option in routerboard['backup_options']))
+  )
+  if unsupported:
+    raise ValueError('{features} need the filesystem storage'.format(features=', '.join(unsupported)))
+  return storage_backend(
+    storage_options=fleet_options.get('storage'),
+    durability_options=fleet_options.get('durability')
+  )
+
+
+def fleet_run(routerboards, hooks, fleet_options):
+  refused = encrypted_indexes(routerboards=routerboards)
+  if refused:
+    raise ValueError('The export index can not keep the encrypted exports of {devices}'.format(
+      devices=', '.join(refused)
+    ))
+  return {
+    'hooks': hooks,
+    'buckets': bandwidth_buckets(bandwidth_limits=fleet_options.get('bandwidth_limits', {})),
+    'site_slots': site_slots(
+      routerboards=routerboards,
+      max_jobs_per_site=fleet_options.get('schedule', {}).get('max_jobs_per_site')
+    ),
+    'journal': CheckpointJournal(
+      filename=fleet_options['checkpoint']['journal_filename'],
+      max_age_seconds=fleet_options['checkpoint'].get('max_age_seconds', 86400)
+    ) if 'checkpoint' in fleet_options else None,
+    'cpu_stage': CPUStage(**fleet_options['cpu_stage']) if 'cpu_stage' in fleet_options else None,
+    'storage': fleet_storage(routerboards=routerboards, fleet_options=fleet_options)
+  }
+
+
+def adaptive_concurrency(concurrency_options):
+  history_filename = concurrency_options.get('history_filename')
+  return AdaptiveConcurrency(
+    **{name: value for name, value in concurrency_options.items() if name != 'history_filename'},
+    best_throughputs=historical_throughputs(filename=history_filename) if history_filename else None
+  )
+
+
+def routerboards_order(routerboards, fleet_options):
+  if 'schedule' in fleet_options:
+    return scheduled_order(
+      routerboards=routerboards,
+      durations=historical_durations(filename=fleet_options['schedule']['history_filename'])
+    )
+  return list(range(len(routerboards)))
+
+
+def routerboard_backup(routerboard, ssh_client_options, fleet, metrics):
+  journal = fleet.get('journal')
+  if journal:
+    journal.started(device=routerboard['name'])
+  with open_ssh_session(
+    client_options=ssh_client_options,
+    credentials=routerboard['credentials'],
+    metrics=metrics
+  ) as ssh, open_sftp_channels(ssh=ssh) as channels:
+    if journal and routerboard['name'] in journal.interrupted:
+      reclaimed_leftovers(sftp=channels.sftp, device_id=routerboard['name'], metrics=metrics)
+    if 'sweep' in routerboard['backup_options']:
+      swept_remote_files(
+        sftp=channels.sftp,
+        device_id=routerboard['name'],
+        sweep_options=routerboard['backup_options']['sweep'],
+        metrics=metrics
+      )
+    current_backup = backup(
+      routerboard=routerboard,
+      ssh=ssh,
+      sftp=channels.sftp,
+      metrics=metrics,
+      buckets=site_buckets(buckets=fleet['buckets'], site=routerboard.get('site')),
+      cpu_stage=fleet.get('cpu_stage'),
+      storage=fleet.get('storage')
+    )
+  return current_backup
+
+
+def started_routerboard_backup(routerboard, ssh_client_options, fleet):
+  unfinished = {
+    'routerboard': routerboard,
+    'fleet': fleet,
+    'metrics': DeviceMetrics(device=routerboard['name']),
+    'files': [],
+    'error': None
+  }
+  try:
+    unfinished['files'] = routerboard_backup(  # may be still on the cpu stage
+      routerboard=routerboard,
+      ssh_client_options=ssh_client_options,
+      fleet=fleet,
+      metrics=unfinished['metrics']
+    )
+  except Exception as error:  # the rest of the fleet is still backed up
+    unfinished['error'] = error
+  return unfinished
+
+
+def routerboard_backup_result(unfinished):
+  routerboard, fleet, metrics = unfinished['routerboard'], unfinished['fleet'], unfinished['metrics']
+  result = {'name': routerboard['name'], 'backups': None, 'error': unfinished['error']}
+  if not result['error']:
+    try:
+      result['backups'] = finished_backup(
         routerboard=routerboard,
-        ssh=ssh
-      ))
-  return backups
+        backup_files=unfinished['files'],
+        journal=fleet.get('journal'),
+        metrics=metrics
+      )
+    except Exception as error:
+      result['error'] = error
+  if result['error']:
+    metrics.failed(error=result['error'])
+  reported_metrics(metrics=metrics, hooks=fleet['hooks'])
+  return result
+
+
+def adaptive_routerboard_backup(routerboard, ssh_client_options, fleet, concurrency):
+  with concurrency.slot() as epoch:
+    return started_routerboard_backup(
+      routerboard=routerboard,
+      ssh_client_options=ssh_client_options,
+      fleet={
+        **fleet,
+        'hooks': [*fleet['hooks'], lambda metrics: concurrency.observed(
+          epoch=epoch,
+          failed=metrics.error is not None,
+          device=metrics.device,
+          throughput=metrics.throughput,
+          disk_write_latency=disk_write_latency(directory=routerboard['backup_options']['backups_directory'])
+        )]
+      }
+    )
+
+
+def dispatched_routerboards(executor, held_back, routerboards, ssh_client_options, fleet, concurrency):
+  futures = {}
+  for index in list(held_back):  # in the order scheduled
+    if acquired_site_slot(slots=fleet['site_slots'], site=routerboards[index].get('site')):
+      held_back.remove(index)
+      futures[executor.submit(
+        adaptive_routerboard_backup,
+        routerboard=routerboards[index],
+        ssh_client_options=ssh_client_options,
+        fleet=fleet,
+        concurrency=concurrency
+      )] = index
+  return futures
+
+
+def adaptive_routerboards_backups(routerboards, ssh_client_options, fleet, concurrency):
+  held_back = list(range(len(routerboards)))  # until their site has a free slot, so no worker waits for one
+  with ThreadPoolExecutor(max_workers=concurrency.ceiling) as executor:
+    dispatch = partial(
+      dispatched_routerboards,
+      executor=executor,
+      held_back=held_back,
+      routerboards=routerboards,
+      ssh_client_options=ssh_client_options,
+      fleet=fleet,
+      concurrency=concurrency
+    )
+    futures = dispatch()
+    while futures:
+      finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+      for future in finished:
+        released_site_slot(slots=fleet['site_slots'], site=routerboards[futures[future]].get('site'))
+      futures.update(dispatch())  # the routerboards held back for the sites freed start before the yields
+      for future in finished:
+        yield futures.pop(future), future.result()  # not kept after it is yielded
+
+
+def sequential_routerboards_backups(routerboards, ssh_client_options, fleet):
+  for index, routerboard in enumerate(routerboards):
+    yield index, started_routerboard_backup(
+      routerboard=routerboard,
+      ssh_client_options=ssh_client_options,
+      fleet=fleet
+    )
+
+
+def iterated_routerboards_results(routerboards, ssh_client_options, hooks=(), fleet_options=None):
+  fleet_options = fleet_options or {}
+  fleet = fleet_run(routerboards=routerboards, hooks=hooks, fleet_options=fleet_options)
+  journal = fleet['journal']
+  try:
+    order = []
+    for index in routerboards_order(routerboards=routerboards, fleet_options=fleet_options):
+      if journal and journal.is_finished(device=routerboards[index]['name']):  # by the run that was interrupted
+        yield index, {
+          'name': routerboards[index]['name'],
+          'backups': journal.finished_localpaths(device=routerboards[index]['name']),
+          'error': None
+        }
+      else:
+        order.append(index)
+    scheduled_routerboards = [routerboards[index] for index in order]
+    if 'concurrency' in fleet_options:
+      backups = adaptive_routerboards_backups(
+        routerboards=scheduled_routerboards,
+        ssh_client_options=shared_client_options(client_options=ssh_client_options),
+        fleet=fleet,
+        concurrency=adaptive_concurrency(concurrency_options=fleet_options['concurrency'])
+      )
+    else:
+      backups = sequential_routerboards_backups(
+        routerboards=scheduled_routerboards,
+        ssh_client_options=ssh_client_options,
+        fleet=fleet
+      )
+    for scheduled_index, current_backup in finished_results(
+      unfinished_results=backups,
+      finished=routerboard_backup_result
+    ):
+      yield order[scheduled_index], current_backup
+    if journal:
+      journal.cleared()  # the run is complete, the next one starts over
+  finally:
+    if fleet.get('cpu_stage'):
+      fleet['cpu_stage'].shutdown()
+    if fleet.get('storage'):
+      fleet['storage'].closed()
+
+
+def routerboards_results(routerboards, ssh_client_options, hooks=(), fleet_options=None):
+  indexed_results = list(iterated_routerboards_results(
+    routerboards=routerboards,
+    ssh_client_options=ssh_client_options,
+    hooks=hooks,
+    fleet_options=fleet_options
+  ))
+  return in_original_order(
+    results=[result for _, result in indexed_results],
+    order=[index for index, _ in indexed_results]
+  )
+
+
+def iterated_routerboards_backups(routerboards, ssh_client_options, hooks=(), fleet_options=None):
+  with closing(iterated_routerboards_results(
+    routerboards=routerboards,
+    ssh_client_options=ssh_client_options,
+    hooks=hooks,
+    fleet_options=fleet_options
+  )) as results:
+    for index, result in results:
+      if result['error']:
+        raise result['error']
+      yield index, result['backups']
+
+
+def routerboards_backups(routerboards, ssh_client_options, hooks=(), fleet_options=None):
+  indexed_backups = list(iterated_routerboards_backups(
+    routerboards=routerboards,
+    ssh_client_options=ssh_client_options,
+    hooks=hooks,
+    fleet_options=fleet_options
+  ))
+  return in_original_order(
+    results=[current_backup for _, current_backup in indexed_backups],
+    order=[index for index, _ in indexed_backups]
+  )
@@ -0,0 +1,90 @@
+from collections import deque
+from json import loads
+from threading import BoundedSemaphore
+
+
+def device_histories(filename, measure, history_size=10):
+  histories = {}
+  try:
+    with open(filename) as json_lines:
+      for line in json_lines:
+        record = loads(line)
+        value = measure(record)
+        if value is not None:
+          histories.setdefault(record['device'], deque(maxlen=history_size)).append(value)
+  except FileNotFoundError:
+    return {}
+  return histories
+
+
+def historical_durations(filename, history_size=10):
+  durations = device_histories(
+    filename=filename,
+    measure=lambda record: sum(record['phases'].values()),
+    history_size=history_size
+  )
+  return {device: sum(device_durations) / len(device_durations) for device, device_durations in durations.items()}
+
+
+def record_throughput(record):
+  if record.get('error') or not record['phases'].get('download'):
+    return None
+  return record['bytes_transferred'] / record['phases']['download']
+
+
+def historical_throughputs(filename, history_size=10):
+  throughputs = device_histories(filename=filename, measure=record_throughput, history_size=history_size)
+  return {device: max(device_throughputs) for device, device_throughputs in throughputs.items()}
+
+
+def expected_durations(routerboards, durations):
+  unknown_duration = max(  # devices never measured go first, as if they were the slowest
+    [durations[routerboard['name']] for routerboard in routerboards if routerboard['name'] in durations],
+    default=0
+  )
+  return [durations.get(routerboard['name'], unknown_duration) for routerboard in routerboards]
+
+
+def site_of(routerboards, index):
+  return routerboards[index].get('site') or ('no site', index)
+
+
+def scheduled_order(routerboards, durations):
+  expected = expected_durations(routerboards=routerboards, durations=durations)
+  by_site = {}
+  for index in sorted(range(len(routerboards)), key=lambda current_index: expected[current_index], reverse=True):
+    by_site.setdefault(site_of(routerboards=routerboards, index=index), deque()).append(index)
+
+  order = []
+  previous_site = None
+  while by_site:
+    longest_first = sorted(by_site, key=lambda site: expected[by_site[site][0]], reverse=True)
+    site = next((site for site in longest_first if site != previous_site), longest_first[0])
+    order.append(by_site[site].popleft())
+    if not by_site[site]:
+      del by_site[site]
+    previous_site = site
+  return order
+
+
+def in_original_order(results, order):
+  ordered_results = [None] * len(order)
+  for index, result in zip(order, results):
+    ordered_results[index] = result
+  return ordered_results
+
+
+def site_slots(routerboards, max_jobs_per_site):
+  return {
+    site: BoundedSemaphore(value=max_jobs_per_site)
+    for site in {routerboard.get('site') for routerboard in routerboards} if site
+  } if max_jobs_per_site else {}
+
+
+def acquired_site_slot(slots, site):
+  return slots[site].acquire(blocking=False) if site in slots else True  # never waits, the job is held back instead
+
+
+def released_site_slot(slots, site):
+  if site in slots:
+    slots[site].release()
@@ -1,23 +1,106 @@
 from contextlib import contextmanager
 from pathlib import PurePath
+from socket import create_connection, getdefaulttimeout
+from threading import Lock, Thread
 
-from paramiko import SSHClient
+from paramiko import HostKeys, SSHClient, Transport
+
+from backup.metrics import DeviceMetrics
+from backup.retry import retried
+
+transport_profiles = {
+  'default': {},
+  'light': {  # cheap on the weak cpus of the small routerboards
+    'ciphers': ['aes128-ctr'],
+    'macs': ['hmac-sha1', 'hmac-sha2-256'],
+    'kex': ['curve25519-sha256@libssh.org', 'ecdh-sha2-nistp256']
+  },
+  'bulk': {  # authenticated encryption, no separate mac for the large transfers
+    'ciphers': ['aes128-gcm@openssh.com', 'aes256-gcm@openssh.com'],
+    'kex': ['curve25519-sha256@libssh.org']
+  },
+  'compressed': {  # for the text exports over slow links
+    'compression': True
+  }
+}
+
+security_options = {'ciphers': 'ciphers', 'macs': 'digests', 'kex': 'kex'}
+rekey_thresholds = {'rekey_bytes': 'REKEY_BYTES', 'rekey_packets': 'REKEY_PACKETS'}
+default_window_size = 16 * 1024 * 1024  # 100 Mbps over a 1.3 s round trip, paramiko opens channels with 2 MiB
+default_max_packet_size = 32 * 1024  # the largest every ssh server has to accept
 
 
 @contextmanager
-def open_ssh_session(client_options, credentials):
+def open_ssh_session(client_options, credentials, metrics=None):
+  metrics = metrics or DeviceMetrics(device=credentials['hostname'])  # measured but not reported
+  host_options = host_client_options(client_options=client_options, hostname=credentials['hostname'])
   ssh = active_ssh_session(
-    ssh=setup_client(client_options=client_options),
-    credentials=credentials
+    ssh=setup_client(client_options=host_options),
+    credentials=credentials,
+    metrics=metrics,
+    client_options=host_options
   )
   try:
     yield ssh
   finally:
-    close_ssh_session(ssh=ssh)
+    with metrics.phase(name='close'):
+      close_ssh_session(ssh=ssh, teardown=host_options.get('teardown', {}))
+
+
+def host_client_options(client_options, hostname):
+  return {**client_options, **{
+    option: merged_option(client_options=client_options, option=option, value=value)
+    for option, value in client_options.get('hosts', {}).get(hostname, {}).items()
+  }}
+
+
+def merged_option(client_options, option, value):
+  if not isinstance(value, dict):
+    return value
+  if option == 'transport_profile':  # a named profile is merged as the preferences it names
+    return {**transport_profile(client_options=client_options), **value}
+  return {**client_options.get(option, {}), **value}
+
+
+class SFTPChannels:
+  def __init__(self, ssh):
+    self.ssh = ssh
+    self.lock = Lock()
+    self.opened = []
+
+  @property
+  def sftp(self):
+    with self.lock:
+      if not self.opened:  # opened on the first use, reused for every operation after it
+        self.opened.append(self.ssh.open_sftp())
+      return self.opened[0]
+
+  def additional(self):
+    sftp = self.ssh.open_sftp()
+    with self.lock:
+      self.opened.append(sftp)
+    return sftp
+
+  def closed(self):
+    with self.lock:
+      for sftp in self.opened:
+        sftp.close()
+      closed_channels = len(self.opened)
+      self.opened = []
+    return closed_channels
+
+
+@contextmanager
+def open_sftp_channels(ssh):
+  channels = SFTPChannels(ssh=ssh)
+  try:
+    yield channels
+  finally:
+    channels.closed()
 
 
 @contextmanager
-def open_sftp(ssh):
+def open_sftp(ssh):  # a single channel, the backups share the channels of open_sftp_channels
   sftp = ssh.open_sftp()
   try:
     yield sftp
@@ -25,25 +108,126 @@ def open_sftp(ssh):
     sftp.close()
 
 
-def active_ssh_session(ssh, credentials):
-  ssh.connect(
-    username=credentials['username'],
-    hostname=credentials['hostname'],
-    port=credentials['port'],
-    pkey=credentials['pkey']
+def active_ssh_session(ssh, credentials, metrics, client_options):
+  return retried(  # the handshake can not be retried on the socket it failed on
+    operation=lambda: connected_ssh(ssh=ssh, credentials=credentials, metrics=metrics, client_options=client_options),
+    retry_policy=client_options.get('retry_policy', {}),
+    phase='connect'
   )
+
+
+def transport_profile(client_options):
+  profile = client_options.get('transport_profile', {})
+  return transport_profiles[profile] if isinstance(profile, str) else profile
+
+
+def preferred_algorithms(algorithms, defaults):
+  return tuple(algorithms) + tuple(algorithm for algorithm in defaults if algorithm not in algorithms)
+
+
+def profiled_transport(sock, profile, **transport_options):
+  transport = Transport(
+    sock=sock,
+    default_window_size=profile.get('window_size', default_window_size),  # the sftp channels are opened with them
+    default_max_packet_size=profile.get('max_packet_size', default_max_packet_size),
+    **transport_options  # the ones the ssh client creates its transports with (gss and disabled algorithms)
+  )
+  options = transport.get_security_options()
+  for option, name in security_options.items():
+    if option in profile:  # the defaults are kept after the preferred ones, the negotiation does not fail on them
+      setattr(options, name, preferred_algorithms(algorithms=profile[option], defaults=getattr(options, name)))
+  for option, threshold in rekey_thresholds.items():
+    if option in profile:
+      setattr(transport.packetizer, threshold, profile[option])
+  return transport
+
+
+def connected_ssh(ssh, credentials, metrics, client_options):
+  timeouts = client_options.get('timeouts', {})
+  profile = transport_profile(client_options=client_options)
+  with metrics.phase(name='connect'):
+    sock = create_connection(
+      address=(credentials['hostname'], credentials['port']),
+      timeout=timeouts.get('connect_seconds', getdefaulttimeout())
+    )
+  with metrics.phase(name='auth'):
+    try:
+      ssh.connect(
+        username=credentials['username'],
+        hostname=credentials['hostname'],
+        port=credentials['port'],
+        pkey=credentials['pkey'],
+        sock=sock,
+        banner_timeout=timeouts.get('banner_seconds'),
+        auth_timeout=timeouts.get('auth_seconds'),
+        channel_timeout=timeouts.get('channel_seconds'),
+        compress=profile.get('compression', False),
+        transport_factory=lambda sock, **options: profiled_transport(sock=sock, profile=profile, **options)
+      )
+    except Exception:  # a retry opens another socket, this one and the transport started on it are not reused
+      ssh.close()
+      sock.close()
+      raise
+  if 'keepalive_seconds' in client_options:
+    ssh.get_transport().set_keepalive(interval=client_options['keepalive_seconds'])
   return ssh
 
 
 def setup_client(client_options):
   ssh = SSHClient()
-  ssh.load_host_keys(filename=client_options['hosts_keys_filename'])
+  if 'host_keys' in client_options:
+    ssh.get_host_keys().update(client_options['host_keys'])
+  else:
+    ssh.load_host_keys(filename=client_options['hosts_keys_filename'])
   return ssh
 
 
-def close_ssh_session(ssh):
-  ssh.exec_command(command='quit')
+def shared_client_options(client_options):
+  return {
+    **client_options,
+    'host_keys': client_options.get('host_keys') or HostKeys(filename=client_options['hosts_keys_filename'])
+  }
+
+
+class RemoteCommandError(Exception):
+  pass
+
+
+def completed_command(ssh, command, seconds_to_timeout):
+  _, stdout, stderr = ssh.exec_command(command=command, timeout=seconds_to_timeout)
+  output = stdout.read() + stderr.read()  # raises a timeout when the device stops answering
+  return {
+    'exit_status': stdout.channel.recv_exit_status(),
+    'output': output.decode(errors='replace')
+  }
+
+
+def unlinked(sftp, path):
+  try:
+    sftp.unlink(path=path)
+  except FileNotFoundError:  # deleted by an attempt whose reply was lost
+    pass
+  return path
+
+
+def torn_down(ssh, send_quit):
+  if send_quit:
+    ssh.exec_command(command='quit')
   ssh.close()
+  return ssh
+
+
+def close_ssh_session(ssh, teardown=None):
+  teardown = teardown or {}
+  closing = Thread(
+    target=torn_down,
+    kwargs={'ssh': ssh, 'send_quit': teardown.get('send_quit', True)},
+    daemon=True  # an unresponsive device does not hold the process on exit
+  )
+  closing.start()
+  if not teardown.get('background'):
+    closing.join(timeout=teardown.get('timeout_seconds'))
+  return closing
 
 
 def localpath(filename, backups_directory):
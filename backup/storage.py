@@ -0,0 +1,217 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+from tarfile import TarFile, TarInfo
+from tempfile import SpooledTemporaryFile
+from threading import BoundedSemaphore, Lock
+
+from backup.durability import AtomicFile, Durability
+from backup.ssh_client import localpath
+
+local_features = {'skip_unchanged_backups', 'export_index', 'export_store', 'retention', 'cpu_stage', 'checkpoint'}
+
+
+class FilesystemStorage:
+  def __init__(self, durability=None):
+    self.durability = durability
+
+  def location(self, directory, filename):
+    return localpath(filename=filename, backups_directory=directory)
+
+  def opened(self, location):
+    return AtomicFile(localpath=location, durability=self.durability)
+
+  def closed(self):
+    if self.durability:
+      self.durability.synced_directories()
+
+
+class TarballMember:
+  def __init__(self, storage, name):
+    self.storage = storage
+    self.name = name
+    self.file = SpooledTemporaryFile(max_size=storage.spool_bytes)  # added to the tarball once complete
+
+  def write(self, data):
+    return self.file.write(data)
+
+  def close(self):
+    self.storage.added(name=self.name[len(self.storage.filename) + 1:], member_file=self.file)
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exception_type, exception, traceback):
+    if exception_type:
+      self.file.close()
+    else:
+      self.close()
+
+
+class TarballStorage:
+  def __init__(self, filename, durability=None, spool_bytes=8 * 1024 * 1024):
+    self.filename = filename.format(datetime=datetime.now())  # one tarball for each run
+    self.durability = durability
+    self.spool_bytes = spool_bytes
+    self.lock = Lock()
+    self.file = AtomicFile(localpath=self.filename, durability=durability)
+    self.tarball = TarFile(fileobj=self.file.file, mode='w')
+
+  def location(self, directory, filename):
+    return '{tarball}:{member}'.format(tarball=self.filename, member=filename)
+
+  def opened(self, location):
+    return TarballMember(storage=self, name=location)
+
+  def added(self, name, member_file):
+    member = TarInfo(name=name)
+    member.size = member_file.tell()
+    member.mtime = datetime.now().timestamp()
+    member_file.seek(0)
+    with self.lock:
+      self.tarball.addfile(tarinfo=member, fileobj=member_file)
+    return member
+
+  def closed(self):
+    self.tarball.close()
+    self.file.close()
+    if self.durability:  # the rename of the tarball is below any batch of directories
+      self.durability.synced_directories()
+
+
+def object_store_client(client_options):
+  from boto3 import client  # only the object store needs boto3
+  return client('s3', **client_options)
+
+
+class ObjectUpload:
+  def __init__(self, storage, name, key):
+    self.storage = storage
+    self.name = name
+    self.key = key
+    self.buffer = bytearray()
+    self.upload_id = None
+    self.parts = []
+    self.pending = BoundedSemaphore(value=storage.max_pending_parts)
+
+  def uploaded_part(self, data):
+    client = self.storage.client
+    if not self.upload_id:
+      self.upload_id = client.create_multipart_upload(Bucket=self.storage.bucket, Key=self.key)['UploadId']
+    self.pending.acquire()  # the download waits while as many parts are being uploaded
+    part = self.storage.executor.submit(
+      client.upload_part,
+      Bucket=self.storage.bucket,
+      Key=self.key,
+      UploadId=self.upload_id,
+      PartNumber=len(self.parts) + 1,
+      Body=data
+    )
+    part.add_done_callback(lambda _: self.pending.release())
+    self.parts.append(part)
+    return part
+
+  def write(self, data):
+    self.buffer += data
+    part_size = self.storage.part_size
+    while len(self.buffer) >= part_size:
+      self.uploaded_part(data=bytes(self.buffer[:part_size]))
+      del self.buffer[:part_size]
+    return len(data)
+
+  def close(self):
+    client = self.storage.client
+    if not self.upload_id:  # smaller than a part, it goes on a single request
+      client.put_object(Bucket=self.storage.bucket, Key=self.key, Body=bytes(self.buffer))
+      return
+    if self.buffer:
+      self.uploaded_part(data=bytes(self.buffer))
+    try:
+      parts = [{'ETag': part.result()['ETag'], 'PartNumber': number} for number, part in enumerate(self.parts, start=1)]
+      client.complete_multipart_upload(
+        Bucket=self.storage.bucket,
+        Key=self.key,
+        UploadId=self.upload_id,
+        MultipartUpload={'Parts': parts}
+      )
+    except Exception:  # the parts uploaded are billed until the upload is aborted
+      self.discarded()
+      raise
+
+  def discarded(self):
+    if self.upload_id:
+      wait(self.parts)
+      self.storage.client.abort_multipart_upload(Bucket=self.storage.bucket, Key=self.key, UploadId=self.upload_id)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exception_type, exception, traceback):
+    if exception_type:
+      self.discarded()
+    else:
+      self.close()
+
+
+class ObjectStorage:
+  def __init__(
+    self,
+    bucket,
+    prefix='',
+    client_options=None,
+    part_size=8 * 1024 * 1024,
+    max_concurrency=4,
+    max_pending_parts=None
+  ):
+    self.bucket = bucket
+    self.prefix = prefix
+    self.client = object_store_client(client_options=client_options or {})
+    self.part_size = part_size  # at least 5 MiB on S3
+    self.max_pending_parts = max_pending_parts or 2 * max_concurrency
+    self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+  def location(self, directory, filename):
+    return 's3://{bucket}/{prefix}{filename}'.format(bucket=self.bucket, prefix=self.prefix, filename=filename)
+
+  def opened(self, location):
+    return ObjectUpload(
+      storage=self,
+      name=location,
+      key=location[len('s3://{bucket}/'.format(bucket=self.bucket)):]
+    )
+
+  def closed(self):
+    self.executor.shutdown()
+
+
+local_storage_backends = {
+  'filesystem': FilesystemStorage,
+  'tarball': TarballStorage
+}
+
+
+def storage_backend(storage_options=None, durability_options=None):
+  storage_options = dict(storage_options or {})
+  backend = storage_options.pop('backend', 'filesystem')
+  if backend == 'object_store':  # the durability is up to the object store
+    return ObjectStorage(**storage_options)
+  return local_storage_backends[backend](
+    durability=Durability(**durability_options) if durability_options else None,
+    **storage_options
+  )
+
+
+def unsupported_features(storage_options, options):
+  if (storage_options or {}).get('backend', 'filesystem') == 'filesystem':
+    return []
+  return sorted(local_features.intersection(options))  # they read the files retrieved back from the filesystem
+
+
+@contextmanager
+def open_storage(storage_options=None, durability_options=None):
+  storage = storage_backend(storage_options=storage_options, durability_options=durability_options)
+  try:
+    yield storage
+  finally:
+    storage.closed()
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+from re import escape, match
+
+from backup.metrics import DeviceMetrics
+from backup.ssh_client import open_sftp_channels, open_ssh_session, unlinked
+
+
+def generated_file_datetime(filename, device_id):
+  found = match(
+    pattern=r'{device_id}_(\d{{4}}(-\d{{2}}){{5}})\.(backup|rsc)$'.format(device_id=escape(device_id)),
+    string=filename
+  )
+  return datetime.strptime(found.group(1), '%Y-%m-%d-%H-%M-%S') if found else None
+
+
+def stale_remote_files(sftp, device_id, minimum_age_seconds, now):
+  oldest_kept = now - timedelta(seconds=minimum_age_seconds)
+  return [
+    attributes for attributes in sftp.listdir_attr(path='.')
+    if (generated := generated_file_datetime(filename=attributes.filename, device_id=device_id))
+    and generated <= oldest_kept
+  ]
+
+
+def swept_remote_files(sftp, device_id, sweep_options, metrics):
+  dry_run = sweep_options.get('dry_run', False)
+  with metrics.phase(name='sweep'):
+    stale = stale_remote_files(
+      sftp=sftp,
+      device_id=device_id,
+      minimum_age_seconds=sweep_options.get('minimum_age_seconds', 3600),  # not from a backup still running
+      now=datetime.now()
+    )
+    if not dry_run:
+      for attributes in stale:
+        unlinked(sftp=sftp, path=attributes.filename)
+  report = {
+    'device': device_id,
+    'files': [attributes.filename for attributes in stale],
+    'size': sum(attributes.st_size or 0 for attributes in stale),
+    'dry_run': dry_run
+  }
+  if not dry_run:
+    metrics.swept(size=report['size'])
+  return report
+
+
+def routerboard_sweep(routerboard, ssh_client_options, dry_run):
+  metrics = DeviceMetrics(device=routerboard['name'])
+  with open_ssh_session(
+    client_options=ssh_client_options,
+    credentials=routerboard['credentials'],
+    metrics=metrics
+  ) as ssh, open_sftp_channels(ssh=ssh) as channels:
+    return swept_remote_files(
+      sftp=channels.sftp,
+      device_id=routerboard['name'],
+      sweep_options={**routerboard['backup_options'].get('sweep', {}), 'dry_run': dry_run},
+      metrics=metrics
+    )
+
+
+def routerboards_sweeps(routerboards, ssh_client_options, dry_run=True):
+  return [
+    routerboard_sweep(routerboard=routerboard, ssh_client_options=ssh_client_options, dry_run=dry_run)
+    for routerboard in routerboards
+  ]
@@ -0,0 +1,76 @@
+from threading import Lock
+from time import monotonic, sleep
+
+from backup.encryption import EncryptedFile
+from backup.storage import FilesystemStorage
+
+
+class TokenBucket:
+  def __init__(self, bytes_per_second, burst_bytes=None):
+    self.bytes_per_second = bytes_per_second
+    self.capacity = burst_bytes or bytes_per_second
+    self.tokens = self.capacity
+    self.updated = monotonic()
+    self.lock = Lock()
+
+  def reserved(self, size):
+    with self.lock:
+      now = monotonic()
+      self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.bytes_per_second)
+      self.updated = now
+      self.tokens -= size
+      return -self.tokens / self.bytes_per_second if self.tokens < 0 else 0
+
+
+def bytes_per_second(mbps):
+  return mbps * 1000000 / 8
+
+
+def bandwidth_buckets(bandwidth_limits):
+  return {
+    'global': TokenBucket(
+      bytes_per_second=bytes_per_second(mbps=bandwidth_limits['global_mbps'])
+    ) if 'global_mbps' in bandwidth_limits else None,
+    'sites': {
+      site: TokenBucket(bytes_per_second=bytes_per_second(mbps=mbps))
+      for site, mbps in bandwidth_limits.get('sites_mbps', {}).items()
+    }
+  }
+
+
+def site_buckets(buckets, site):
+  return [bucket for bucket in [buckets['sites'].get(site), buckets['global']] if bucket]
+
+
+def throttled(buckets, size):
+  waiting_seconds = max([bucket.reserved(size=size) for bucket in buckets], default=0)
+  if waiting_seconds:
+    sleep(waiting_seconds)
+  return waiting_seconds
+
+
+def opened_local_file(localpath, key, storage):
+  local_file = (storage or FilesystemStorage()).opened(location=localpath)
+  return EncryptedFile(file=local_file, key=key) if key else local_file
+
+
+class ThrottledProgress:
+  def __init__(self, callback, buckets):
+    self.callback = callback
+    self.buckets = buckets
+    self.transferred = 0
+
+  def __call__(self, transferred, total):  # reserved as the data arrives, paramiko keeps prefetching the rest meanwhile
+    throttled(buckets=self.buckets, size=transferred - self.transferred)
+    self.transferred = transferred
+    self.callback(transferred, total)
+
+
+def retrieved(sftp, remotepath, localpath, callback, buckets, key=None, storage=None):
+  with opened_local_file(localpath=localpath, key=key, storage=storage) as local_file:  # encrypted as it arrives
+    sftp.getfo(
+      remotepath=remotepath,
+      fl=local_file,
+      callback=ThrottledProgress(callback=callback, buckets=buckets) if buckets else callback
+    )
+  return localpath
@@ -0,0 +1,224 @@
+from datetime import datetime, timedelta
+from logging import CRITICAL, getLogger
+from multiprocessing import Process, Queue
+from os import listdir, lstat, makedirs, path, remove
+from re import search
+from socket import socket
+from threading import Thread
+from time import sleep
+
+from paramiko import AUTH_SUCCESSFUL, OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED, OPEN_SUCCEEDED, RSAKey, \
+  SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface, SFTP_NO_SUCH_FILE, SFTP_OK, ServerInterface, \
+  Transport
+
+default_server_options = {
+  'backup_size': 256 * 1024,
+  'export_size': 64 * 1024,
+  'write_delay_seconds': 0.2,
+  'latency_seconds': 0.0,
+  'bandwidth_bytes_per_second': None
+}
+
+reply_grace_seconds = 0.01
+
+
+def file_content(size):
+  pattern = bytes(range(256))
+  return (pattern * (size // len(pattern) + 1))[:size]
+
+
+def shaped(server_options, length=0):
+  delay = server_options['latency_seconds']
+  if server_options['bandwidth_bytes_per_second']:
+    delay += length / server_options['bandwidth_bytes_per_second']
+  if delay:
+    sleep(delay)
+
+
+def generated_file(root, filename, size, server_options):
+  sleep(server_options['write_delay_seconds'])
+  with open(path.join(root, filename), 'wb') as generated:
+    generated.write(file_content(size=size))
+  return filename
+
+
+def executed_command(channel, command, root, server_options):
+  sleep(reply_grace_seconds)  # lets the transport acknowledge the exec request before the channel is closed
+  if backup_name := search(pattern=r'^/system backup save name=(\S+)', string=command):
+    generated_file(
+      root=root,
+      filename=backup_name.group(1),
+      size=server_options['backup_size'],
+      server_options=server_options
+    )
+  elif export_file := search(pattern=r'^/ export file=(\S+)', string=command):
+    generated_file(
+      root=root,
+      filename=export_file.group(1),
+      size=server_options['export_size'],
+      server_options=server_options
+    )
+  channel.send_exit_status(0)
+  channel.close()
+
+
+class FakeRouterOS(ServerInterface):
+  def __init__(self, root, server_options):
+    self.root = root
+    self.server_options = server_options
+
+  def get_allowed_auths(self, username):
+    return 'publickey'
+
+  def check_auth_publickey(self, username, key):
+    return AUTH_SUCCESSFUL
+
+  def check_channel_request(self, kind, chanid):
+    return OPEN_SUCCEEDED if kind == 'session' else OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+  def check_channel_exec_request(self, channel, command):
+    Thread(
+      target=executed_command,
+      kwargs={
+        'channel': channel,
+        'command': command.decode(),
+        'root': self.root,
+        'server_options': self.server_options
+      },
+      daemon=True
+    ).start()
+    return True
+
+
+class ShapedSFTPHandle(SFTPHandle):
+  def __init__(self, server_options, flags=0):
+    super().__init__(flags=flags)
+    self.server_options = server_options
+
+  def read(self, offset, length):
+    shaped(server_options=self.server_options, length=length)
+    return super().read(offset=offset, length=length)
+
+  def stat(self):
+    return SFTPAttributes.from_stat(obj=lstat(self.filename))
+
+
+class FakeRouterOSSFTP(SFTPServerInterface):
+  def __init__(self, server, *args, **kwargs):
+    super().__init__(server, *args, **kwargs)
+    self.root = server.root
+    self.server_options = server.server_options
+
+  def local(self, remotepath):
+    return path.join(self.root, remotepath.lstrip('/').replace('..', ''))
+
+  def list_folder(self, path_):
+    shaped(server_options=self.server_options)
+    directory = self.local(remotepath=path_)
+    return [
+      SFTPAttributes.from_stat(obj=lstat(path.join(directory, filename)), filename=filename)
+      for filename in listdir(directory)
+    ]
+
+  def stat(self, path_):
+    shaped(server_options=self.server_options)
+    if not path.exists(localpath := self.local(remotepath=path_)):
+      return SFTP_NO_SUCH_FILE
+    return SFTPAttributes.from_stat(obj=lstat(localpath))
+
+  lstat = stat
+
+  def open(self, path_, flags, attr):
+    shaped(server_options=self.server_options)
+    if not path.exists(localpath := self.local(remotepath=path_)):
+      return SFTP_NO_SUCH_FILE
+    handle = ShapedSFTPHandle(server_options=self.server_options, flags=flags)
+    handle.filename = localpath
+    handle.readfile = open(localpath, 'rb')
+    return handle
+
+  def remove(self, path_):
+    shaped(server_options=self.server_options)
+    if not path.exists(localpath := self.local(remotepath=path_)):
+      return SFTP_NO_SUCH_FILE
+    remove(localpath)
+    return SFTP_OK
+
+
+def served_connection(connection, host_key, root, server_options):
+  transport = Transport(sock=connection)
+  transport.add_server_key(key=host_key)
+  transport.set_subsystem_handler('sftp', SFTPServer, FakeRouterOSSFTP)
+  transport.start_server(server=FakeRouterOS(root=root, server_options=server_options))
+  while transport.is_active():
+    sleep(0.1)
+
+
+def served_forever(listening_socket, host_key_filename, root, server_options):
+  host_key = RSAKey(filename=host_key_filename)
+  while True:
+    connection, _ = listening_socket.accept()
+    Thread(
+      target=served_connection,
+      kwargs={
+        'connection': connection,
+        'host_key': host_key,
+        'root': root,
+        'server_options': server_options
+      },
+      daemon=True
+    ).start()
+
+
+def server_process(ports, host_key_filename, root, server_options):
+  getLogger('paramiko').setLevel(CRITICAL)  # clients dropping the connection on close are expected
+  listening_socket = socket()
+  listening_socket.bind(('127.0.0.1', 0))
+  listening_socket.listen(128)
+  ports.put(listening_socket.getsockname()[1])
+  served_forever(
+    listening_socket=listening_socket,
+    host_key_filename=host_key_filename,
+    root=root,
+    server_options=server_options
+  )
+
+
+def started_server(host_key_filename, root, server_options):
+  ports = Queue()
+  process = Process(
+    target=server_process,
+    kwargs={
+      'ports': ports,
+      'host_key_filename': host_key_filename,
+      'root': root,
+      'server_options': server_options
+    },
+    daemon=True
+  )
+  process.start()
+  return {'process': process, 'port': ports.get(timeout=30)}
+
+
+def myauth_archives(root, remote_directory, quantity, size):
+  directory = path.join(root, remote_directory.strip('/'))
+  makedirs(directory, exist_ok=True)
+  newest = datetime(year=2020, month=10, day=1, hour=4, minute=40)
+  return [
+    generated_file(
+      root=directory,
+      filename='backup-{creation}.tgz'.format(creation=(newest - timedelta(days=days)).strftime('%Y-%m-%d-%H%M')),
+      size=size,
+      server_options={'write_delay_seconds': 0}
+    ) for days in range(quantity)
+  ]
+
+
+def written_known_hosts(filename, host_key, port):
+  with open(filename, 'w') as known_hosts:
+    known_hosts.write('[127.0.0.1]:{port} {name} {key}\n'.format(
+      port=port,
+      name=host_key.get_name(),
+      key=host_key.get_base64()
+    ))
+  return filename
@@ -0,0 +1,225 @@
+from argparse import ArgumentParser
+from sys import exit
+from math import ceil
+from os import makedirs, path
+from resource import RUSAGE_SELF, getrusage
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from paramiko import RSAKey
+
+from backup.myauth import myauth_backup
+from backup.routerboard import routerboards_results
+from benchmarks.fake_routeros import default_server_options, myauth_archives, started_server, written_known_hosts
+
+
+def percentile(values, percent):
+  ordered = sorted(values)
+  return ordered[max(ceil(len(ordered) * percent / 100) - 1, 0)] if ordered else None
+
+
+def cpu_seconds():
+  usage = getrusage(RUSAGE_SELF)
+  return usage.ru_utime + usage.ru_stime
+
+
+def measured_run(run):
+  records = []
+  start_cpu = cpu_seconds()
+  start = perf_counter()
+  run(hooks=[lambda metrics: records.append(metrics.record)])
+  wall_seconds = perf_counter() - start
+  used_cpu_seconds = cpu_seconds() - start_cpu
+  failed = [record for record in records if record['error']]
+  records = [record for record in records if not record['error']]  # a failed device is not measured
+  latencies = [sum(record['phases'].values()) for record in records]
+  return {
+    'wall_seconds': wall_seconds,
+    'cpu_seconds': used_cpu_seconds,
+    'cpu_usage': used_cpu_seconds / wall_seconds if wall_seconds else 0,
+    'devices': len(records),
+    'errors': len(failed),
+    'bytes_transferred': sum(record['bytes_transferred'] for record in records),
+    'latency_percentiles': {
+      'p{percent}'.format(percent=percent): percentile(values=latencies, percent=percent)
+      for percent in (50, 90, 99)
+    },
+    'phases': {
+      phase: sum(record['phases'].get(phase, 0) for record in records)
+      for phase in sorted({phase for record in records for phase in record['phases']})
+    }
+  }
+
+
+def routerboards(quantity, port, client_key, backups_directory):
+  return [
+    {
+      'name': 'rtr-{index}'.format(index=index),
+      'backup_options': {
+        'backups_directory': backups_directory,
+        'assertion_options': {
+          'seconds_to_timeout': 30,
+          'minimum_size_in_bytes': 1
+        }
+      },
+      'backup_password': 'benchmark',
+      'credentials': {
+        'username': 'benchmark',
+        'hostname': '127.0.0.1',
+        'port': port,
+        'pkey': client_key
+      }
+    } for index in range(quantity)
+  ]
+
+
+def myauth(port, client_key, local_backups_directory, keeping_quantity):
+  return {
+    'backup_settings': {
+      'local_backups_directory': local_backups_directory,
+      'remote_backups_directory': '/admin/backup/',
+      'keeping_backups_quantity': keeping_quantity
+    },
+    'credentials': {
+      'username': 'benchmark',
+      'hostname': '127.0.0.1',
+      'port': port,
+      'pkey': client_key
+    }
+  }
+
+
+def fleet_options(arguments, directory):
+  return {
+    **({'concurrency': {
+      'floor': arguments.concurrency[0],
+      'ceiling': arguments.concurrency[1]
+    }} if arguments.concurrency else {}),
+    **({'bandwidth_limits': {'global_mbps': arguments.global_mbps}} if arguments.global_mbps else {}),
+    **({'cpu_stage': {'jobs': arguments.cpu_jobs}} if arguments.cpu_jobs else {}),
+    **({'durability': {'fsync': arguments.fsync}} if arguments.fsync else {}),
+    **({'storage': {
+      'backend': 'tarball',
+      'filename': path.join(directory, 'fleet-{datetime:%Y%m%d%H%M%S}.tar')
+    }} if arguments.tarball else {})
+  }
+
+
+def teardown_options(arguments):
+  return {
+    'quit': {},
+    'transport': {'send_quit': False, 'timeout_seconds': 5},
+    'background': {'send_quit': False, 'background': True}
+  }[arguments.teardown]
+
+
+def fleet_benchmark(arguments, directory):
+  server_options = {
+    'backup_size': arguments.backup_size,
+    'export_size': arguments.export_size,
+    'write_delay_seconds': arguments.write_delay,
+    'latency_seconds': arguments.latency,
+    'bandwidth_bytes_per_second': arguments.bandwidth
+  }
+  root = path.join(directory, 'remote')
+  backups_directory = path.join(directory, 'local', '')
+  makedirs(root)
+  makedirs(backups_directory)
+  host_key = RSAKey.generate(bits=2048)
+  host_key.write_private_key_file(filename=path.join(directory, 'host_key'))
+  client_key = RSAKey.generate(bits=2048)
+  myauth_archives(
+    root=root,
+    remote_directory='/admin/backup/',
+    quantity=arguments.myauth_archives,
+    size=arguments.archive_size
+  )
+
+  server = started_server(
+    host_key_filename=path.join(directory, 'host_key'),
+    root=root,
+    server_options=server_options
+  )
+  ssh_client_options = {
+    'hosts_keys_filename': written_known_hosts(
+      filename=path.join(directory, 'known_hosts'),
+      host_key=host_key,
+      port=server['port']
+    ),
+    'teardown': teardown_options(arguments=arguments)
+  }
+  try:
+    return {
+      'routerboards': measured_run(run=lambda hooks: routerboards_results(
+        routerboards=routerboards(
+          quantity=arguments.devices,
+          port=server['port'],
+          client_key=client_key,
+          backups_directory=backups_directory
+        ),
+        ssh_client_options=ssh_client_options,
+        hooks=hooks,
+        fleet_options=fleet_options(arguments=arguments, directory=directory)
+      )),
+      'myauth': measured_run(run=lambda hooks: myauth_backup(
+        myauth=myauth(
+          port=server['port'],
+          client_key=client_key,
+          local_backups_directory=backups_directory,
+          keeping_quantity=arguments.keeping_quantity
+        ),
+        ssh_client_options=ssh_client_options,
+        hooks=hooks
+      ))
+    }
+  finally:
+    server['process'].terminate()
+
+
+def report(results):
+  for name, result in results.items():
+    print('{name}: {devices} devices, {errors} failed, {wall:.3f}s, {size} bytes, cpu {cpu:.3f}s ({usage:.1%})'.format(
+      name=name,
+      devices=result['devices'],
+      errors=result['errors'],
+      wall=result['wall_seconds'],
+      size=result['bytes_transferred'],
+      cpu=result['cpu_seconds'],
+      usage=result['cpu_usage']
+    ))
+    print('  latency {percentiles}'.format(percentiles=', '.join(
+      '{name}={seconds:.3f}s'.format(name=name, seconds=seconds)
+      for name, seconds in result['latency_percentiles'].items()
+    )))
+    print('  phases {phases}'.format(phases=', '.join(
+      '{phase}={seconds:.3f}s'.format(phase=phase, seconds=seconds)
+      for phase, seconds in result['phases'].items()
+    )))
+
+
+def parsed_arguments():
+  parser = ArgumentParser(description='Backs up a fleet of fake RouterOS devices and a fake MyAuth server.')
+  parser.add_argument('--devices', type=int, default=10)
+  parser.add_argument('--backup-size', type=int, default=default_server_options['backup_size'])
+  parser.add_argument('--export-size', type=int, default=default_server_options['export_size'])
+  parser.add_argument('--write-delay', type=float, default=default_server_options['write_delay_seconds'])
+  parser.add_argument('--latency', type=float, default=default_server_options['latency_seconds'])
+  parser.add_argument('--bandwidth', type=int, default=default_server_options['bandwidth_bytes_per_second'])
+  parser.add_argument('--myauth-archives', type=int, default=10)
+  parser.add_argument('--archive-size', type=int, default=1024 * 1024)
+  parser.add_argument('--keeping-quantity', type=int, default=7)
+  parser.add_argument('--concurrency', type=int, nargs=2, metavar=('FLOOR', 'CEILING'))
+  parser.add_argument('--global-mbps', type=float)
+  parser.add_argument('--cpu-jobs', nargs='+', choices=['gzip', 'sha256'])
+  parser.add_argument('--teardown', choices=['quit', 'transport', 'background'], default='quit')
+  parser.add_argument('--fsync', choices=['none', 'file', 'directory'])
+  parser.add_argument('--tarball', action='store_true')
+  return parser.parse_args()
+
+
+if __name__ == '__main__':
+  with TemporaryDirectory() as benchmark_directory:
+    benchmark_results = fleet_benchmark(arguments=parsed_arguments(), directory=benchmark_directory)
+  report(results=benchmark_results)
+  if any(result['errors'] for result in benchmark_results.values()):
+    exit(1)  # the measures of a run with failed devices are not comparable
@@ -0,0 +1,137 @@
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from math import log
+from sys import exit
+from time import perf_counter
+from tracemalloc import get_traced_memory, start, stop
+
+from paramiko import SFTPAttributes
+
+from backup.myauth import are_not_corrupted, backup_files_found, labeled_backups
+
+expected_exponents = {
+  'backup_files_found': 1.0,
+  'parsing': 1.0,
+  'are_not_corrupted': 1.0,  # n log n
+  'labeled_backups': 1.0,  # n log n
+}
+
+
+def sftp_attributes(filename, size):
+  attributes = SFTPAttributes()
+  attributes.filename = filename
+  attributes.st_size = size
+  return attributes
+
+
+def synthetic_listing(quantity):
+  oldest = datetime(year=2000, month=1, day=1, hour=4, minute=40)
+  return [
+    sftp_attributes(filename='.lastbackup', size=0),
+    *[
+      sftp_attributes(
+        filename='backup-{creation}.tgz'.format(creation=(oldest + timedelta(minutes=index)).strftime('%Y-%m-%d-%H%M')),
+        size=1000000 + index
+      ) for index in range(quantity)
+    ]
+  ]
+
+
+def parsed(backup_files):
+  return [(backup_file.creation, backup_file.extension) for backup_file in backup_files]
+
+
+def stages(listing):
+  backup_files = backup_files_found(sftp_attributes_from_files=listing)
+  return {
+    'backup_files_found': lambda: backup_files_found(sftp_attributes_from_files=listing),
+    'parsing': lambda: parsed(backup_files=backup_files),
+    'are_not_corrupted': lambda: are_not_corrupted(backup_files=backup_files),
+    'labeled_backups': lambda: labeled_backups(backup_files=backup_files, keeping_quantity=7)
+  }
+
+
+def timed(stage):
+  start_time = perf_counter()
+  stage()
+  return perf_counter() - start_time
+
+
+def peak_memory(stage):
+  start()  # restarted for each stage, so the peak is the one of the stage
+  baseline, _ = get_traced_memory()
+  stage()
+  _, peak = get_traced_memory()
+  stop()
+  return peak - baseline
+
+
+def measures(sizes, memory):
+  results = {}
+  for size in sizes:
+    for name, stage in stages(listing=synthetic_listing(quantity=size)).items():
+      results.setdefault(name, {})[size] = {
+        'seconds': timed(stage=stage),
+        'peak_bytes': peak_memory(stage=stage) if memory else None
+      }
+  return results
+
+
+def growth_exponent(points):
+  points = [(log(size), log(value)) for size, value in points if value > 0]
+  if len(points) < 2:
+    return None
+  mean_x = sum(x for x, _ in points) / len(points)
+  mean_y = sum(y for _, y in points) / len(points)
+  return sum((x - mean_x) * (y - mean_y) for x, y in points) / sum((x - mean_x) ** 2 for x, _ in points)
+
+
+def deviations(results, minimum_fitted_size, tolerance):
+  found = []
+  for name, by_size in results.items():
+    for measure in ('seconds', 'peak_bytes'):
+      exponent = growth_exponent(points=[
+        (size, values[measure]) for size, values in by_size.items()
+        if size >= minimum_fitted_size and values[measure] is not None
+      ])
+      if exponent is not None and exponent > expected_exponents[name] + tolerance:
+        found.append('{name} {measure} grows as n^{exponent:.2f}, expected n^{expected:.2f}'.format(
+          name=name,
+          measure=measure,
+          exponent=exponent,
+          expected=expected_exponents[name]
+        ))
+  return found
+
+
+def report(results):
+  for name, by_size in results.items():
+    print(name)
+    for size, values in by_size.items():
+      print('  {size:>9} entries {seconds:>10.6f}s {peak}'.format(
+        size=size,
+        seconds=values['seconds'],
+        peak='' if values['peak_bytes'] is None else '{peak:>12} bytes peak'.format(peak=values['peak_bytes'])
+      ))
+
+
+def parsed_arguments():
+  parser = ArgumentParser(description='Times the analysis of synthetic MyAuth backup listings.')
+  parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000, 100000, 1000000])
+  parser.add_argument('--minimum-fitted-size', type=int, default=1000)
+  parser.add_argument('--tolerance', type=float, default=0.35)
+  parser.add_argument('--no-memory', dest='memory', action='store_false')
+  return parser.parse_args()
+
+
+if __name__ == '__main__':
+  arguments = parsed_arguments()
+  benchmark_results = measures(sizes=arguments.sizes, memory=arguments.memory)
+  report(results=benchmark_results)
+  if found_deviations := deviations(
+    results=benchmark_results,
+    minimum_fitted_size=arguments.minimum_fitted_size,
+    tolerance=arguments.tolerance
+  ):
+    print('\n'.join(found_deviations))
+    exit(1)
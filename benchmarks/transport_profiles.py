@@ -0,0 +1,122 @@
+from argparse import ArgumentParser
+from os import makedirs, path
+from tempfile import TemporaryDirectory
+
+from paramiko import RSAKey
+
+from backup.routerboard import routerboards_results
+from backup.ssh_client import transport_profiles
+from benchmarks.fake_routeros import default_server_options, started_server, written_known_hosts
+from benchmarks.fleet import routerboards
+
+transfer_phases = ['connect', 'auth', 'download']  # the ones the transport profile changes
+
+
+def profile_seconds(routerboard, ssh_client_options, profile, repetitions):
+  records = []
+  for _ in range(repetitions):
+    routerboards_results(
+      routerboards=[routerboard],
+      ssh_client_options={**ssh_client_options, 'transport_profile': profile},
+      hooks=[lambda metrics: records.append(metrics.record)]
+    )
+  if any(record['error'] for record in records):
+    return None  # a profile that fails is not timed, a fast failure would look like the fastest profile
+  return sum(record['phases'].get(phase, 0) for record in records for phase in transfer_phases) / repetitions
+
+
+def fastest_profiles(routerboards_to_measure, ssh_client_options, profiles, repetitions):
+  results = {}
+  for routerboard in routerboards_to_measure:
+    seconds = {
+      profile: profile_seconds(
+        routerboard=routerboard,
+        ssh_client_options=ssh_client_options,
+        profile=profile,
+        repetitions=repetitions
+      ) for profile in profiles
+    }
+    timed = {profile: timing for profile, timing in seconds.items() if timing is not None}
+    results[routerboard['name']] = {
+      'hostname': routerboard['credentials']['hostname'],
+      'seconds': seconds,
+      'fastest': min(timed, key=timed.get) if timed else None
+    }
+  return results
+
+
+def hosts_options(results):
+  return {
+    result['hostname']: {'transport_profile': result['fastest']} for result in results.values() if result['fastest']
+  }
+
+
+def profiles_benchmark(arguments, directory):
+  root = path.join(directory, 'remote')
+  backups_directory = path.join(directory, 'local', '')
+  makedirs(root)
+  makedirs(backups_directory)
+  host_key = RSAKey.generate(bits=2048)
+  host_key.write_private_key_file(filename=path.join(directory, 'host_key'))
+  server = started_server(
+    host_key_filename=path.join(directory, 'host_key'),
+    root=root,
+    server_options={
+      **default_server_options,
+      'backup_size': arguments.backup_size,
+      'export_size': arguments.export_size,
+      'write_delay_seconds': 0.0,
+      'latency_seconds': arguments.latency,
+      'bandwidth_bytes_per_second': arguments.bandwidth
+    }
+  )
+  try:
+    return fastest_profiles(
+      routerboards_to_measure=routerboards(
+        quantity=arguments.devices,
+        port=server['port'],
+        client_key=RSAKey.generate(bits=2048),
+        backups_directory=backups_directory
+      ),
+      ssh_client_options={'hosts_keys_filename': written_known_hosts(
+        filename=path.join(directory, 'known_hosts'),
+        host_key=host_key,
+        port=server['port']
+      )},
+      profiles=arguments.profiles,
+      repetitions=arguments.repetitions
+    )
+  finally:
+    server['process'].terminate()
+
+
+def report(results):
+  for device, result in results.items():
+    print('{device}: fastest {fastest} ({timings})'.format(
+      device=device,
+      fastest=result['fastest'],
+      timings=', '.join(
+        '{profile}={seconds}'.format(
+          profile=profile,
+          seconds='failed' if seconds is None else '{seconds:.3f}s'.format(seconds=seconds)
+        ) for profile, seconds in result['seconds'].items()
+      )
+    ))
+  print('hosts: {hosts}'.format(hosts=hosts_options(results=results)))
+
+
+def parsed_arguments():
+  parser = ArgumentParser(description='Times the transport profiles of the ssh client on fake RouterOS devices.')
+  parser.add_argument('--devices', type=int, default=1)
+  parser.add_argument('--profiles', nargs='+', choices=list(transport_profiles), default=list(transport_profiles))
+  parser.add_argument('--repetitions', type=int, default=3)
+  parser.add_argument('--backup-size', type=int, default=4 * 1024 * 1024)
+  parser.add_argument('--export-size', type=int, default=default_server_options['export_size'])
+  parser.add_argument('--latency', type=float, default=default_server_options['latency_seconds'])
+  parser.add_argument('--bandwidth', type=int, default=default_server_options['bandwidth_bytes_per_second'])
+  return parser.parse_args()
+
+
+if __name__ == '__main__':
+  with TemporaryDirectory() as benchmark_directory:
+    report(results=profiles_benchmark(arguments=parsed_arguments(), directory=benchmark_directory))
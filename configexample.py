@@ -1,17 +1,74 @@
 from paramiko import RSAKey
 
+retry_policy = {  # optional, network and busy device errors are retried on the idempotent phases only
+  'attempts': 3,
+  'backoff_seconds': 1,
+  'backoff_factor': 2,
+  'maximum_backoff_seconds': 30
+}
+
 ssh_client_options = {
   'hosts_keys_filename': '/path/to/known_hosts',
+  'retry_policy': retry_policy,  # connection and authentication
+  'timeouts': {  # optional, a dead device fails fast and frees its worker
+    'connect_seconds': 10,
+    'banner_seconds': 15,
+    'auth_seconds': 30,
+    'channel_seconds': 30
+  },
+  'keepalive_seconds': 30,  # optional
+  'transport_profile': 'light',  # optional, default, light, bulk, compressed or a dict as below
+  'hosts': {  # optional, options of a host merged over the ones above
+    'some_hostname_or_ip': {'timeouts': {'banner_seconds': 60}},
+    'myauth_hostname_or_ip': {'transport_profile': {  # preferred first, the other algorithms are kept after them
+      'ciphers': ['aes128-gcm@openssh.com'],
+      'macs': ['hmac-sha2-256'],
+      'kex': ['curve25519-sha256@libssh.org'],
+      'compression': False,
+      'window_size': 64 * 1024 * 1024,  # 16 MiB by default, the bandwidth-delay product of the link
+      'max_packet_size': 32 * 1024,
+      'rekey_bytes': 2 ** 30,  # paramiko renegotiates the keys every 512 MiB by default
+      'rekey_packets': 2 ** 30
+    }}
+  },
+  'teardown': {  # optional, by default "quit" is sent and the session is closed
+    'send_quit': False,  # closes the transport directly
+    'timeout_seconds': 5,  # stops waiting for an unresponsive device
+    'background': False  # the next device does not wait for the teardown at all
+  }
 }
 
 routerboards = [
   {
     'name': 'router-identification',
+    'site': 'tower-a',  # optional, groups the routers that share a backhaul for the bandwidth limits
     'backup_options': {
       'backups_directory': '/path/to/save/the/backup/files/with/trailing/slash/',
       'assertion_options': {
         'seconds_to_timeout': 10,
         'minimum_size_in_bytes': 77
+      },
+      'command_timeout_seconds': 60,  # optional, the seconds_to_timeout of the assertion_options by default
+      'retry_policy': retry_policy,  # download and delete
+      'skip_unchanged_backups': True,  # optional, the .backup is only generated when the export changed
+      'maximum_unchanged_age_seconds': 604800,  # optional, the /export misses the users and the keys, so a full
+      # .backup is generated anyway once the last one is older than this (a week by default)
+      'export_store': {  # optional, keeps every export as a snapshot or a line delta to the last snapshot
+        'directory': '/path/to/the/export/store',
+        'snapshot_interval': 10,
+        'remove_plain_exports': True  # the .rsc retrieved is removed once it is stored
+      },
+      'export_index': {  # optional, sqlite inverted index of the exports (see export_index.devices_with), it
+        'filename': '/path/to/exports.sqlite'  # keeps them in plain text, so it is refused with an encryption
+      },
+      'retention': {  # optional, grandfather-father-son retention of the local files of each device and kind
+        'catalogue_filename': '/path/to/catalogue.sqlite',  # may be shared with the myauth retention
+        'policy': {'daily': 7, 'weekly': 4, 'monthly': 12, 'yearly': 5},
+        'batch_size': 100
+      },
+      'sweep': {  # optional, deletes the .backup/.rsc files left on the routerboard by backups that failed
+        'minimum_age_seconds': 3600,  # younger files may belong to a backup still running
+        'dry_run': False
       }
     },
     'backup_password': 'pass',  # used to encrypt the .backup file
@@ -24,11 +81,72 @@ routerboards = [
   }
 ]
 
+fleet_options = {  # optional, passed to routerboard.routerboards_backups (or routerboards_results)
+  'concurrency': {  # devices in flight adapt (AIMD) between floor and ceiling
+    'floor': 2,
+    'ceiling': 16,
+    'maximum_error_rate': 0.2,
+    'maximum_disk_write_latency_seconds': 0.1,
+    'minimum_throughput_ratio': 0.5,  # of the best throughput observed on the same device
+    'history_filename': '/path/to/metrics.jsonl'  # optional, the best throughputs of the previous runs
+  },
+  'schedule': {  # longest expected backups first, interleaving the sites
+    'history_filename': '/path/to/metrics.jsonl',  # written by metrics.json_lines_hook
+    'max_jobs_per_site': 2
+  },
+  'checkpoint': {  # a run interrupted is resumed from the routerboards not finished yet
+    'journal_filename': '/path/to/fleet-journal.jsonl',
+    'max_age_seconds': 86400  # an older journal is cleared instead of resumed, a day by default
+  },
+  'bandwidth_limits': {  # token buckets applied to the downloads
+    'global_mbps': 100,
+    'sites_mbps': {
+      'tower-a': 10
+    }
+  },
+  'cpu_stage': {  # optional, jobs run on worker processes on the files retrieved, in order
+    'jobs': ['gzip', 'sha256'],  # gzip the exports (not the ones on an export_store), sha256 sidecar files
+    'workers': 4,  # the number of cores by default
+    'max_pending_jobs': 8  # the downloads wait while as many jobs are pending, twice the workers by default
+  },
+  'durability': {  # optional, without it the files are still renamed once complete, but never synced
+    'fsync': 'directory',  # none, file (before the rename) or directory (the file and, in batches, its directory)
+    'directory_batch_size': 64  # renames between the syncs of the directories, which are synced at the end too
+  }
+}
+
+# the storage of the fleet_options, the filesystem by default - the tarball and the object store are refused with
+# the features that read the files back (skip_unchanged_backups, export_store, export_index, retention, checkpoint
+# and cpu_stage), so they are not set with the fleet_options and the routerboards above
+tarball_storage_options = {
+  'backend': 'tarball',  # filesystem, tarball or object_store
+  'filename': '/path/to/backups-{datetime:%Y%m%d%H%M%S}.tar'  # one tarball for each run
+}
+
+object_store_options = {  # the storage of the fleet_options on an object store, boto3 must be installed
+  'backend': 'object_store',
+  'bucket': 'backups',
+  'prefix': 'routerboards/',  # optional, prepended to the filenames
+  'client_options': {  # optional, passed to boto3.client('s3'), the credentials are the ones of boto3 by default
+    'endpoint_url': 'http://minio.example.com:9000'  # for MinIO or any other S3 compatible store
+  },
+  'part_size': 8 * 1024 * 1024,  # optional, at least 5 MiB
+  'max_concurrency': 4  # optional, parts uploaded at a time for the whole run
+}
+
 myauth = {
   'backup_settings': {
     'local_backups_directory': '/path/to/save/the/backup/files/with/trailing/slash/',
     'remote_backups_directory': '/admin/backup/',
-    'keeping_backups_quantity': 7  # backups older then this number of days will be deleted from the server
+    'keeping_backups_quantity': 7,  # backups older then this number of days will be deleted from the server
+    'retry_policy': retry_policy,  # list, download and delete
+    'encryption': {  # optional, on a routerboard without export_index too, encrypts the files as they are retrieved
+      'key_filename': '/path/to/backups.key'  # 32 random bytes, see encryption.generated_key
+    },
+    'retention': {  # optional, local retention of the backups retrieved, as in the routerboard backup_options
+      'catalogue_filename': '/path/to/catalogue.sqlite',
+      'policy': {'daily': 7, 'weekly': 4, 'monthly': 12}
+    }
   },
   'credentials': {
     'username': 'some_username',
@@ -37,3 +155,11 @@ myauth = {
     'pkey': RSAKey(filename='/path/to/private_key')
   }
 }
+
+myauths = [  # several MyAuth servers (and replicas) backed up concurrently by myauth.myauths_backups
+  myauth
+]
+
+myauths_cpu_stage_options = {'jobs': ['sha256']}  # optional, the cpu_stage_options of myauth.myauths_backups
+myauths_durability_options = {'fsync': 'file'}  # optional, the durability_options of myauth.myauths_backups
+myauths_storage_options = {'backend': 'filesystem'}  # optional, the storage_options of myauth.myauths_backups
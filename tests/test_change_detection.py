@@ -0,0 +1,157 @@
+from datetime import datetime
+from json import dumps, loads
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from backup.change_detection import export_fingerprint, fingerprint_filename, stored_fingerprint, unchanged_backup, \
+  saved_fingerprint, is_expired
+from backup.encryption import EncryptedFile
+
+
+def written_export(filename, header):
+  with open(filename, 'w') as export_script:
+    export_script.write(str(
+      '{header}\n'
+      '# software id = ABCD-1234\n'
+      '/interface bridge\n'
+      'add name=bridge1\n'
+    ).format(header=header))
+  return filename
+
+
+class TestFunctions(TestCase):
+
+  def test_export_fingerprint(self):
+    with TemporaryDirectory() as directory:
+      first_export = written_export(
+        filename=path.join(directory, 'first.rsc'),
+        header='# jan/02/2020 10:00:00 by RouterOS 6.48.6'
+      )
+      second_export = written_export(
+        filename=path.join(directory, 'second.rsc'),
+        header='# 2024-01-03 11:30:00 by RouterOS 7.13'
+      )
+      self.assertEqual(
+        first=export_fingerprint(filename=first_export),
+        second=export_fingerprint(filename=second_export),
+        msg='Ignores the header with the time of the export'
+      )
+
+      with open(second_export, 'a') as export_script:
+        export_script.write('add name=bridge2\n')
+      self.assertNotEqual(
+        first=export_fingerprint(filename=first_export),
+        second=export_fingerprint(filename=second_export),
+        msg='Changes when the configuration changes'
+      )
+
+      key = b'k' * 32
+      with open(second_export, 'rb') as plain, EncryptedFile(
+        file=open('{export}.enc'.format(export=second_export), 'wb'),
+        key=key
+      ) as encrypted_export:
+        encrypted_export.write(plain.read())
+      self.assertEqual(
+        first=export_fingerprint(filename=second_export),
+        second=export_fingerprint(filename='{export}.enc'.format(export=second_export), key=key),
+        msg='Fingerprints the plain content of an encrypted export'
+      )
+
+  def test_fingerprint_filename(self):
+    self.assertEqual(
+      first='/backups/rtr-a.fingerprint',
+      second=fingerprint_filename(device_id='rtr-a', backups_directory='/backups/'),
+      msg='Returns the fingerprint file of the device on the backups directory'
+    )
+
+  def test_stored_fingerprint(self):
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'rtr-a.fingerprint')
+      self.assertEqual(
+        first={},
+        second=stored_fingerprint(filename=filename),
+        msg='Returns nothing when no fingerprint was stored yet'
+      )
+      with open(filename, 'w') as fingerprint_file:
+        fingerprint_file.write('{"fingerprint": "abc", "backup": "/backups/rtr-a.backup"}')
+      self.assertEqual(
+        first={'fingerprint': 'abc', 'backup': '/backups/rtr-a.backup'},
+        second=stored_fingerprint(filename=filename),
+        msg='Returns the fingerprint stored'
+      )
+
+  def test_unchanged_backup(self):
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'rtr-a.fingerprint')
+      backup_localpath = path.join(directory, 'rtr-a.backup')
+      saved_fingerprint(filename=filename, fingerprint='abc', backup_localpath=backup_localpath)
+
+      self.assertIsNone(
+        obj=unchanged_backup(filename=filename, fingerprint='abc'),
+        msg='Returns None when the last backup is not on disk anymore'
+      )
+
+      open(backup_localpath, 'w').close()
+      self.assertEqual(
+        first=backup_localpath,
+        second=unchanged_backup(filename=filename, fingerprint='abc'),
+        msg='Returns the last backup when the fingerprint did not change'
+      )
+      self.assertIsNone(
+        obj=unchanged_backup(filename=filename, fingerprint='def'),
+        msg='Returns None when the fingerprint changed'
+      )
+      self.assertIsNone(
+        obj=unchanged_backup(filename=filename, fingerprint=None),
+        msg='Returns None when there is no fingerprint to compare'
+      )
+      self.assertIsNone(
+        obj=unchanged_backup(filename=path.join(directory, 'rtr-b.fingerprint'), fingerprint='abc'),
+        msg='Returns None when no fingerprint was stored yet'
+      )
+      self.assertIsNone(
+        obj=unchanged_backup(filename=filename, fingerprint='abc', maximum_age_seconds=-1),
+        msg='Returns None when the last backup is older than the maximum age, so a full backup is made again'
+      )
+      with open(filename, 'w') as fingerprint_file:
+        fingerprint_file.write(dumps({'fingerprint': 'abc', 'backup': backup_localpath}))
+      self.assertIsNone(
+        obj=unchanged_backup(filename=filename, fingerprint='abc'),
+        msg='Returns None when the last backup is not dated'
+      )
+
+  @patch(target='backup.change_detection.datetime')
+  def test_is_expired(self, mock_datetime):
+    mock_datetime.now.return_value = datetime(year=2020, month=1, day=8)
+    mock_datetime.fromisoformat = datetime.fromisoformat
+    self.assertFalse(
+      expr=is_expired(stored={'saved': '2020-01-02T00:00:00'}, maximum_age_seconds=604800),
+      msg='Is not expired when the backup was saved within the maximum age'
+    )
+    self.assertTrue(
+      expr=is_expired(stored={'saved': '2020-01-01T00:00:00'}, maximum_age_seconds=86400),
+      msg='Is expired when the backup was saved before the maximum age'
+    )
+    self.assertTrue(
+      expr=is_expired(stored={'fingerprint': 'abc', 'backup': '/backups/rtr-a.backup'}, maximum_age_seconds=604800),
+      msg='Is expired when the backup is not dated, so its age is unknown'
+    )
+
+  @patch(target='backup.change_detection.datetime')
+  def test_saved_fingerprint(self, mock_datetime):
+    mock_datetime.now.return_value = datetime(year=2020, month=1, day=1)
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'rtr-a.fingerprint')
+      self.assertEqual(
+        first=filename,
+        second=saved_fingerprint(filename=filename, fingerprint='abc', backup_localpath='/backups/rtr-a.backup'),
+        msg='Returns the filename passed'
+      )
+      with open(filename) as fingerprint_file:
+        self.assertEqual(
+          first={'fingerprint': 'abc', 'backup': '/backups/rtr-a.backup', 'saved': '2020-01-01T00:00:00'},
+          second=loads(fingerprint_file.read()),
+          msg='Stores the fingerprint with the backup it belongs to and the date it was saved'
+        )
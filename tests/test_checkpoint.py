@@ -0,0 +1,204 @@
+from datetime import datetime
+from hashlib import sha256
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import call, patch
+
+from backup.checkpoint import CheckpointJournal, journal_entries, is_stale, file_checksum, file_record, \
+  reclaimed_leftovers
+
+
+def written_file(filename, content):
+  with open(filename, 'wb') as written:
+    written.write(content)
+  return filename
+
+
+class TestCheckpointJournal(TestCase):
+
+  def test_init(self):
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'journal.jsonl')
+      journal = CheckpointJournal(filename=filename)
+      self.assertEqual(
+        first=({}, set()),
+        second=(journal.finished_files, journal.interrupted),
+        msg='Starts with nothing finished nor interrupted when there is no journal yet'
+      )
+
+      journal.started(device='rtr-a')
+      journal.finished(device='rtr-a', localpaths=[None])
+      journal.started(device='rtr-b')
+      journal = CheckpointJournal(filename=filename)
+      self.assertEqual(
+        first={'rtr-a': [None]},
+        second=journal.finished_files,
+        msg='Loads the files of the routerboards finished on the journal'
+      )
+      self.assertEqual(
+        first={'rtr-b'},
+        second=journal.interrupted,
+        msg='Loads the routerboards started and not finished on the journal as interrupted'
+      )
+      self.assertEqual(
+        first=journal_entries(filename=filename)[0]['started'],
+        second=journal.run_started,
+        msg='Keeps the start of the run that was interrupted'
+      )
+
+      with patch(target='backup.checkpoint.is_stale', return_value=True):
+        journal = CheckpointJournal(filename=filename, max_age_seconds=60)
+      self.assertEqual(
+        first=({}, set(), None, False),
+        second=(journal.finished_files, journal.interrupted, journal.run_started, path.exists(filename)),
+        msg='Clears the journal older than the maximum age, so its routerboards are backed up again'
+      )
+
+  def test_finished(self):
+    with TemporaryDirectory() as directory:
+      journal = CheckpointJournal(filename=path.join(directory, 'journal.jsonl'))
+      localpath = written_file(filename=path.join(directory, 'rtr-a.rsc'), content=b'export')
+      self.assertEqual(
+        first={
+          'device': 'rtr-a',
+          'status': 'finished',
+          'files': [file_record(localpath=localpath), None]
+        },
+        second=journal.finished(device='rtr-a', localpaths=[localpath, None]),
+        msg='Journals the routerboard as finished with the path, size and checksum of its files'
+      )
+      self.assertEqual(
+        first=[
+          {'status': 'run', 'started': journal.run_started},
+          {'device': 'rtr-a', 'status': 'finished', 'files': [file_record(localpath=localpath), None]}
+        ],
+        second=journal_entries(filename=journal.filename),
+        msg='Appends the entry to the journal file, after the start of the run on a new journal'
+      )
+      journal.started(device='rtr-b')
+      self.assertEqual(
+        first=1,
+        second=[entry['status'] for entry in journal_entries(filename=journal.filename)].count('run'),
+        msg='Dates the journal only once'
+      )
+
+  def test_is_finished(self):
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'journal.jsonl')
+      localpath = written_file(filename=path.join(directory, 'rtr-a.rsc'), content=b'export')
+      CheckpointJournal(filename=filename).finished(device='rtr-a', localpaths=[localpath, None])
+      journal = CheckpointJournal(filename=filename)
+
+      self.assertTrue(
+        expr=journal.is_finished(device='rtr-a'),
+        msg='Is finished when the files journaled are still on disk with the same size'
+      )
+      self.assertFalse(
+        expr=journal.is_finished(device='rtr-b'),
+        msg='Is not finished when the routerboard was not journaled as finished'
+      )
+      written_file(filename=localpath, content=b'cut')
+      self.assertFalse(
+        expr=journal.is_finished(device='rtr-a'),
+        msg='Is not finished when a file journaled changed its size'
+      )
+
+  def test_finished_localpaths(self):
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'journal.jsonl')
+      localpath = written_file(filename=path.join(directory, 'rtr-a.rsc'), content=b'export')
+      CheckpointJournal(filename=filename).finished(device='rtr-a', localpaths=[None, localpath])
+      self.assertEqual(
+        first=[None, localpath],
+        second=CheckpointJournal(filename=filename).finished_localpaths(device='rtr-a'),
+        msg='Returns the paths of the files journaled for the routerboard'
+      )
+
+  def test_cleared(self):
+    with TemporaryDirectory() as directory:
+      journal = CheckpointJournal(filename=path.join(directory, 'journal.jsonl'))
+      journal.started(device='rtr-a')
+      self.assertEqual(
+        first=journal.filename,
+        second=journal.cleared(),
+        msg='Returns the journal file'
+      )
+      self.assertFalse(
+        expr=path.exists(journal.filename),
+        msg='Removes the journal file'
+      )
+      journal.cleared()
+
+
+class TestFunctions(TestCase):
+
+  @patch(target='backup.checkpoint.datetime')
+  def test_is_stale(self, mock_datetime):
+    mock_datetime.now.return_value = datetime(year=2020, month=1, day=2)
+    mock_datetime.fromisoformat = datetime.fromisoformat
+    self.assertFalse(
+      expr=is_stale(entries=[], max_age_seconds=60),
+      msg='Is not stale when there is no journal'
+    )
+    self.assertFalse(
+      expr=is_stale(entries=[{'status': 'run', 'started': '2020-01-01T12:00:00'}], max_age_seconds=86400),
+      msg='Is not stale when the run started within the maximum age'
+    )
+    self.assertTrue(
+      expr=is_stale(entries=[{'status': 'run', 'started': '2020-01-01T00:00:00'}], max_age_seconds=3600),
+      msg='Is stale when the run started before the maximum age'
+    )
+    self.assertTrue(
+      expr=is_stale(entries=[{'device': 'rtr-a', 'status': 'started'}], max_age_seconds=86400),
+      msg='Is stale when the journal has no start of the run, so its age is unknown'
+    )
+
+  def test_journal_entries(self):
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'journal.jsonl')
+      self.assertEqual(
+        first=[],
+        second=journal_entries(filename=filename),
+        msg='Returns no entries when there is no journal'
+      )
+      written_file(filename=filename, content=b'{"device": "rtr-a"}\n{"device": "rt')
+      self.assertEqual(
+        first=[{'device': 'rtr-a'}],
+        second=journal_entries(filename=filename),
+        msg='Returns the entries of the journal, leaving out a last line cut by a crash'
+      )
+
+  def test_file_checksum(self):
+    with TemporaryDirectory() as directory:
+      self.assertEqual(
+        first=sha256(b'content').hexdigest(),
+        second=file_checksum(localpath=written_file(filename=path.join(directory, 'file'), content=b'content')),
+        msg='Returns the sha256 of the file passed'
+      )
+
+  def test_file_record(self):
+    self.assertIsNone(
+      obj=file_record(localpath=None),
+      msg='Returns None for a file that was not retrieved'
+    )
+    with TemporaryDirectory() as directory:
+      localpath = written_file(filename=path.join(directory, 'file'), content=b'content')
+      self.assertEqual(
+        first={'path': localpath, 'size': 7, 'sha256': sha256(b'content').hexdigest()},
+        second=file_record(localpath=localpath),
+        msg='Returns the path, the size and the checksum of the file passed'
+      )
+
+  @patch(target='backup.checkpoint.swept_remote_files', return_value={'files': ['rtr_2020-01-01-10-00-00.backup']})
+  def test_reclaimed_leftovers(self, mock_swept_remote_files):
+    self.assertEqual(
+      first=['rtr_2020-01-01-10-00-00.backup'],
+      second=reclaimed_leftovers(sftp='sftp', device_id='rtr', metrics='metrics'),
+      msg='Returns the leftover files deleted'
+    )
+    self.assertEqual(
+      first=[call(sftp='sftp', device_id='rtr', sweep_options={'minimum_age_seconds': 0}, metrics='metrics')],
+      second=mock_swept_remote_files.call_args_list,
+      msg='Sweeps every file generated for the routerboard, however recent'
+    )
@@ -0,0 +1,161 @@
+from os import listdir
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import sleep
+from unittest import TestCase
+
+from backup.concurrency import AdaptiveConcurrency, disk_write_latency
+
+
+class TestAdaptiveConcurrency(TestCase):
+
+  def setUp(self):
+    self.concurrency = AdaptiveConcurrency(floor=2, ceiling=4)
+
+  def test_init(self):
+    self.assertEqual(
+      first=2,
+      second=self.concurrency.limit,
+      msg='Starts at the floor when no initial limit is passed'
+    )
+    self.assertEqual(
+      first=3,
+      second=AdaptiveConcurrency(floor=2, ceiling=4, initial=3).limit,
+      msg='Starts at the initial limit passed'
+    )
+    self.assertEqual(
+      first=({}, {'rtr-a': 1000}),
+      second=(
+        self.concurrency.best_throughputs,
+        AdaptiveConcurrency(floor=2, ceiling=4, best_throughputs={'rtr-a': 1000}).best_throughputs
+      ),
+      msg='Starts from the best throughputs passed, observed by the previous runs'
+    )
+
+  def test_error_rate(self):
+    self.assertEqual(
+      first=0,
+      second=self.concurrency.error_rate,
+      msg='Is zero when nothing was observed yet'
+    )
+    self.concurrency.outcomes.extend([True, False, False, False])
+    self.assertEqual(
+      first=0.25,
+      second=self.concurrency.error_rate,
+      msg='Is the ratio of failed outcomes observed'
+    )
+
+  def test_slot(self):
+    with self.concurrency.slot() as epoch:
+      self.assertEqual(
+        first=self.concurrency.epoch,
+        second=epoch,
+        msg='Yields the epoch in which the job started'
+      )
+      self.assertEqual(
+        first=1,
+        second=self.concurrency.in_flight,
+        msg='Counts the job in flight while the slot is held'
+      )
+    self.assertEqual(
+      first=0,
+      second=self.concurrency.in_flight,
+      msg='Releases the slot when the job finishes'
+    )
+
+  def test_slot_waits_for_the_limit(self):
+    held = []
+
+    def job():
+      with self.concurrency.slot():
+        held.append(self.concurrency.in_flight)
+        sleep(0.01)
+
+    jobs = [Thread(target=job) for _ in range(6)]
+    for current_job in jobs:
+      current_job.start()
+    for current_job in jobs:
+      current_job.join()
+    self.assertLessEqual(
+      a=max(held),
+      b=2,
+      msg='Never lets more jobs than the limit run at the same time'
+    )
+
+  def test_is_congested(self):
+    self.assertFalse(
+      expr=self.concurrency.is_congested(device='rtr-a', throughput=None, disk_write_latency=None),
+      msg='Is not congested when there are no signals'
+    )
+    self.assertTrue(
+      expr=self.concurrency.is_congested(device='rtr-a', throughput=None, disk_write_latency=1),
+      msg='Is congested when the disk write latency is over the maximum'
+    )
+    self.concurrency.best_throughputs['rtr-a'] = 100
+    self.assertTrue(
+      expr=self.concurrency.is_congested(device='rtr-a', throughput=49, disk_write_latency=None),
+      msg='Is congested when the throughput falls under the minimum ratio of the best throughput of the device'
+    )
+    self.assertFalse(
+      expr=self.concurrency.is_congested(device='rtr-a', throughput=50, disk_write_latency=None),
+      msg='Is not congested when the throughput is over the minimum ratio of the best throughput of the device'
+    )
+    self.assertFalse(
+      expr=self.concurrency.is_congested(device='rtr-b', throughput=10, disk_write_latency=None),
+      msg='Is not congested by a device slower than the others, only by a device slower than it used to be'
+    )
+    self.concurrency.outcomes.extend([True, False])
+    self.assertTrue(
+      expr=self.concurrency.is_congested(device='rtr-a', throughput=None, disk_write_latency=None),
+      msg='Is congested when the error rate is over the maximum'
+    )
+
+  def test_observed(self):
+    self.assertEqual(
+      first=2.5,
+      second=self.concurrency.observed(epoch=0, failed=False, device='rtr-a', throughput=100, disk_write_latency=0.001),
+      msg='Increases the limit additively by the inverse of the limit when not congested'
+    )
+    self.assertEqual(
+      first={'rtr-a': 100},
+      second=self.concurrency.best_throughputs,
+      msg='Keeps the best throughput observed on each device'
+    )
+    for _ in range(10):
+      self.concurrency.observed(epoch=0, failed=False, device='rtr-b', throughput=10)
+    self.assertEqual(
+      first=4,
+      second=self.concurrency.limit,
+      msg='Never increases the limit over the ceiling, nor decreases it for a device that is slow on its own'
+    )
+    self.assertEqual(
+      first=2,
+      second=self.concurrency.observed(epoch=0, failed=False, device='rtr-a', throughput=10),
+      msg='Decreases the limit multiplicatively when congested'
+    )
+    self.assertEqual(
+      first=2,
+      second=self.concurrency.observed(epoch=0, failed=False, device='rtr-a', throughput=10),
+      msg='Does not decrease the limit again for jobs started before the last decrease'
+    )
+    self.assertEqual(
+      first=2,
+      second=self.concurrency.observed(epoch=1, failed=False, device='rtr-a', throughput=10),
+      msg='Never decreases the limit under the floor'
+    )
+
+
+class TestFunctions(TestCase):
+
+  def test_disk_write_latency(self):
+    with TemporaryDirectory() as directory:
+      self.assertGreater(
+        a=disk_write_latency(directory=directory),
+        b=0,
+        msg='Returns the seconds spent writing and syncing a file on the directory passed'
+      )
+      self.assertEqual(
+        first=[],
+        second=listdir(directory),
+        msg='Removes the file written'
+      )
@@ -0,0 +1,203 @@
+from gzip import decompress
+from hashlib import sha256
+from os import listdir, path
+from pathlib import PurePath
+from tempfile import TemporaryDirectory
+from threading import Thread
+from unittest import TestCase
+from unittest.mock import MagicMock, call, patch
+
+from backup.cpu_stage import CPUStage, PendingFile, gzipped_export, checksum_sidecar, processed_file, is_processed, \
+  resolved_files, finished_results, open_cpu_stage
+
+
+def written_file(filename, content):
+  with open(filename, 'wb') as written:
+    written.write(content)
+  return filename
+
+
+class TestCPUStage(TestCase):
+
+  def test_init(self):
+    with patch(target='backup.cpu_stage.cpu_count', return_value=3):
+      cpu_stage = CPUStage(jobs=['sha256'])
+    self.assertEqual(
+      first=(['sha256'], 3),
+      second=(cpu_stage.jobs, cpu_stage.workers),
+      msg='Runs the jobs passed on as many workers as cores by default'
+    )
+    self.assertEqual(
+      first=6,
+      second=cpu_stage.pending._value,
+      msg='Lets twice as many jobs as workers wait for a worker by default'
+    )
+    cpu_stage.shutdown()
+
+  def test_pending_files(self):
+    with TemporaryDirectory() as directory:
+      backup = written_file(filename=path.join(directory, 'rtr.backup'), content=b'backup')
+      script = written_file(filename=path.join(directory, 'rtr.rsc'), content=b'/ip address\n' * 100)
+      cpu_stage = CPUStage(jobs=['gzip', 'sha256'], workers=1, max_pending_jobs=1)
+      self.assertEqual(
+        first='spawn',
+        second=cpu_stage.executor._mp_context.get_start_method(),
+        msg='Spawns the worker processes instead of forking the transfer threads'
+      )
+      files = cpu_stage.pending_files(localpaths=[PurePath(backup), None, script])
+      self.assertEqual(
+        first=[PendingFile, type(None), PendingFile],
+        second=[type(file) for file in files],
+        msg='Returns the files still pending on the worker processes, without waiting for them'
+      )
+      self.assertEqual(
+        first=[PurePath(backup), None, '{script}.gz'.format(script=script)],
+        second=resolved_files(files=files),
+        msg='Resolves the files processed on the worker processes, as the type of path passed'
+      )
+      cpu_stage.shutdown()
+      self.assertEqual(
+        first=['rtr.backup', 'rtr.backup.sha256', 'rtr.rsc.gz', 'rtr.rsc.gz.sha256'],
+        second=sorted(listdir(directory)),
+        msg='Runs the jobs passed in order on each file'
+      )
+
+  def test_submitted(self):
+    cpu_stage = CPUStage(jobs=['sha256'], workers=1, max_pending_jobs=1)
+    cpu_stage.executor.shutdown()
+    executor = cpu_stage.executor = MagicMock()
+    first_job = cpu_stage.submitted(localpath=PurePath('/backups/first'))
+    self.assertEqual(
+      first=[call(processed_file, localpath='/backups/first', jobs=['sha256'])],
+      second=executor.submit.call_args_list,
+      msg='Submits the jobs on the file passed to the worker processes'
+    )
+
+    second_job = Thread(target=cpu_stage.submitted, kwargs={'localpath': '/backups/second'})
+    second_job.start()
+    second_job.join(timeout=0.05)
+    self.assertTrue(
+      expr=second_job.is_alive(),
+      msg='Holds the caller while the stage has as many pending jobs as it allows'
+    )
+    first_job.add_done_callback.call_args.args[0](first_job)
+    second_job.join(timeout=5)
+    self.assertEqual(
+      first=2,
+      second=executor.submit.call_count,
+      msg='Lets the caller go once a pending job is done'
+    )
+
+
+class TestFunctions(TestCase):
+
+  def test_gzipped_export(self):
+    with TemporaryDirectory() as directory:
+      script = written_file(filename=path.join(directory, 'rtr.rsc'), content=b'/ip address\n')
+      self.assertEqual(
+        first='{script}.gz'.format(script=script),
+        second=gzipped_export(localpath=script),
+        msg='Returns the export compressed'
+      )
+      with open('{script}.gz'.format(script=script), 'rb') as compressed:
+        self.assertEqual(
+          first=b'/ip address\n',
+          second=decompress(compressed.read()),
+          msg='Compresses the export with gzip'
+        )
+      self.assertFalse(
+        expr=path.exists(script),
+        msg='Removes the plain export'
+      )
+      backup = written_file(filename=path.join(directory, 'rtr.backup'), content=b'backup')
+      self.assertEqual(
+        first=backup,
+        second=gzipped_export(localpath=backup),
+        msg='Leaves the files other than the exports as they are'
+      )
+
+  def test_checksum_sidecar(self):
+    with TemporaryDirectory() as directory:
+      backup = written_file(filename=path.join(directory, 'rtr.backup'), content=b'backup')
+      self.assertEqual(
+        first=backup,
+        second=checksum_sidecar(localpath=backup),
+        msg='Returns the file passed'
+      )
+      with open('{backup}.sha256'.format(backup=backup)) as sidecar:
+        self.assertEqual(
+          first='{checksum}  rtr.backup\n'.format(checksum=sha256(b'backup').hexdigest()),
+          second=sidecar.read(),
+          msg='Writes the sha256 of the file next to it as sha256sum does'
+        )
+
+  def test_processed_file(self):
+    with TemporaryDirectory() as directory:
+      script = written_file(filename=path.join(directory, 'rtr.rsc'), content=b'/ip address\n')
+      self.assertEqual(
+        first='{script}.gz'.format(script=script),
+        second=processed_file(localpath=script, jobs=['gzip', 'sha256']),
+        msg='Returns the file left by the last job'
+      )
+      self.assertTrue(
+        expr=path.exists('{script}.gz.sha256'.format(script=script)),
+        msg='Runs each job on the file left by the one before it'
+      )
+
+  def test_is_processed(self):
+    done, running = MagicMock(), MagicMock()
+    done.done.return_value, running.done.return_value = True, False
+    self.assertTrue(
+      expr=is_processed(files=['/backups/rtr.rsc', None, PendingFile(localpath='/backups/rtr.backup', future=done)]),
+      msg='Has the files processed when no job on them is pending'
+    )
+    self.assertFalse(
+      expr=is_processed(files=[PendingFile(localpath='/backups/rtr.backup', future=running)]),
+      msg='Has the files not processed while a job on them is pending'
+    )
+
+  def test_finished_results(self):
+    running = MagicMock()
+    running.done.return_value = False
+    unfinished_results = [
+      (0, {'name': 'slow', 'files': [PendingFile(localpath='/backups/slow.backup', future=running)]}),
+      (1, {'name': 'fast', 'files': ['/backups/fast.backup']})
+    ]
+    results = finished_results(
+      unfinished_results=iter(unfinished_results),
+      finished=lambda unfinished: unfinished['name']
+    )
+    self.assertEqual(
+      first=(1, 'fast'),
+      second=next(results),
+      msg='Finishes the results as soon as their files are processed, not in the order they are retrieved'
+    )
+    self.assertEqual(
+      first=[(0, 'slow')],
+      second=list(results),
+      msg='Finishes the results still pending once every result is retrieved'
+    )
+
+  @patch(target='backup.cpu_stage.CPUStage')
+  def test_open_cpu_stage(self, mock_cpu_stage):
+    with open_cpu_stage(cpu_stage_options=None) as cpu_stage:
+      self.assertIsNone(
+        obj=cpu_stage,
+        msg='Has no cpu stage without options'
+      )
+    with open_cpu_stage(cpu_stage_options={'jobs': ['sha256']}) as cpu_stage:
+      self.assertEqual(
+        first=mock_cpu_stage.return_value,
+        second=cpu_stage,
+        msg='Opens a cpu stage with the options passed'
+      )
+      self.assertEqual(
+        first=([call(jobs=['sha256'])], []),
+        second=(mock_cpu_stage.call_args_list, cpu_stage.shutdown.mock_calls),
+        msg='Keeps the cpu stage while the context is open'
+      )
+    self.assertEqual(
+      first=[call()],
+      second=cpu_stage.shutdown.mock_calls,
+      msg='Shuts the cpu stage down after the context is closed'
+    )
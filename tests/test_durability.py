@@ -0,0 +1,140 @@
+from os import listdir, path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock, call, patch
+
+from backup.durability import Durability, AtomicFile
+
+
+class TestDurability(TestCase):
+
+  def test_init(self):
+    durability = Durability()
+    self.assertEqual(
+      first=('directory', 64),
+      second=(durability.fsync, durability.directory_batch_size),
+      msg='Syncs the files and their directories, in batches of 64 renames, by default'
+    )
+    with self.assertRaises(expected_exception=ValueError, msg='Refuses an unknown fsync policy'):
+      Durability(fsync='always')
+
+  @patch(target='backup.durability.fsync')
+  def test_synced_file(self, mock_fsync):
+    local_file = MagicMock()
+    self.assertEqual(
+      first=local_file,
+      second=Durability(fsync='none').synced_file(local_file=local_file),
+      msg='Returns the file passed'
+    )
+    self.assertEqual(
+      first=[],
+      second=mock_fsync.mock_calls,
+      msg='Does not sync the file when the policy is none'
+    )
+    Durability(fsync='file').synced_file(local_file=local_file)
+    self.assertEqual(
+      first=(1, [call(local_file.fileno.return_value)]),
+      second=(local_file.flush.call_count, mock_fsync.call_args_list),
+      msg='Flushes and syncs the file passed'
+    )
+
+  @patch(target='backup.durability.fsync')
+  def test_renamed(self, mock_fsync):
+    with TemporaryDirectory() as first_directory, TemporaryDirectory() as second_directory:
+      self.assertEqual(
+        first=[],
+        second=Durability(fsync='file').renamed(localpath=path.join(first_directory, 'rtr.backup')),
+        msg='Does not sync the directories when the policy is not directory'
+      )
+      durability = Durability(fsync='directory', directory_batch_size=3)
+      for localpath in [path.join(first_directory, 'rtr.backup'), path.join(second_directory, 'rtr.backup')]:
+        self.assertEqual(
+          first=[],
+          second=durability.renamed(localpath=localpath),
+          msg='Holds the sync of the directories until the batch is full'
+        )
+      self.assertEqual(
+        first=sorted([first_directory, second_directory]),
+        second=durability.renamed(localpath=path.join(first_directory, 'rtr.rsc')),
+        msg='Syncs each directory of the batch once when the batch is full'
+      )
+      self.assertEqual(
+        first=2,
+        second=mock_fsync.call_count,
+        msg='Syncs one descriptor for each directory'
+      )
+      self.assertEqual(
+        first=[],
+        second=durability.renamed(localpath=path.join(first_directory, 'other.backup')),
+        msg='Starts a new batch'
+      )
+
+  @patch(target='backup.durability.fsync', side_effect=OSError)
+  def test_synced_directories(self, _):
+    with TemporaryDirectory() as directory:
+      durability = Durability(fsync='directory')
+      durability.renamed(localpath=path.join(directory, 'rtr.backup'))
+      with self.assertRaises(expected_exception=OSError):
+        durability.synced_directories()
+      self.assertEqual(
+        first=[],
+        second=Durability(fsync='directory').synced_directories(),
+        msg='Syncs nothing when no file was renamed'
+      )
+
+
+class TestAtomicFile(TestCase):
+
+  def test_close(self):
+    with TemporaryDirectory() as directory:
+      localpath = path.join(directory, 'rtr.backup')
+      durability = MagicMock()
+      atomic_file = AtomicFile(localpath=localpath, durability=durability)
+      self.assertEqual(
+        first=6,
+        second=atomic_file.write(b'backup'),
+        msg='Returns the size of the data written'
+      )
+      self.assertEqual(
+        first=['rtr.backup.part'],
+        second=listdir(directory),
+        msg='Writes to a temporary file on the same directory'
+      )
+      atomic_file.close()
+      self.assertEqual(
+        first=['rtr.backup'],
+        second=listdir(directory),
+        msg='Renames the temporary file to the localpath once it is closed'
+      )
+      with open(localpath, 'rb') as local_file:
+        self.assertEqual(
+          first=b'backup',
+          second=local_file.read(),
+          msg='Keeps the data written'
+        )
+      self.assertEqual(
+        first=([call(local_file=atomic_file.file)], [call(localpath=localpath)]),
+        second=(durability.synced_file.call_args_list, durability.renamed.call_args_list),
+        msg='Syncs the file before renaming it and accounts the rename on the durability passed'
+      )
+
+      with AtomicFile(localpath=path.join(directory, 'rtr.rsc')) as atomic_file:
+        atomic_file.write(b'/ip address\n')
+      self.assertEqual(
+        first=['rtr.backup', 'rtr.rsc'],
+        second=sorted(listdir(directory)),
+        msg='Renames the file without a durability, when the context is closed'
+      )
+
+  def test_discarded(self):
+    with TemporaryDirectory() as directory:
+      with self.assertRaises(expected_exception=EOFError):
+        with AtomicFile(localpath=path.join(directory, 'rtr.backup')) as atomic_file:
+          atomic_file.write(b'partial')
+          raise EOFError
+      self.assertEqual(
+        first=[],
+        second=listdir(directory),
+        msg='Leaves nothing behind, under any name, when the file is not complete'
+      )
+
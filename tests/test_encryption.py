@@ -0,0 +1,179 @@
+from os import path, stat
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from cryptography.exceptions import InvalidTag
+
+from backup.encryption import generated_key, encryption_key, local_filename, chunk_nonce, EncryptedFile, \
+  decrypted_chunks, plain_file, decrypted_file
+
+key = b'k' * 32
+
+
+def encrypted(filename, content):
+  with EncryptedFile(file=open(filename, 'wb'), key=key) as encrypted_file:
+    encrypted_file.write(content)
+  return filename
+
+
+def decrypted(filename):
+  with open(filename, 'rb') as encrypted_file:
+    return b''.join(decrypted_chunks(encrypted_file=encrypted_file, key=key))
+
+
+class TestEncryptedFile(TestCase):
+
+  @patch(target='backup.encryption.plain_chunk_size', new=4)
+  def test_write(self):
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'rtr.rsc.enc')
+      with EncryptedFile(file=open(filename, 'wb'), key=key) as encrypted_file:
+        for data in [b'abc', b'defgh', b'i']:
+          self.assertEqual(
+            first=len(data),
+            second=encrypted_file.write(data),
+            msg='Returns the size of the data written'
+          )
+        self.assertEqual(
+          first=2,
+          second=encrypted_file.counter,
+          msg='Seals a chunk as soon as more data than a chunk is pending'
+        )
+      self.assertEqual(
+        first=filename,
+        second=encrypted_file.name,
+        msg='Has the name of the file passed'
+      )
+      self.assertEqual(
+        first=8 + 7 + 3 * (4 + 16) - 3,
+        second=stat(filename).st_size,
+        msg='Writes the header and each chunk with its tag'
+      )
+      with open(filename, 'rb') as written:
+        self.assertNotIn(
+          member=b'abc',
+          container=written.read(),
+          msg='Leaves no plain data on the file'
+        )
+      self.assertEqual(
+        first=b'abcdefghi',
+        second=decrypted(filename=filename),
+        msg='Decrypts to the data written'
+      )
+
+  def test_write_interrupted(self):
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'rtr.backup.enc')
+      with self.assertRaises(expected_exception=EOFError):
+        with EncryptedFile(file=open(filename, 'wb'), key=key) as encrypted_file:
+          encrypted_file.write(b'partial')
+          raise EOFError
+      with self.assertRaises(expected_exception=InvalidTag, msg='A transfer interrupted never decrypts'):
+        decrypted(filename=filename)
+
+
+class TestFunctions(TestCase):
+
+  def test_generated_key(self):
+    with TemporaryDirectory() as directory:
+      key_filename = generated_key(key_filename=path.join(directory, 'backups.key'))
+      self.assertEqual(
+        first=(32, 0o600),
+        second=(stat(key_filename).st_size, stat(key_filename).st_mode & 0o777),
+        msg='Writes a random key readable by the owner only'
+      )
+      with self.assertRaises(expected_exception=FileExistsError, msg='Never replaces a key'):
+        generated_key(key_filename=key_filename)
+
+  def test_encryption_key(self):
+    self.assertIsNone(
+      obj=encryption_key(encryption=None),
+      msg='Has no key without encryption options'
+    )
+    with TemporaryDirectory() as directory:
+      key_filename = generated_key(key_filename=path.join(directory, 'backups.key'))
+      with open(key_filename, 'rb') as key_file:
+        self.assertEqual(
+          first=key_file.read(),
+          second=encryption_key(encryption={'key_filename': key_filename}),
+          msg='Reads the key from the key file'
+        )
+      with open(key_filename, 'wb') as key_file:
+        key_file.write(b'short')
+      with self.assertRaises(expected_exception=ValueError, msg='Refuses a key of the wrong size'):
+        encryption_key(encryption={'key_filename': key_filename})
+
+  def test_local_filename(self):
+    self.assertEqual(
+      first=('rtr.backup', 'rtr.backup.enc'),
+      second=(local_filename(filename='rtr.backup', key=None), local_filename(filename='rtr.backup', key=key)),
+      msg='Names the encrypted files after the plain ones'
+    )
+
+  def test_chunk_nonce(self):
+    self.assertEqual(
+      first=b'prefix!\x00\x00\x00\x02\x01',
+      second=chunk_nonce(prefix=b'prefix!', counter=2, last=True),
+      msg='Carries the position of the chunk and whether it is the last one'
+    )
+
+  @patch(target='backup.encryption.plain_chunk_size', new=4)
+  def test_decrypted_chunks(self):
+    with TemporaryDirectory() as directory:
+      filename = encrypted(filename=path.join(directory, 'rtr.rsc.enc'), content=b'12345678')
+      with open(filename, 'rb') as encrypted_file:
+        self.assertEqual(
+          first=[b'1234', b'5678'],
+          second=list(decrypted_chunks(encrypted_file=encrypted_file, key=key)),
+          msg='Yields the plain chunks of the file'
+        )
+
+      with open(filename, 'rb') as encrypted_file:
+        truncated = encrypted_file.read()[:-16]
+      with open(filename, 'wb') as encrypted_file:
+        encrypted_file.write(truncated)
+      with self.assertRaises(expected_exception=InvalidTag, msg='Refuses a file cut at a chunk'):
+        decrypted(filename=filename)
+
+      with open(filename, 'wb') as plain:
+        plain.write(b'/ip address\n')
+      with self.assertRaises(expected_exception=ValueError, msg='Refuses a file not encrypted by the backup'):
+        decrypted(filename=filename)
+
+  def test_plain_file(self):
+    with TemporaryDirectory() as directory:
+      filename = encrypted(filename=path.join(directory, 'rtr.rsc.enc'), content=b'a\nb\n')
+      with plain_file(filename=filename, key=key) as plain:
+        self.assertEqual(
+          first=[b'a\n', b'b\n'],
+          second=list(plain),
+          msg='Returns the plain content of an encrypted file'
+        )
+      with plain_file(filename=filename, key=None) as plain:
+        self.assertEqual(
+          first=filename,
+          second=plain.name,
+          msg='Opens the file as it is without a key'
+        )
+
+  def test_decrypted_file(self):
+    with TemporaryDirectory() as directory:
+      filename = encrypted(filename=path.join(directory, 'rtr.backup.enc'), content=b'backup')
+      self.assertEqual(
+        first=path.join(directory, 'rtr.backup'),
+        second=decrypted_file(filename=filename, key=key),
+        msg='Returns the plain file, named as it was before the encryption'
+      )
+      with open(path.join(directory, 'rtr.backup'), 'rb') as plain:
+        self.assertEqual(
+          first=b'backup',
+          second=plain.read(),
+          msg='Writes the plain content of the file'
+        )
+      renamed = encrypted(filename=path.join(directory, 'renamed'), content=b'backup')
+      self.assertEqual(
+        first='{renamed}.plain'.format(renamed=renamed),
+        second=decrypted_file(filename=renamed, key=key),
+        msg='Writes next to the file passed when it is not named as an encrypted file'
+      )
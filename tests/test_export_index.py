@@ -0,0 +1,230 @@
+from contextlib import closing
+from datetime import datetime
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from backup.export_index import connected_index, export_records, tokens, section_digests, record_id, \
+  indexed_export, devices_with, section_changes, encrypted_indexes, routerboard_export_indexed
+
+
+def written_export(filename, content):
+  with open(filename, 'w') as export_script:
+    export_script.write(content)
+  return filename
+
+
+firewall_export = str(
+  '# jan/02/2020 10:00:00 by RouterOS 6.48.6\n'
+  '/ip firewall address-list\n'
+  'add address=10.0.0.0/8 list=internal\n'
+  '/ip firewall filter\n'
+  'add action=drop chain=input comment="drop \\\n'
+  '    invalid" connection-state=invalid\n'
+)
+
+
+class TestFunctions(TestCase):
+
+  def test_connected_index(self):
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'index.sqlite')
+      with closing(connected_index(filename=filename)):
+        pass
+      with closing(connected_index(filename=filename)) as connection:
+        self.assertEqual(
+          first={'exports', 'records', 'export_records', 'postings', 'sections'},
+          second={name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")},
+          msg='Creates the tables of the index once'
+        )
+
+  def test_export_records(self):
+    self.assertEqual(
+      first=[
+        ('/ip firewall address-list', 'add address=10.0.0.0/8 list=internal'),
+        ('/ip firewall filter', 'add action=drop chain=input comment="drop invalid" connection-state=invalid')
+      ],
+      second=list(export_records(lines=firewall_export.splitlines(keepends=True))),
+      msg='Returns the lines of each section, joining the continued ones and leaving the comments out'
+    )
+    self.assertEqual(
+      first=[('', 'add name=bridge1')],
+      second=list(export_records(lines=['add name=bridge1\n', '\n'])),
+      msg='Returns the lines before any section on an empty section'
+    )
+
+  def test_tokens(self):
+    self.assertEqual(
+      first={'add', 'action=drop', 'comment="drop invalid"'},
+      second=tokens(line='add action=DROP comment="drop invalid"'),
+      msg='Splits the line on its words and parameters, keeping the quoted values whole'
+    )
+
+  def test_section_digests(self):
+    digests = section_digests(records=[('/a', 'x'), ('/b', 'y'), ('/a', 'z')])
+    self.assertEqual(
+      first=['/a', '/b'],
+      second=sorted(digests),
+      msg='Has a digest for each section'
+    )
+    self.assertNotEqual(
+      first=digests['/a'],
+      second=section_digests(records=[('/a', 'z'), ('/a', 'x')])['/a'],
+      msg='Depends on the order of the lines of the section'
+    )
+
+  def test_record_id(self):
+    with closing(connected_index(filename=':memory:')) as connection:
+      first_id = record_id(connection=connection, section='/a', line='add name=x')
+      self.assertEqual(
+        first=first_id,
+        second=record_id(connection=connection, section='/a', line='add name=x'),
+        msg='Stores each line of a section once'
+      )
+      self.assertNotEqual(
+        first=first_id,
+        second=record_id(connection=connection, section='/b', line='add name=x'),
+        msg='Stores the same line of another section apart'
+      )
+      self.assertEqual(
+        first=[('add',), ('name=x',)],
+        second=connection.execute(
+          'SELECT token FROM postings WHERE record_id = ? ORDER BY token', (first_id,)
+        ).fetchall(),
+        msg='Indexes the tokens of the line'
+      )
+
+  def test_indexed_export(self):
+    with TemporaryDirectory() as directory, closing(connected_index(filename=':memory:')) as connection:
+      filename = written_export(filename=path.join(directory, 'rtr-a.rsc'), content=firewall_export)
+      export_id = indexed_export(
+        connection=connection,
+        device_id='rtr-a',
+        created=datetime(year=2020, month=1, day=2),
+        script_localpath=filename
+      )
+      self.assertEqual(
+        first=[('rtr-a', '2020-01-02T00:00:00', filename)],
+        second=connection.execute('SELECT device, created, filename FROM exports WHERE id = ?', (export_id,)).fetchall(),
+        msg='Indexes the export passed'
+      )
+      self.assertEqual(
+        first=2,
+        second=connection.execute(
+          'SELECT COUNT(*) FROM export_records WHERE export_id = ?', (export_id,)
+        ).fetchone()[0],
+        msg='Indexes the records of the export'
+      )
+      self.assertIsNone(
+        obj=indexed_export(
+          connection=connection,
+          device_id='rtr-a',
+          created=datetime(year=2020, month=1, day=3),
+          script_localpath=filename
+        ),
+        msg='Does not index the same export twice'
+      )
+
+  def test_devices_with(self):
+    with TemporaryDirectory() as directory, closing(connected_index(filename=':memory:')) as connection:
+      for device, day, content in [
+        ('rtr-a', 1, firewall_export),
+        ('rtr-b', 1, firewall_export),
+        ('rtr-b', 2, '/ip firewall filter\nadd action=accept chain=input\n'),
+        ('rtr-c', 1, '/ip firewall nat\nadd action=drop chain=input\n')
+      ]:
+        indexed_export(
+          connection=connection,
+          device_id=device,
+          created=datetime(year=2020, month=1, day=day),
+          script_localpath=written_export(
+            filename=path.join(directory, '{device}-{day}.rsc'.format(device=device, day=day)),
+            content=content
+          )
+        )
+
+      self.assertEqual(
+        first=['rtr-a', 'rtr-c'],
+        second=devices_with(connection=connection, text='chain=input action=drop'),
+        msg='Returns the devices whose latest export has a line with every token passed'
+      )
+      self.assertEqual(
+        first=['rtr-a'],
+        second=devices_with(connection=connection, text='action=drop', section='/ip firewall filter'),
+        msg='Returns only the devices with the line on the section passed'
+      )
+      self.assertEqual(
+        first=[],
+        second=devices_with(connection=connection, text=' '),
+        msg='Returns no devices for a text without tokens'
+      )
+
+  def test_section_changes(self):
+    with TemporaryDirectory() as directory, closing(connected_index(filename=':memory:')) as connection:
+      contents = [
+        '/ip firewall filter\nadd action=accept\n',
+        '/ip firewall address-list\nadd list=a\n',
+        '/ip firewall address-list\nadd list=a\n',
+        '/ip firewall address-list\nadd list=b\n',
+        '/ip firewall filter\nadd action=accept\n'
+      ]
+      for day, content in enumerate(contents, start=1):
+        indexed_export(
+          connection=connection,
+          device_id='rtr-a',
+          created=datetime(year=2020, month=1, day=day),
+          script_localpath=written_export(
+            filename=path.join(directory, '{day}.rsc'.format(day=day)),
+            content=content
+          )
+        )
+
+      changes = section_changes(connection=connection, device_id='rtr-a', section='/ip firewall address-list')
+      self.assertEqual(
+        first=['2020-01-02T00:00:00', '2020-01-04T00:00:00', '2020-01-05T00:00:00'],
+        second=[change['created'] for change in changes],
+        msg='Returns when the section appeared, changed and disappeared'
+      )
+      self.assertIsNone(
+        obj=changes[-1]['digest'],
+        msg='Has no digest when the section disappeared'
+      )
+
+  def test_encrypted_indexes(self):
+    self.assertEqual(
+      first=['rtr-b'],
+      second=encrypted_indexes(routerboards=[
+        {'name': 'rtr-a', 'backup_options': {'export_index': {}}},
+        {'name': 'rtr-b', 'backup_options': {'export_index': {}, 'encryption': {}}},
+        {'name': 'rtr-c', 'backup_options': {'encryption': {}}},
+        {'name': 'rtr-d'}
+      ]),
+      msg='Returns the routerboards whose exports would be indexed in plain text despite their encryption'
+    )
+
+  @patch(target='backup.export_index.datetime')
+  @patch(target='backup.export_index.indexed_export')
+  def test_routerboard_export_indexed(self, mock_indexed_export, mock_datetime):
+    with TemporaryDirectory() as directory:
+      routerboard = {
+        'name': 'rtr-a',
+        'backup_options': {'export_index': {'filename': path.join(directory, 'index.sqlite')}}
+      }
+      self.assertEqual(
+        first=mock_indexed_export.return_value,
+        second=routerboard_export_indexed(routerboard=routerboard, script_localpath='rtr-a.rsc'),
+        msg='Returns the id of the export indexed'
+      )
+      self.assertEqual(
+        first={
+          'device_id': 'rtr-a',
+          'created': mock_datetime.now.return_value,
+          'script_localpath': 'rtr-a.rsc',
+          'key': None
+        },
+        second={
+          name: value for name, value in mock_indexed_export.call_args.kwargs.items() if name != 'connection'
+        },
+        msg='Indexes the export of the routerboard, now, on its export index'
+      )
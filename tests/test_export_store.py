@@ -0,0 +1,252 @@
+from datetime import datetime
+from os import listdir, path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from backup.export_store import device_store, store_index, read_lines, delta, patched, version_filename, \
+  version_lines, stored_export, export_at, routerboard_export_stored
+from backup.encryption import EncryptedFile
+
+
+def written_script(filename, lines):
+  with open(filename, 'w', newline='') as script:
+    script.write(''.join(lines))
+  return filename
+
+
+def encrypted_script(filename, lines, key):
+  with EncryptedFile(file=open(filename, 'wb'), key=key) as script:
+    script.write(''.join(lines).encode())
+  return filename
+
+
+class TestFunctions(TestCase):
+
+  def test_device_store(self):
+    self.assertEqual(
+      first=path.join('/exports', 'rtr-a'),
+      second=device_store(directory='/exports', device_id='rtr-a'),
+      msg='Returns the directory of the device on the export store'
+    )
+
+  def test_store_index(self):
+    with TemporaryDirectory() as store:
+      self.assertEqual(
+        first=[],
+        second=store_index(store=store),
+        msg='Returns an empty index when nothing was stored yet'
+      )
+      with open(path.join(store, 'index.jsonl'), 'w') as json_lines:
+        json_lines.write('{"version": 0}\n{"version": 1}\n')
+      self.assertEqual(
+        first=[{'version': 0}, {'version': 1}],
+        second=store_index(store=store),
+        msg='Returns the entries of the index in the order they were stored'
+      )
+
+  def test_read_lines(self):
+    with TemporaryDirectory() as directory:
+      self.assertEqual(
+        first=['a\r\n', 'b\n'],
+        second=read_lines(filename=written_script(filename=path.join(directory, 'script'), lines=['a\r\n', 'b\n'])),
+        msg='Returns the lines of the file keeping their line endings'
+      )
+      key = b'k' * 32
+      with EncryptedFile(file=open(path.join(directory, 'script.enc'), 'wb'), key=key) as encrypted_script:
+        encrypted_script.write(b'a\r\nb\n')
+      self.assertEqual(
+        first=['a\r\n', 'b\n'],
+        second=read_lines(filename=path.join(directory, 'script.enc'), key=key),
+        msg='Returns the plain lines of an encrypted file'
+      )
+
+  def test_delta(self):
+    base_lines = ['a\n', 'b\n', 'c\n', 'd\n']
+    lines = ['a\n', 'x\n', 'c\n', 'd\n', 'e\n']
+    self.assertEqual(
+      first=[['copy', 0, 1], ['insert', ['x\n']], ['copy', 2, 4], ['insert', ['e\n']]],
+      second=delta(base_lines=base_lines, lines=lines),
+      msg='Copies the unchanged ranges of the base and inserts the new lines'
+    )
+    self.assertEqual(
+      first=[['copy', 0, 1], ['copy', 2, 4]],
+      second=delta(base_lines=base_lines, lines=['a\n', 'c\n', 'd\n']),
+      msg='Leaves the deleted lines out'
+    )
+
+  def test_patched(self):
+    base_lines = ['a\n', 'b\n', 'c\n', 'd\n']
+    lines = ['x\n', 'a\n', 'd\n', 'e\n', 'f\n']
+    self.assertEqual(
+      first=lines,
+      second=patched(base_lines=base_lines, operations=delta(base_lines=base_lines, lines=lines)),
+      msg='Rebuilds the lines from the base and the delta'
+    )
+
+  def test_version_filename(self):
+    self.assertEqual(
+      first=path.join('/exports/rtr-a', '00000003.json'),
+      second=version_filename(store='/exports/rtr-a', entry={'filename': '00000003.json'}),
+      msg='Returns the file of the version on the store'
+    )
+
+  def test_stored_export(self):
+    with TemporaryDirectory() as directory:
+      script = path.join(directory, 'script.rsc')
+      entries = [
+        stored_export(
+          directory=directory,
+          device_id='rtr-a',
+          script_localpath=written_script(filename=script, lines=['header {day}\n'.format(day=day), 'a\n', 'b\n']),
+          created=datetime(year=2020, month=1, day=day),
+          snapshot_interval=2
+        ) for day in range(1, 4)
+      ]
+      self.assertEqual(
+        first=[
+          {'version': 0, 'snapshot': 0, 'filename': '00000000.rsc', 'created': '2020-01-01T00:00:00'},
+          {'version': 1, 'snapshot': 0, 'filename': '00000001.json', 'created': '2020-01-02T00:00:00'},
+          {'version': 2, 'snapshot': 2, 'filename': '00000002.rsc', 'created': '2020-01-03T00:00:00'}
+        ],
+        second=entries,
+        msg='Stores a snapshot every snapshot interval and deltas to the last snapshot between them'
+      )
+      store = device_store(directory=directory, device_id='rtr-a')
+      self.assertEqual(
+        first=entries,
+        second=store_index(store=store),
+        msg='Indexes every version stored'
+      )
+      self.assertEqual(
+        first=[['insert', ['header 2\n']], ['copy', 1, 3]],
+        second=delta(
+          base_lines=read_lines(filename=path.join(store, '00000000.rsc')),
+          lines=version_lines(store=store, index=entries, entry=entries[1])
+        ),
+        msg='Stores only the lines changed since the last snapshot'
+      )
+
+  def test_stored_export_encrypted(self):
+    key = b'k' * 32
+    with TemporaryDirectory() as directory:
+      stored_export(
+        directory=directory,
+        device_id='rtr-a',
+        script_localpath=written_script(filename=path.join(directory, 'script.rsc'), lines=['secret 1\n', 'a\n']),
+        created=datetime(year=2020, month=1, day=1)
+      )
+      script = path.join(directory, 'script.rsc.enc')
+      for day in range(2, 4):
+        stored_export(
+          directory=directory,
+          device_id='rtr-a',
+          script_localpath=encrypted_script(filename=script, lines=['secret {day}\n'.format(day=day), 'a\n'], key=key),
+          created=datetime(year=2020, month=1, day=day),
+          key=key
+        )
+      store = device_store(directory=directory, device_id='rtr-a')
+      self.assertEqual(
+        first=['00000000.rsc', '00000001.json.enc', '00000002.json.enc'],
+        second=[entry['filename'] for entry in store_index(store=store)],
+        msg='Stores the versions encrypted, as .enc files, once there is a key'
+      )
+      for filename in sorted(listdir(store))[1:3]:
+        with open(path.join(store, filename), 'rb') as version_file:
+          self.assertNotIn(
+            member=b'secret',
+            container=version_file.read(),
+            msg='Leaves no plain line of the export on the encrypted versions'
+          )
+      self.assertEqual(
+        first='secret 3\na\n',
+        second=export_at(directory=directory, device_id='rtr-a', moment=datetime(year=2020, month=1, day=3), key=key),
+        msg='Rebuilds an encrypted version over a snapshot stored before the encryption was set'
+      )
+      stored_export(
+        directory=directory,
+        device_id='rtr-b',
+        script_localpath=encrypted_script(filename=script, lines=['secret\n'], key=key),
+        created=datetime(year=2020, month=1, day=1),
+        key=key
+      )
+      self.assertEqual(
+        first='secret\n',
+        second=export_at(directory=directory, device_id='rtr-b', moment=datetime(year=2020, month=1, day=1), key=key),
+        msg='Reads an encrypted snapshot with the key passed'
+      )
+
+  def test_version_lines(self):
+    with TemporaryDirectory() as directory:
+      script = path.join(directory, 'script.rsc')
+      versions = [['a\n', 'b\n'], ['a\n', 'c\n', 'b\n'], ['b\n']]
+      for version, lines in enumerate(versions):
+        stored_export(
+          directory=directory,
+          device_id='rtr-a',
+          script_localpath=written_script(filename=script, lines=lines),
+          created=datetime(year=2020, month=1, day=version + 1)
+        )
+      store = device_store(directory=directory, device_id='rtr-a')
+      index = store_index(store=store)
+      self.assertEqual(
+        first=versions,
+        second=[version_lines(store=store, index=index, entry=entry) for entry in index],
+        msg='Rebuilds every version stored, from its snapshot and its delta'
+      )
+
+  def test_export_at(self):
+    with TemporaryDirectory() as directory:
+      script = path.join(directory, 'script.rsc')
+      for day in (1, 5):
+        stored_export(
+          directory=directory,
+          device_id='rtr-a',
+          script_localpath=written_script(filename=script, lines=['day {day}\n'.format(day=day)]),
+          created=datetime(year=2020, month=1, day=day)
+        )
+
+      self.assertIsNone(
+        obj=export_at(directory=directory, device_id='rtr-a', moment=datetime(year=2019, month=12, day=31)),
+        msg='Returns None before the first export stored'
+      )
+      self.assertEqual(
+        first='day 1\n',
+        second=export_at(directory=directory, device_id='rtr-a', moment=datetime(year=2020, month=1, day=4)),
+        msg='Returns the export stored last before the moment passed'
+      )
+      self.assertEqual(
+        first='day 5\n',
+        second=export_at(directory=directory, device_id='rtr-a', moment=datetime(year=2020, month=1, day=5)),
+        msg='Returns the export stored at the moment passed'
+      )
+      self.assertIsNone(
+        obj=export_at(directory=directory, device_id='rtr-b', moment=datetime(year=2020, month=1, day=5)),
+        msg='Returns None for a device without exports stored'
+      )
+
+  @patch(target='backup.export_store.datetime')
+  @patch(target='backup.export_store.stored_export')
+  def test_routerboard_export_stored(self, mock_stored_export, mock_datetime):
+    routerboard = {'name': 'rtr-a', 'backup_options': {'export_store': {'directory': '/exports'}}}
+    self.assertEqual(
+      first=mock_stored_export.return_value,
+      second=routerboard_export_stored(routerboard=routerboard, script_localpath='script.rsc'),
+      msg='Returns the entry of the export stored'
+    )
+    routerboard['backup_options']['export_store']['snapshot_interval'] = 30
+    routerboard_export_stored(routerboard=routerboard, script_localpath='script.rsc')
+    self.assertEqual(
+      first=[
+        {
+          'directory': '/exports',
+          'device_id': 'rtr-a',
+          'script_localpath': 'script.rsc',
+          'created': mock_datetime.now.return_value,
+          'snapshot_interval': snapshot_interval,
+          'key': None
+        } for snapshot_interval in (10, 30)
+      ],
+      second=[stored_call.kwargs for stored_call in mock_stored_export.call_args_list],
+      msg='Stores the export of the routerboard on its export store, now, with its snapshot interval'
+    )
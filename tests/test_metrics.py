@@ -0,0 +1,242 @@
+from json import loads
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock, call, patch
+
+from backup.metrics import DeviceMetrics, TransferProgress, reported_metrics, json_lines_hook, \
+  prometheus_textfile_hook, written_atomically, prometheus_label, prometheus_text
+
+
+class TestDeviceMetrics(TestCase):
+
+  def setUp(self):
+    self.metrics = DeviceMetrics(device='rtr')
+
+  def test_init(self):
+    self.assertEqual(
+      first={
+        'device': 'rtr',
+        'phases': {},
+        'bytes_transferred': 0,
+        'polls': 0,
+        'reclaimed_bytes': 0,
+        'swept_bytes': 0,
+        'error': None
+      },
+      second=self.metrics.record,
+      msg=str(
+        'Starts with no phases measured, no bytes transferred, no polls, no bytes reclaimed or swept and no error '
+        'for the device passed'
+      )
+    )
+
+  @patch(target='backup.metrics.perf_counter')
+  def test_phase(self, mock_perf_counter):
+    mock_perf_counter.side_effect = [10.0, 12.5, 20.0, 21.0]
+    with self.metrics.phase(name='download') as metrics:
+      self.assertEqual(
+        first=self.metrics,
+        second=metrics,
+        msg='Yields the metrics itself'
+      )
+    self.assertEqual(
+      first={'download': 2.5},
+      second=self.metrics.phases,
+      msg='Records the seconds elapsed inside the context as the duration of the phase'
+    )
+
+    with self.assertRaises(expected_exception=RuntimeError):
+      with self.metrics.phase(name='download'):
+        raise RuntimeError
+    self.assertEqual(
+      first={'download': 3.5},
+      second=self.metrics.phases,
+      msg='Accumulates the duration of repeated phases even when the phase fails'
+    )
+
+  def test_reclaimed(self):
+    self.metrics.reclaimed(size=10)
+    self.metrics.reclaimed(size=5)
+    self.assertEqual(
+      first=15,
+      second=self.metrics.reclaimed_bytes,
+      msg='Accumulates the bytes reclaimed'
+    )
+
+  def test_swept(self):
+    self.metrics.swept(size=10)
+    self.metrics.swept(size=5)
+    self.assertEqual(
+      first=15,
+      second=self.metrics.swept_bytes,
+      msg='Accumulates the bytes swept'
+    )
+
+  def test_failed(self):
+    self.metrics.failed(error=OSError('unreachable'))
+    self.assertEqual(
+      first='OSError: unreachable',
+      second=self.metrics.record['error'],
+      msg='Records the error the backup failed with'
+    )
+
+  def test_throughput(self):
+    self.assertIsNone(
+      obj=self.metrics.throughput,
+      msg='Is None when nothing was downloaded'
+    )
+    self.metrics.transferred(size=300)
+    self.metrics.phases['download'] = 1.5
+    self.assertEqual(
+      first=200,
+      second=self.metrics.throughput,
+      msg='Is the bytes transferred per second spent downloading'
+    )
+
+  def test_polled(self):
+    self.metrics.polled()
+    self.metrics.polled()
+    self.assertEqual(
+      first=2,
+      second=self.metrics.polls,
+      msg='Counts each poll made'
+    )
+
+  def test_transferred(self):
+    self.metrics.transferred(size=3)
+    self.metrics.transferred(size=4)
+    self.assertEqual(
+      first=7,
+      second=self.metrics.bytes_transferred,
+      msg='Accumulates the bytes transferred'
+    )
+
+
+class TestTransferProgress(TestCase):
+
+  def test_call(self):
+    metrics = DeviceMetrics(device='rtr')
+    metrics.transferred(size=100)
+    progress = TransferProgress(metrics=metrics)
+
+    progress(transferred=10, total=30)
+    progress(transferred=30, total=30)
+    self.assertEqual(
+      first=130,
+      second=metrics.bytes_transferred,
+      msg='Accounts only the bytes transferred since the last progress report on the metrics passed'
+    )
+
+
+class TestFunctions(TestCase):
+
+  def test_reported_metrics(self):
+    metrics = DeviceMetrics(device='rtr')
+    hooks = [MagicMock(), MagicMock()]
+
+    self.assertEqual(
+      first=metrics,
+      second=reported_metrics(metrics=metrics, hooks=hooks),
+      msg='Returns the metrics passed'
+    )
+    for hook in hooks:
+      self.assertEqual(
+        first=[call(metrics=metrics)],
+        second=hook.mock_calls,
+        msg='Calls each hook passed with the metrics'
+      )
+
+  def test_json_lines_hook(self):
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'metrics.jsonl')
+      hook = json_lines_hook(filename=filename)
+      first_metrics = DeviceMetrics(device='rtr-a')
+      second_metrics = DeviceMetrics(device='rtr-b')
+      second_metrics.transferred(size=5)
+
+      hook(metrics=first_metrics)
+      hook(metrics=second_metrics)
+      with open(filename) as json_lines:
+        self.assertEqual(
+          first=[first_metrics.record, second_metrics.record],
+          second=[loads(line) for line in json_lines],
+          msg='Appends the record of each metrics reported as a JSON line'
+        )
+
+  def test_prometheus_textfile_hook(self):
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'backup.prom')
+      hook = prometheus_textfile_hook(filename=filename)
+      first_metrics = DeviceMetrics(device='rtr-a')
+      second_metrics = DeviceMetrics(device='rtr-b')
+
+      hook(metrics=first_metrics)
+      hook(metrics=second_metrics)
+      second_metrics.polled()
+      hook(metrics=second_metrics)
+      with open(filename) as textfile:
+        self.assertEqual(
+          first=prometheus_text(records=[first_metrics.record, second_metrics.record]),
+          second=textfile.read(),
+          msg='Rewrites the textfile with the latest record of every device reported'
+        )
+
+  def test_written_atomically(self):
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'file')
+      self.assertEqual(
+        first=filename,
+        second=written_atomically(filename=filename, content='content'),
+        msg='Returns the filename passed'
+      )
+      with open(filename) as written_file:
+        self.assertEqual(
+          first='content',
+          second=written_file.read(),
+          msg='Writes the content passed to the filename'
+        )
+      self.assertFalse(
+        expr=path.exists('{filename}.tmp'.format(filename=filename)),
+        msg='Does not leave the temporary file behind'
+      )
+
+  def test_prometheus_label(self):
+    self.assertEqual(
+      first='a\\\\b\\"c\\nd',
+      second=prometheus_label(value='a\\b"c\nd'),
+      msg='Escapes backslashes, double quotes and line feeds'
+    )
+
+  def test_prometheus_text(self):
+    metrics = DeviceMetrics(device='rtr')
+    metrics.phases['connect'] = 0.5
+    metrics.transferred(size=77)
+    metrics.polled()
+    metrics.reclaimed(size=10)
+    metrics.swept(size=20)
+
+    self.assertEqual(
+      first=str(
+        '# HELP tasiap_backup_phase_duration_seconds Duration of each phase of the last backup of the device.\n'
+        '# TYPE tasiap_backup_phase_duration_seconds gauge\n'
+        'tasiap_backup_phase_duration_seconds{device="rtr",phase="connect"} 0.5\n'
+        '# HELP tasiap_backup_transferred_bytes Bytes downloaded on the last backup of the device.\n'
+        '# TYPE tasiap_backup_transferred_bytes gauge\n'
+        'tasiap_backup_transferred_bytes{device="rtr"} 77\n'
+        '# HELP tasiap_backup_polls Remote file polls made on the last backup of the device.\n'
+        '# TYPE tasiap_backup_polls gauge\n'
+        'tasiap_backup_polls{device="rtr"} 1\n'
+        '# HELP tasiap_backup_reclaimed_bytes Bytes of local backups deleted by the retention on the last backup.\n'
+        '# TYPE tasiap_backup_reclaimed_bytes gauge\n'
+        'tasiap_backup_reclaimed_bytes{device="rtr"} 10\n'
+        '# HELP tasiap_backup_swept_bytes Bytes of stale remote files deleted from the device on the last backup.\n'
+        '# TYPE tasiap_backup_swept_bytes gauge\n'
+        'tasiap_backup_swept_bytes{device="rtr"} 20\n'
+        '# HELP tasiap_backup_failed Whether the last backup of the device failed.\n'
+        '# TYPE tasiap_backup_failed gauge\n'
+        'tasiap_backup_failed{device="rtr"} 0\n'
+      ),
+      second=prometheus_text(records=iter([metrics.record])),
+      msg='Returns the records passed in the Prometheus text format'
+    )
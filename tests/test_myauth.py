@@ -1,11 +1,16 @@
 from datetime import datetime
 from pathlib import PurePath
+from threading import Event
 from unittest import TestCase
-from unittest.mock import MagicMock, call, patch
+from unittest.mock import MagicMock, call, patch, ANY
 
+from backup.metrics import DeviceMetrics, TransferProgress
 from backup.myauth import BackupFile, are_not_corrupted, is_corrupted, is_smaller_than_older, newest_backup, \
   disposable_backups, backup_files_found, is_valid_backup_filename, retrieved_file, remotepath, labeled_backups, \
-  retrieved_and_deleted_backups, deleted_remote_backup_files, deleted_remote_file, myauth_backup
+  retrieved_and_deleted_backups, deleted_remote_backup_files, deleted_remote_file, myauth_backup, listed_backup_files, \
+  creation_of, with_largest_older_size, myauth_backup_result, myauths_backups, iterated_myauths_backups, \
+  started_myauth_backup
+from backup.storage import FilesystemStorage
 
 
 class SFTPAttributesMock:
@@ -291,6 +296,77 @@ class TestMyauthFunctions(TestCase):
       msg="Returns False when one of the BackupFile's in the list has an extension different than .tgz"
     )
 
+    backup_files = [
+      BackupFile(
+        filename='backup-2020-08-23-0449.tgz',
+        size='4'
+      ),
+      BackupFile(
+        filename='backup-2020-08-23-0448.tgz',
+        size='1'
+      ),
+      BackupFile(
+        filename='backup-2020-08-23-0447.tgz',
+        size='2'
+      )
+    ]
+    self.assertFalse(
+      expr=are_not_corrupted(backup_files=backup_files),
+      msg="Returns False when a newer BackupFile is smaller than an older one regardless of the order of the list"
+    )
+    self.assertEqual(
+      first=3,
+      second=len(backup_files),
+      msg='Does not change the list of backup files passed'
+    )
+
+    self.assertTrue(
+      expr=are_not_corrupted(backup_files=[
+        BackupFile(
+          filename='backup-2020-08-23-0447.tgz',
+          size='2'
+        ),
+        BackupFile(
+          filename='backup-2020-08-23-0447.tgz',
+          size='1'
+        )
+      ]),
+      msg="Returns True when the smaller BackupFile has the same creation of the bigger one"
+    )
+
+  def test_creation_of(self):
+    backup_file = BackupFile(filename='backup-2020-08-23-0446.tgz', size='1')
+    self.assertEqual(
+      first=backup_file.creation,
+      second=creation_of(backup_file=backup_file),
+      msg='Returns the creation of the backup file passed'
+    )
+
+  def test_with_largest_older_size(self):
+    oldest = BackupFile(filename='backup-2020-08-23-0446.tgz', size='3')
+    created_together_a = BackupFile(filename='backup-2020-08-23-0447.tgz', size='5')
+    created_together_b = BackupFile(filename='backup-2020-08-23-0447.tgz', size='1')
+    newest = BackupFile(filename='backup-2020-08-23-0448.tgz', size='2')
+
+    self.assertEqual(
+      first=[],
+      second=list(with_largest_older_size(backup_files=[])),
+      msg='Yields nothing when the list of backup files is empty'
+    )
+    self.assertEqual(
+      first=[
+        (oldest, 0),
+        (created_together_a, 3),
+        (created_together_b, 3),
+        (newest, 5)
+      ],
+      second=list(with_largest_older_size(backup_files=[newest, created_together_a, oldest, created_together_b])),
+      msg=str(
+        'Yields each backup file from the oldest to the newest along with the size of the largest backup file that is '
+        'strictly older than it'
+      )
+    )
+
   def test_is_corrupted(self):
     self.assertTrue(
       expr=is_corrupted(
@@ -627,27 +703,51 @@ class TestMyauthFunctions(TestCase):
       msg='Returns False for the hidden file .lastbackup that usually is found on the backups directory'
     )
 
-  def test_retrieved_file(self):
+  @patch(target='backup.myauth.retrieved')
+  def test_retrieved_file(self, mock_retrieved):
     current_remotepath = MagicMock()
     current_localpath = MagicMock()
     sftp = MagicMock()
+    metrics = DeviceMetrics(device='device')
+    storage = MagicMock()
 
     self.assertEqual(
       first=current_localpath,
       second=retrieved_file(
         current_remotepath=current_remotepath,
         current_localpath=current_localpath,
-        sftp=sftp
+        sftp=sftp,
+        metrics=metrics,
+        retry_policy={},
+        storage=storage
       ),
       msg='Returns the localpath of the file retrieved'
     )
-    self.assertIn(
-      member=call.get(
+    self.assertEqual(
+      first=[call(
+        sftp=sftp,
         remotepath=current_remotepath.as_posix(),
-        localpath=current_localpath
-      ),
-      container=sftp.mock_calls,
-      msg='Gets the remote file to the localpath using the sftp passed. The remotepath to get must be passed as posix.'
+        localpath=current_localpath,
+        callback=ANY,
+        buckets=None,
+        key=None,
+        storage=storage
+      )],
+      second=mock_retrieved.call_args_list,
+      msg=str(
+        'Retrieves the remote file to the localpath using the sftp and the storage passed. The remotepath to get '
+        'must be passed as posix.'
+      )
+    )
+    self.assertIsInstance(
+      obj=mock_retrieved.call_args.kwargs['callback'],
+      cls=TransferProgress,
+      msg='Accounts the bytes transferred on the metrics passed'
+    )
+    self.assertIn(
+      member='download',
+      container=metrics.phases,
+      msg='Measures the time spent downloading the file on the metrics passed'
     )
 
   def test_remotepath(self):
@@ -694,7 +794,8 @@ class TestMyauthFunctions(TestCase):
       )
     )
 
-  def test_retrieved_and_deleted_backups(self):
+  @patch(target='backup.myauth.retrieved')
+  def test_retrieved_and_deleted_backups(self, _):
     backup_settings = {
       'remote_backups_directory': '/remote/directory/',
       'local_backups_directory': 'C:\\Users\\someone\\'
@@ -718,7 +819,35 @@ class TestMyauthFunctions(TestCase):
       second=retrieved_and_deleted_backups(
         current_labeled_backups=current_labeled_backups,
         backup_settings=backup_settings,
-        sftp=MagicMock())
+        sftp=MagicMock(),
+        metrics=DeviceMetrics(device='device'))
+    )
+
+  @patch(target='backup.myauth.retrieved')
+  @patch(target='backup.myauth.encryption_key', return_value=b'k' * 32)
+  def test_retrieved_and_deleted_backups_encrypted(self, mock_encryption_key, mock_retrieved):
+    backup_settings = {
+      'remote_backups_directory': '/remote/directory/',
+      'local_backups_directory': '/backups/',
+      'encryption': {'key_filename': '/backups.key'}
+    }
+    self.assertEqual(
+      first=PurePath('/backups/backup-2020-09-29-0444.tgz.enc'),
+      second=retrieved_and_deleted_backups(
+        current_labeled_backups={
+          'newest_backup': BackupFile(filename='backup-2020-09-29-0444.tgz', size=5),
+          'disposable_backups': []
+        },
+        backup_settings=backup_settings,
+        sftp=MagicMock(),
+        metrics=DeviceMetrics(device='device')
+      )['retrieved_backup'],
+      msg='Returns the encrypted file retrieved when the backup settings have an encryption'
+    )
+    self.assertEqual(
+      first=([call(encryption={'key_filename': '/backups.key'})], b'k' * 32),
+      second=(mock_encryption_key.call_args_list, mock_retrieved.call_args.kwargs['key']),
+      msg='Encrypts the backup with the key of the backup settings as it is retrieved'
     )
 
   def test_deleted_remote_backup_files(self):
@@ -731,7 +860,9 @@ class TestMyauthFunctions(TestCase):
       second=deleted_remote_backup_files(
         remote_directory=remote_backups_directory,
         backup_files=backup_files,
-        sftp=sftp
+        sftp=sftp,
+        metrics=DeviceMetrics(device='device'),
+        retry_policy={}
       ),
       msg='Returns the disposable backup files that were sent to be deleted remotely'
     )
@@ -754,14 +885,22 @@ class TestMyauthFunctions(TestCase):
   def test_deleted_remote_file(self):
     file_remotepath = PurePath('/admin/backup/backup-2020-10-11-0440.tgz')
     sftp = MagicMock()
+    metrics = DeviceMetrics(device='device')
 
     self.assertEqual(
       first=file_remotepath,
       second=deleted_remote_file(
         file_remotepath=file_remotepath,
-        sftp=sftp
+        sftp=sftp,
+        metrics=metrics,
+        retry_policy={}
       )
     )
+    self.assertIn(
+      member='delete',
+      container=metrics.phases,
+      msg='Measures the time spent deleting the file on the metrics passed'
+    )
     self.assertIn(
       member=[call.unlink(path=file_remotepath.as_posix())],
       container=sftp.mock_calls,
@@ -771,12 +910,54 @@ class TestMyauthFunctions(TestCase):
       )
     )
 
+    sftp.unlink.side_effect = [EOFError, FileNotFoundError]
+    with patch(target='backup.retry.sleep') as mock_sleep:
+      deleted_remote_file(
+        file_remotepath=file_remotepath,
+        sftp=sftp,
+        metrics=metrics,
+        retry_policy={'attempts': 2, 'backoff_seconds': 3}
+      )
+    self.assertEqual(
+      first=[call(3)],
+      second=mock_sleep.mock_calls,
+      msg='Retries the delete with the retry policy passed, the file already gone counting as deleted'
+    )
+
+  @patch(target='backup.myauth.backup_files_found')
+  def test_listed_backup_files(self, mock_backup_files_found):
+    sftp = MagicMock()
+    metrics = DeviceMetrics(device='device')
+
+    self.assertEqual(
+      first=mock_backup_files_found.return_value,
+      second=listed_backup_files(remote_directory='/admin/backup/', sftp=sftp, metrics=metrics, retry_policy={}),
+      msg='Returns the backup files found on the remote directory passed'
+    )
+    self.assertEqual(
+      first=[call(sftp_attributes_from_files=sftp.listdir_attr.return_value)],
+      second=mock_backup_files_found.call_args_list,
+      msg='Looks for the backup files on the listing of the remote directory'
+    )
+    self.assertEqual(
+      first=[call.listdir_attr(path='/admin/backup/')],
+      second=sftp.mock_calls,
+      msg='Lists the remote directory passed'
+    )
+    self.assertIn(
+      member='list',
+      container=metrics.phases,
+      msg='Measures the time spent listing the remote directory on the metrics passed'
+    )
+
+  @patch(target='backup.myauth.reported_metrics')
   @patch(target='backup.myauth.open_ssh_session')
   @patch(target='backup.myauth.retrieved_and_deleted_backups')
   def test_myauth_backup(
     self,
     mock_retrieved_and_deleted_backups,
-    mock_open_ssh_session
+    mock_open_ssh_session,
+    mock_reported_metrics
   ):
     ssh_client_options = {
       'hosts_keys_filename': 'tests/hosts_keys',
@@ -794,21 +975,316 @@ class TestMyauthFunctions(TestCase):
         'pkey': 'key'
       }
     }
+    hooks = [MagicMock()]
+    mock_retrieved_and_deleted_backups.return_value = {'retrieved_backup': 'local backup', 'deleted_backups': []}
 
     self.assertEqual(
       first=mock_retrieved_and_deleted_backups.return_value,
       second=myauth_backup(
         myauth=myauth,
-        ssh_client_options=ssh_client_options
+        ssh_client_options=ssh_client_options,
+        hooks=hooks
       ),
       msg='Returns the path for the local retrieved and the remotely deleted backup files'
     )
 
+    ssh = mock_open_ssh_session.return_value.__enter__.return_value
+    self.assertEqual(
+      first=(1, 1),
+      second=(ssh.open_sftp.call_count, ssh.open_sftp.return_value.close.call_count),
+      msg='Lists, retrieves and deletes the backups over a single sftp channel, closed with the session'
+    )
+    self.assertEqual(
+      first=ssh.open_sftp.return_value,
+      second=mock_retrieved_and_deleted_backups.call_args.kwargs['sftp'],
+      msg='Retrieves and deletes the backups over the sftp channel of the session'
+    )
+
+    metrics = mock_open_ssh_session.call_args.kwargs['metrics']
+    self.assertEqual(
+      first=myauth['credentials']['hostname'],
+      second=metrics.device,
+      msg='Measures the backup on metrics identified by the hostname of the myauth server'
+    )
     self.assertIn(
       member=call(
         client_options=ssh_client_options,
-        credentials=myauth['credentials']
+        credentials=myauth['credentials'],
+        metrics=metrics
       ),
       container=mock_open_ssh_session.mock_calls,
       msg='Uses the ssh client options and the credentials from the myauth settings passed to open the ssh session'
     )
+    self.assertEqual(
+      first=[call(metrics=metrics, hooks=hooks)],
+      second=mock_reported_metrics.mock_calls,
+      msg='Reports the metrics to the hooks passed after the session is closed'
+    )
+
+  @patch(target='backup.myauth.reported_metrics')
+  @patch(target='backup.myauth.open_ssh_session')
+  @patch(target='backup.myauth.retrieved_and_deleted_backups')
+  def test_myauth_backup_with_cpu_stage(self, mock_retrieved_and_deleted_backups, mock_open_ssh_session, _):
+    mock_retrieved_and_deleted_backups.return_value = {'retrieved_backup': 'local backup', 'deleted_backups': []}
+    cpu_stage = MagicMock()
+    cpu_stage.pending_files.return_value = ['local backup processed']
+    myauth = {
+      'backup_settings': {
+        'local_backups_directory': '/backups/',
+        'remote_backups_directory': '/admin/backup/',
+        'keeping_backups_quantity': 7
+      },
+      'credentials': {'username': 'user', 'hostname': 'host', 'port': 1234, 'pkey': 'key'}
+    }
+    self.assertEqual(
+      first={'retrieved_backup': 'local backup processed', 'deleted_backups': []},
+      second=myauth_backup(myauth=myauth, ssh_client_options={}, cpu_stage=cpu_stage),
+      msg='Returns the backup retrieved as processed by the cpu stage passed'
+    )
+    self.assertEqual(
+      first=[call(localpaths=['local backup'])],
+      second=cpu_stage.pending_files.call_args_list,
+      msg='Processes the backup retrieved on the cpu stage passed'
+    )
+    self.assertIn(
+      member='process',
+      container=mock_open_ssh_session.call_args.kwargs['metrics'].phases,
+      msg='Measures the time spent waiting for room on the cpu stage'
+    )
+
+  @patch(target='backup.myauth.device_retention')
+  @patch(target='backup.myauth.reported_metrics')
+  @patch(target='backup.myauth.open_ssh_session')
+  @patch(target='backup.myauth.retrieved_and_deleted_backups')
+  def test_myauth_backup_with_retention(
+    self,
+    mock_retrieved_and_deleted_backups,
+    mock_open_ssh_session,
+    _,
+    mock_device_retention
+  ):
+    mock_retrieved_and_deleted_backups.return_value = {'retrieved_backup': 'local backup', 'deleted_backups': []}
+    retention = {'catalogue_filename': 'catalogue.sqlite', 'policy': {'daily': 7}}
+    myauth = {
+      'backup_settings': {
+        'local_backups_directory': '/backups/',
+        'remote_backups_directory': '/admin/backup/',
+        'keeping_backups_quantity': 7,
+        'retention': retention
+      },
+      'credentials': {'username': 'user', 'hostname': 'host', 'port': 1234, 'pkey': 'key'}
+    }
+
+    myauth_backup(myauth=myauth, ssh_client_options={'hosts_keys_filename': 'tests/hosts_keys'})
+    self.assertEqual(
+      first=[call(
+        retention=retention,
+        device_id='host',
+        filenames=['local backup'],
+        metrics=mock_open_ssh_session.call_args.kwargs['metrics']
+      )],
+      second=mock_device_retention.mock_calls,
+      msg='Applies the local retention to the backup retrieved from the myauth server'
+    )
+
+  @patch(target='backup.myauth.retrieved_myauth_backups')
+  def test_started_myauth_backup(self, mock_retrieved_myauth_backups):
+    mock_retrieved_myauth_backups.return_value = {'retrieved_backup': 'local backup', 'deleted_backups': []}
+    myauth = {'credentials': {'hostname': 'host'}}
+    ssh_client_options = {'hosts_keys_filename': 'tests/hosts_keys'}
+    hooks = [MagicMock()]
+
+    unfinished = started_myauth_backup(myauth=myauth, ssh_client_options=ssh_client_options, hooks=hooks)
+    self.assertEqual(
+      first={
+        'myauth': myauth,
+        'hooks': hooks,
+        'metrics': mock_retrieved_myauth_backups.call_args.kwargs['metrics'],
+        'backups': mock_retrieved_myauth_backups.return_value,
+        'files': ['local backup'],
+        'error': None
+      },
+      second=unfinished,
+      msg='Returns the backups of the myauth server passed, which may be still on the cpu stage, to be finished later'
+    )
+    self.assertEqual(
+      first=[call(
+        myauth=myauth,
+        ssh_client_options=ssh_client_options,
+        metrics=unfinished['metrics'],
+        cpu_stage=None,
+        storage=None
+      )],
+      second=mock_retrieved_myauth_backups.call_args_list,
+      msg='Retrieves the backups of the myauth server passed, measured on metrics identified by its hostname'
+    )
+    self.assertEqual(
+      first='host',
+      second=unfinished['metrics'].device,
+      msg='Measures the backup on metrics identified by the hostname of the myauth server'
+    )
+
+    error = OSError('unreachable')
+    mock_retrieved_myauth_backups.side_effect = error
+    unfinished = started_myauth_backup(myauth=myauth, ssh_client_options=ssh_client_options, hooks=hooks)
+    self.assertEqual(
+      first=(None, [], error),
+      second=(unfinished['backups'], unfinished['files'], unfinished['error']),
+      msg='Keeps the error raised instead of the backups when the backup of the myauth server fails'
+    )
+
+  @patch(target='backup.myauth.reported_metrics')
+  @patch(target='backup.myauth.finished_myauth_backups')
+  def test_myauth_backup_result(self, mock_finished_myauth_backups, mock_reported_metrics):
+    hooks = [MagicMock()]
+    metrics = DeviceMetrics(device='host')
+    unfinished = {
+      'myauth': {'credentials': {'hostname': 'host'}},
+      'hooks': hooks,
+      'metrics': metrics,
+      'backups': {'retrieved_backup': 'local backup', 'deleted_backups': []},
+      'files': ['local backup'],
+      'error': None
+    }
+
+    self.assertEqual(
+      first={
+        'hostname': 'host',
+        'backups': mock_finished_myauth_backups.return_value,
+        'error': None
+      },
+      second=myauth_backup_result(unfinished=unfinished),
+      msg='Returns the backups of the myauth server identified by its hostname'
+    )
+    self.assertEqual(
+      first=[call(myauth=unfinished['myauth'], current_backups=unfinished['backups'], metrics=metrics)],
+      second=mock_finished_myauth_backups.mock_calls,
+      msg='Finishes the backups of the myauth server'
+    )
+    self.assertEqual(
+      first=[call(metrics=metrics, hooks=hooks)],
+      second=mock_reported_metrics.call_args_list,
+      msg='Reports the metrics of the myauth server to the hooks once it is finished'
+    )
+
+    error = OSError('the gzip failed')
+    mock_finished_myauth_backups.side_effect = error
+    self.assertEqual(
+      first={'hostname': 'host', 'backups': None, 'error': error},
+      second=myauth_backup_result(unfinished=unfinished),
+      msg='Returns the error raised when the backups of the myauth server can not be finished'
+    )
+
+    error = OSError('unreachable')
+    metrics = DeviceMetrics(device='host')
+    self.assertEqual(
+      first={'hostname': 'host', 'backups': None, 'error': error},
+      second=myauth_backup_result(
+        unfinished={**unfinished, 'metrics': metrics, 'backups': None, 'files': [], 'error': error}
+      ),
+      msg='Returns the error raised instead of the backups when the backup of the myauth server fails'
+    )
+    self.assertEqual(
+      first=(2, 'OSError: unreachable', call(metrics=metrics, hooks=hooks)),
+      second=(mock_finished_myauth_backups.call_count, metrics.error, mock_reported_metrics.call_args),
+      msg='Reports the metrics of the failed backup too, with its error, without finishing it'
+    )
+
+  @patch(target='backup.myauth.myauth_backup_result', side_effect=lambda unfinished: unfinished['hostname'])
+  @patch(target='backup.myauth.shared_client_options')
+  @patch(target='backup.myauth.started_myauth_backup')
+  def test_iterated_myauths_backups(self, mock_started_myauth_backup, mock_shared_client_options, _):
+    slow_backup_released = Event()
+    mock_started_myauth_backup.side_effect = lambda myauth, ssh_client_options, hooks, cpu_stage, storage: (
+      slow_backup_released.wait(timeout=5) if myauth['credentials']['hostname'] == 'slow' else True
+    ) and {'hostname': myauth['credentials']['hostname'], 'files': []}
+    results = iterated_myauths_backups(
+      myauths=[{'credentials': {'hostname': 'slow'}}, {'credentials': {'hostname': 'fast'}}],
+      ssh_client_options={'hosts_keys_filename': 'tests/hosts_keys'},
+      max_workers=2
+    )
+
+    self.assertEqual(
+      first=(1, 'fast'),
+      second=next(results),
+      msg='Yields the index and the result of each myauth server as soon as it finishes'
+    )
+    slow_backup_released.set()
+    self.assertEqual(
+      first=[(0, 'slow')],
+      second=list(results),
+      msg='Yields the slower results when they finish'
+    )
+
+  @patch(target='backup.myauth.open_ssh_session', side_effect=OSError('unreachable'))
+  def test_myauths_backups_with_failures(self, _):
+    hook = MagicMock()
+    results = myauths_backups(
+      myauths=[{'credentials': {'hostname': 'host'}, 'backup_settings': {}}],
+      ssh_client_options={'host_keys': 'keys'},
+      hooks=[hook]
+    )
+    self.assertEqual(
+      first=('host', None, 'unreachable'),
+      second=(results[0]['hostname'], results[0]['backups'], str(results[0]['error'])),
+      msg='Returns the error of the myauth server that failed'
+    )
+    self.assertEqual(
+      first=[('host', 'OSError: unreachable')],
+      second=[
+        (hook_call.kwargs['metrics'].device, hook_call.kwargs['metrics'].error) for hook_call in hook.call_args_list
+      ],
+      msg='Reports the metrics of the myauth server that failed, with its error'
+    )
+
+  @patch(target='backup.myauth.myauth_backup_result', side_effect=lambda unfinished: unfinished['credentials'])
+  @patch(target='backup.myauth.shared_client_options')
+  @patch(target='backup.myauth.started_myauth_backup')
+  def test_myauths_backups(self, mock_started_myauth_backup, mock_shared_client_options, _):
+    mock_started_myauth_backup.side_effect = lambda myauth, ssh_client_options, hooks, cpu_stage, storage: {
+      'credentials': myauth['credentials'],
+      'files': []
+    }
+    myauths = [{'credentials': {'hostname': 'host-{index}'.format(index=index)}} for index in range(5)]
+    ssh_client_options = {'hosts_keys_filename': 'tests/hosts_keys'}
+    hooks = [MagicMock()]
+
+    self.assertEqual(
+      first=[myauth['credentials'] for myauth in myauths],
+      second=myauths_backups(myauths=myauths, ssh_client_options=ssh_client_options, max_workers=2, hooks=hooks),
+      msg='Returns the result of each myauth server passed in the same order'
+    )
+    self.assertEqual(
+      first=[call(client_options=ssh_client_options)],
+      second=mock_shared_client_options.mock_calls,
+      msg='Loads the shared client options only once for all the servers'
+    )
+    self.assertCountEqual(
+      first=[
+        call(
+          myauth=myauth,
+          ssh_client_options=mock_shared_client_options.return_value,
+          hooks=hooks,
+          cpu_stage=None,
+          storage=ANY
+        ) for myauth in myauths
+      ],
+      second=mock_started_myauth_backup.mock_calls,
+      msg='Backups each myauth server passed using the shared client options'
+    )
+    self.assertIsInstance(
+      obj=mock_started_myauth_backup.call_args.kwargs['storage'],
+      cls=FilesystemStorage,
+      msg='Stores the files retrieved on the filesystem by default'
+    )
+    with self.assertRaises(expected_exception=ValueError, msg='Refuses a feature that reads the files back'):
+      myauths_backups(
+        myauths=[{'credentials': {'hostname': 'host'}, 'backup_settings': {'retention': {}}}],
+        ssh_client_options=ssh_client_options,
+        storage_options={'backend': 'tarball', 'filename': 'run.tar'}
+      )
+    self.assertEqual(
+      first=5,
+      second=mock_started_myauth_backup.call_count,
+      msg='Backups no myauth server when a feature is not supported by the storage'
+    )
@@ -0,0 +1,214 @@
+from contextlib import closing
+from datetime import datetime
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from backup.metrics import DeviceMetrics
+from backup.retention import connected_catalogue, file_kind, catalogued_files, kept_files, disposable_files, \
+  deleted_file, deleted_sidecar, pruned_files, device_retention
+
+
+def written_file(filename, size):
+  with open(filename, 'wb') as written:
+    written.write(b'x' * size)
+  return filename
+
+
+class TestFunctions(TestCase):
+
+  def test_connected_catalogue(self):
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'catalogue.sqlite')
+      with closing(connected_catalogue(filename=filename)):
+        pass
+      with closing(connected_catalogue(filename=filename)) as connection:
+        self.assertEqual(
+          first=[('files',)],
+          second=connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall(),
+          msg='Creates the table of the catalogue once'
+        )
+
+  def test_file_kind(self):
+    self.assertEqual(
+      first='.backup',
+      second=file_kind(filename='/backups/rtr-a_2020-01-01-00-00-00.backup'),
+      msg='Returns the extension of the file'
+    )
+    self.assertEqual(
+      first='.rsc',
+      second=file_kind(filename='/backups/rtr-a_2020-01-01-00-00-00.rsc.enc'),
+      msg='Returns the extension of the plain file for an encrypted file'
+    )
+
+  def test_catalogued_files(self):
+    with TemporaryDirectory() as directory, closing(connected_catalogue(filename=':memory:')) as connection:
+      filename = written_file(filename=path.join(directory, 'rtr-a.rsc'), size=3)
+      self.assertEqual(
+        first=[filename],
+        second=catalogued_files(
+          connection=connection,
+          device_id='rtr-a',
+          filenames=[filename],
+          created=datetime(year=2020, month=1, day=1)
+        ),
+        msg='Returns the filenames passed'
+      )
+      catalogued_files(
+        connection=connection,
+        device_id='rtr-a',
+        filenames=[filename],
+        created=datetime(year=2020, month=1, day=2)
+      )
+      self.assertEqual(
+        first=[(filename, 'rtr-a', '.rsc', '2020-01-02T00:00:00', 3)],
+        second=connection.execute('SELECT filename, device, kind, created, size FROM files').fetchall(),
+        msg='Catalogues each file once with its device, kind, creation and size'
+      )
+
+  def test_kept_files(self):
+    files = [
+      ('2019-12-15', '2019-12-15T10:00:00'),
+      ('2019-12-31', '2019-12-31T10:00:00'),
+      ('2020-01-01-early', '2020-01-01T01:00:00'),
+      ('2020-01-01', '2020-01-01T10:00:00'),
+      ('2020-01-02', '2020-01-02T10:00:00'),
+      ('2020-01-08', '2020-01-08T10:00:00'),
+    ]
+    self.assertEqual(
+      first={'2020-01-08', '2020-01-02'},
+      second=kept_files(files=files, policy={'daily': 2}),
+      msg='Keeps the newest file of each of the latest days'
+    )
+    self.assertEqual(
+      first={'2020-01-08', '2020-01-02', '2019-12-15'},
+      second=kept_files(files=files, policy={'weekly': 3}),
+      msg='Keeps the newest file of each of the latest (ISO) weeks'
+    )
+    self.assertEqual(
+      first={'2020-01-08', '2020-01-02', '2019-12-31'},
+      second=kept_files(files=files, policy={'daily': 2, 'monthly': 2, 'yearly': 3}),
+      msg='Keeps the files of every period of the policy'
+    )
+    self.assertEqual(
+      first=set(),
+      second=kept_files(files=files, policy={}),
+      msg='Keeps nothing without a policy'
+    )
+
+  def test_disposable_files(self):
+    with TemporaryDirectory() as directory, closing(connected_catalogue(filename=':memory:')) as connection:
+      for device, day in [('rtr-a', 1), ('rtr-a', 2), ('rtr-b', 1)]:
+        catalogued_files(
+          connection=connection,
+          device_id=device,
+          filenames=[
+            written_file(filename=path.join(directory, '{device}-{day}{kind}'.format(
+              device=device,
+              day=day,
+              kind=kind
+            )), size=day) for kind in ('.backup', '.rsc')
+          ],
+          created=datetime(year=2020, month=1, day=day)
+        )
+
+      self.assertEqual(
+        first=[(path.join(directory, 'rtr-a-1.backup'), 1), (path.join(directory, 'rtr-a-1.rsc'), 1)],
+        second=sorted(disposable_files(connection=connection, device_id='rtr-a', policy={'daily': 1})),
+        msg='Returns the files of each kind of the device passed not kept by the policy, with their sizes'
+      )
+
+  def test_deleted_file(self):
+    with TemporaryDirectory() as directory:
+      filename = written_file(filename=path.join(directory, 'file'), size=1)
+      self.assertTrue(
+        expr=deleted_file(filename=filename),
+        msg='Returns True when the file is deleted'
+      )
+      self.assertFalse(
+        expr=path.exists(filename),
+        msg='Deletes the file passed'
+      )
+      self.assertFalse(
+        expr=deleted_file(filename=filename),
+        msg='Returns False when the file was already gone'
+      )
+
+  def test_deleted_sidecar(self):
+    with TemporaryDirectory() as directory:
+      filename = written_file(filename=path.join(directory, 'rtr.backup'), size=1)
+      sidecar = written_file(filename='{filename}.sha256'.format(filename=filename), size=4)
+      self.assertEqual(
+        first=(4, False),
+        second=(deleted_sidecar(filename=filename), path.exists(sidecar)),
+        msg='Deletes the checksum sidecar of the file and returns its size'
+      )
+      self.assertEqual(
+        first=0,
+        second=deleted_sidecar(filename=filename),
+        msg='Reclaims nothing when the file has no checksum sidecar'
+      )
+
+  def test_pruned_files(self):
+    with TemporaryDirectory() as directory, closing(connected_catalogue(filename=':memory:')) as connection:
+      filenames = [written_file(filename=path.join(directory, str(size)), size=size) for size in (1, 2, 3)]
+      sidecar = written_file(filename='{filename}.sha256'.format(filename=filenames[0]), size=4)
+      catalogued_files(
+        connection=connection,
+        device_id='rtr-a',
+        filenames=filenames,
+        created=datetime(year=2020, month=1, day=1)
+      )
+      deleted_file(filename=filenames[2])
+
+      self.assertEqual(
+        first={'deleted_files': 2, 'reclaimed_bytes': 7},
+        second=pruned_files(
+          connection=connection,
+          files=[(filenames[0], 1), (filenames[1], 2), (filenames[2], 3)],
+          batch_size=2
+        ),
+        msg='Reports the files deleted and the bytes reclaimed, not counting the files already gone'
+      )
+      self.assertFalse(
+        expr=path.exists(sidecar),
+        msg='Deletes the checksum sidecars with the files pruned'
+      )
+      self.assertEqual(
+        first=[],
+        second=connection.execute('SELECT * FROM files').fetchall(),
+        msg='Removes the files pruned from the catalogue'
+      )
+
+  @patch(target='backup.retention.datetime')
+  def test_device_retention(self, mock_datetime):
+    metrics = DeviceMetrics(device='rtr-a')
+    with TemporaryDirectory() as directory:
+      retention = {'catalogue_filename': path.join(directory, 'catalogue.sqlite'), 'policy': {'daily': 1}}
+      old_backup = written_file(filename=path.join(directory, 'old.backup'), size=5)
+      new_backup = written_file(filename=path.join(directory, 'new.backup'), size=7)
+
+      mock_datetime.now.return_value = datetime(year=2020, month=1, day=1)
+      device_retention(retention=retention, device_id='rtr-a', filenames=[old_backup, None], metrics=metrics)
+      mock_datetime.now.return_value = datetime(year=2020, month=1, day=2)
+      self.assertEqual(
+        first={'deleted_files': 1, 'reclaimed_bytes': 5},
+        second=device_retention(retention=retention, device_id='rtr-a', filenames=[new_backup], metrics=metrics),
+        msg='Catalogues the files passed and prunes the files of the device not kept by the policy'
+      )
+      self.assertEqual(
+        first=[False, True],
+        second=[path.exists(old_backup), path.exists(new_backup)],
+        msg='Deletes only the files not kept by the policy'
+      )
+      self.assertEqual(
+        first=5,
+        second=metrics.reclaimed_bytes,
+        msg='Reports the bytes reclaimed on the metrics passed'
+      )
+      self.assertIn(
+        member='retention',
+        container=metrics.phases,
+        msg='Measures the time spent on the retention'
+      )
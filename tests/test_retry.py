@@ -0,0 +1,100 @@
+from errno import EBUSY
+from socket import timeout
+from unittest import TestCase
+from unittest.mock import MagicMock, call, patch
+
+from paramiko import AuthenticationException, SSHException
+
+from backup.metrics import DeviceMetrics
+from backup.retry import error_kind, backoff_seconds, retried, retried_phase
+
+
+class TestFunctions(TestCase):
+
+  def test_error_kind(self):
+    for error, kind, description in [
+      (AuthenticationException(), 'auth', 'an authentication failure'),
+      (FileNotFoundError(), 'other', 'a file not found'),
+      (PermissionError(), 'other', 'a permission denied'),
+      (OSError(EBUSY, 'busy'), 'remote_busy', 'a busy device'),
+      (OSError('Failure'), 'remote_busy', 'the generic sftp failure'),
+      (SSHException('Error reading SSH protocol banner'), 'network', 'an ssh protocol error'),
+      (EOFError(), 'network', 'a connection closed'),
+      (timeout(), 'network', 'a timeout'),
+      (ConnectionResetError(), 'network', 'a connection reset'),
+      (ValueError(), 'other', 'any other error')
+    ]:
+      self.assertEqual(
+        first=kind,
+        second=error_kind(error=error),
+        msg='Classifies {description} as {kind}'.format(description=description, kind=kind)
+      )
+
+  def test_backoff_seconds(self):
+    self.assertEqual(
+      first=[1, 2, 4, 8, 16, 30],
+      second=[backoff_seconds(retry_policy={}, attempt=attempt) for attempt in range(6)],
+      msg='Doubles the backoff on each attempt up to 30 seconds by default'
+    )
+    self.assertEqual(
+      first=[0.5, 1.5, 2],
+      second=[
+        backoff_seconds(
+          retry_policy={'backoff_seconds': 0.5, 'backoff_factor': 3, 'maximum_backoff_seconds': 2},
+          attempt=attempt
+        ) for attempt in range(3)
+      ],
+      msg='Uses the backoff of the retry policy passed'
+    )
+
+  @patch(target='backup.retry.sleep')
+  def test_retried(self, mock_sleep):
+    operation = MagicMock(side_effect=[EOFError, OSError('Failure'), 'result'])
+    self.assertEqual(
+      first='result',
+      second=retried(operation=operation, retry_policy={'attempts': 3}, phase='download'),
+      msg='Returns the result of the operation after retrying the transient errors'
+    )
+    self.assertEqual(
+      first=[call(1), call(2)],
+      second=mock_sleep.mock_calls,
+      msg='Backs off before each retry'
+    )
+
+    mock_sleep.reset_mock()
+    operation = MagicMock(side_effect=EOFError)
+    with self.assertRaises(expected_exception=EOFError):
+      retried(operation=operation, retry_policy={'attempts': 2}, phase='download')
+    self.assertEqual(
+      first=2,
+      second=operation.call_count,
+      msg='Raises the error when the attempts of the retry policy are over'
+    )
+
+    for retry_policy, phase, error, description in [
+      ({}, 'download', EOFError, 'without a retry policy'),
+      ({'attempts': 3}, 'generate', EOFError, 'on a phase that is not idempotent'),
+      ({'attempts': 3}, 'unknown', EOFError, 'on an unknown phase'),
+      ({'attempts': 3}, 'auth', AuthenticationException, 'on an authentication failure'),
+    ]:
+      operation = MagicMock(side_effect=error)
+      with self.assertRaises(expected_exception=error):
+        retried(operation=operation, retry_policy=retry_policy, phase=phase)
+      self.assertEqual(
+        first=1,
+        second=operation.call_count,
+        msg='Does not retry {description}'.format(description=description)
+      )
+
+  def test_retried_phase(self):
+    metrics = DeviceMetrics(device='device')
+    self.assertEqual(
+      first='result',
+      second=retried_phase(operation=lambda: 'result', retry_policy={}, phase='list', metrics=metrics),
+      msg='Returns the result of the operation'
+    )
+    self.assertIn(
+      member='list',
+      container=metrics.phases,
+      msg='Measures the phase with its retries on the metrics passed'
+    )
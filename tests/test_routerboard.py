@@ -1,14 +1,27 @@
 from datetime import datetime, timedelta
+from os import path
 from pathlib import PurePath
+from tempfile import TemporaryDirectory
+from threading import BoundedSemaphore, Event
 from unittest import TestCase
-from unittest.mock import patch, MagicMock, call
+from unittest.mock import patch, MagicMock, call, ANY
 
 from paramiko import SFTPAttributes
 
+from backup.checkpoint import CheckpointJournal, journal_entries, file_record
+from backup.cpu_stage import PendingFile
+from backup.metrics import DeviceMetrics, TransferProgress, json_lines_hook
 from backup.routerboard import make_filename, current_datetime, backup_filename, script_filename, backup_command, \
   export_command, generate_backup, retrieve_file, retrieve_backup_files, generate_export_script, backup, \
   remote_file_exists, timeout, assertion_on_remote_file, RemotePath, remotepath_without_root, \
-  routerboards_backups, remote_file_size_is_greater_than, remote_file_is_ready_to_be_retrieved
+  routerboards_backups, remote_file_size_is_greater_than, remote_file_is_ready_to_be_retrieved, generated_files, \
+  routerboard_backup, polled_evaluation, adaptive_routerboard_backup, adaptive_routerboards_backups, fleet_run, \
+  routerboards_order, sequential_routerboards_backups, changed_configuration_backup, with_stored_export, \
+  with_indexed_export, with_local_retention, iterated_routerboards_backups, command_timeout, executed_command, \
+  with_processed_files, routerboard_backup_result, started_routerboard_backup, finished_backup, \
+  iterated_routerboards_results, routerboards_results, adaptive_concurrency
+from backup.ssh_client import RemoteCommandError
+from backup.transfer import TokenBucket
 
 
 class TestRemotePath(TestCase):
@@ -154,52 +167,175 @@ class TestBackupFunctions(TestCase):
       msg='The function script_filename is called only once with the device_id passed'
     )
 
-  @patch(target='backup.routerboard.backup_command')
-  def test_generate_backup(self, mock_backup_command):
-    mock_backup_command.return_value = {'command': 'something', 'filename': 'some_file'}
-    device_id = 'some id'
-    backup_password = 'pass'
-    mock_ssh = MagicMock()
+  def test_command_timeout(self):
+    self.assertEqual(
+      first=10,
+      second=command_timeout(backup_options={'assertion_options': {'seconds_to_timeout': 10}}),
+      msg='Waits for the commands as long as for the files by default'
+    )
+    self.assertEqual(
+      first=60,
+      second=command_timeout(backup_options={
+        'assertion_options': {'seconds_to_timeout': 10},
+        'command_timeout_seconds': 60
+      }),
+      msg='Waits for the commands for the command timeout of the backup options passed'
+    )
 
+  @patch(target='backup.routerboard.completed_command')
+  def test_executed_command(self, mock_completed_command):
+    generation_command = {'command': '/system backup save name=rtr.backup password=secret', 'filename': 'rtr.backup'}
+    mock_completed_command.return_value = {'exit_status': 0, 'output': ''}
     self.assertEqual(
-      first=mock_backup_command.return_value['filename'],
-      second=generate_backup(device_id=device_id, backup_password=backup_password, ssh=mock_ssh),
-      msg='Returns the filename of the backup file generated'
+      first='rtr.backup',
+      second=executed_command(device_id='rtr', generation_command=generation_command, ssh='ssh', seconds_to_timeout=10),
+      msg='Returns the filename generated once the command completed'
+    )
+    self.assertEqual(
+      first=[call(ssh='ssh', command=generation_command['command'], seconds_to_timeout=10)],
+      second=mock_completed_command.call_args_list,
+      msg='Waits for the command to complete for the timeout passed'
     )
 
+    for result, description in [
+      ({'exit_status': 0, 'output': 'failure: not enough space\r\n'}, 'a failure'),
+      ({'exit_status': 0, 'output': 'Bad password\r\n'}, 'a bad password'),
+      ({'exit_status': 0, 'output': 'syntax error (line 1 column 8)\r\n'}, 'a syntax error'),
+      ({'exit_status': 1, 'output': ''}, 'an exit status other than zero')
+    ]:
+      mock_completed_command.return_value = result
+      with self.assertRaises(expected_exception=RemoteCommandError, msg='Raises on {description}'.format(
+        description=description
+      )) as raised:
+        executed_command(device_id='rtr', generation_command=generation_command, ssh='ssh', seconds_to_timeout=10)
+      self.assertNotIn(
+        member='secret',
+        container=str(raised.exception),
+        msg='Leaves the command, with the backup password, out of the error'
+      )
+
+  @patch(target='backup.routerboard.executed_command')
+  @patch(target='backup.routerboard.backup_command')
+  def test_generate_backup(self, mock_backup_command, mock_executed_command):
     self.assertEqual(
-      first=[
-        call.exec_command(command=mock_backup_command.return_value['command'])
-      ],
-      second=mock_ssh.mock_calls,
-      msg='Calls the exec_command on the ssh passed with the command acquired from the backup_command function'
+      first=mock_executed_command.return_value,
+      second=generate_backup(device_id='some id', backup_password='pass', ssh='ssh', seconds_to_timeout=10),
+      msg='Returns the filename of the backup file generated'
+    )
+    self.assertEqual(
+      first=[call(device_id='some id', backup_password='pass')],
+      second=mock_backup_command.call_args_list,
+      msg='Builds the backup command for the device_id and the backup_password passed'
+    )
+    self.assertEqual(
+      first=[call(
+        device_id='some id',
+        generation_command=mock_backup_command.return_value,
+        ssh='ssh',
+        seconds_to_timeout=10
+      )],
+      second=mock_executed_command.call_args_list,
+      msg='Executes the backup command on the ssh passed until it completes'
     )
 
+  @patch(target='backup.routerboard.executed_command')
   @patch(target='backup.routerboard.export_command')
-  def test_generate_export_script(self, mock_make_export_command):
-    mock_make_export_command.return_value = {'command': 'something', 'filename': 'some_file'}
-    device_id = 'some id'
-    mock_ssh = MagicMock()
-    expected_behaviour = [
-      call.exec_command(command=mock_make_export_command.return_value['command'])
-    ]
-
+  def test_generate_export_script(self, mock_export_command, mock_executed_command):
     self.assertEqual(
-      first=mock_make_export_command.return_value['filename'],
-      second=generate_export_script(device_id=device_id, ssh=mock_ssh),
+      first=mock_executed_command.return_value,
+      second=generate_export_script(device_id='some id', ssh='ssh', seconds_to_timeout=10),
       msg='Returns the filename of the script file generated'
     )
+    self.assertEqual(
+      first=[call(
+        device_id='some id',
+        generation_command=mock_export_command.return_value,
+        ssh='ssh',
+        seconds_to_timeout=10
+      )],
+      second=mock_executed_command.call_args_list,
+      msg='Executes the export command of the device_id passed on the ssh passed until it completes'
+    )
+
+  @patch(target='backup.retry.sleep')
+  @patch(target='backup.routerboard.retrieved')
+  @patch(target='backup.routerboard.remote_file_is_ready_to_be_retrieved', return_value=True)
+  def test_retrieve_file_with_retries(self, _, mock_retrieved, mock_sleep):
+    mock_retrieved.side_effect = [EOFError, 'local path']
+    sftp = MagicMock()
+    sftp.unlink.side_effect = [OSError('Failure'), None]
+
+    self.assertEqual(
+      first=PurePath('/backups/file.backup'),
+      second=retrieve_file(
+        filename='file.backup',
+        backup_options={
+          'backups_directory': '/backups/',
+          'assertion_options': {},
+          'retry_policy': {'attempts': 2, 'backoff_seconds': 5}
+        },
+        sftp=sftp,
+        metrics=DeviceMetrics(device='device'),
+        buckets=[]
+      ),
+      msg='Returns the localpath of the file retrieved after the retries'
+    )
+    self.assertEqual(
+      first=2,
+      second=mock_retrieved.call_count,
+      msg='Retries the download that failed with the retry policy of the backup options'
+    )
+    self.assertEqual(
+      first=2,
+      second=sftp.unlink.call_count,
+      msg='Retries the delete that failed with the retry policy of the backup options'
+    )
+    self.assertEqual(
+      first=[call(5), call(5)],
+      second=mock_sleep.mock_calls,
+      msg='Backs off before retrying each phase'
+    )
 
+  @patch(target='backup.routerboard.retrieved')
+  @patch(target='backup.routerboard.remote_file_is_ready_to_be_retrieved', return_value=True)
+  @patch(target='backup.routerboard.encryption_key', return_value=b'k' * 32)
+  def test_retrieve_file_encrypted(self, mock_encryption_key, _, mock_retrieved):
+    backup_options = {
+      'backups_directory': '/backups/',
+      'assertion_options': {},
+      'encryption': {'key_filename': '/backups.key'}
+    }
+    self.assertEqual(
+      first=PurePath('/backups/file.rsc.enc'),
+      second=retrieve_file(
+        filename='file.rsc',
+        backup_options=backup_options,
+        sftp=MagicMock(),
+        metrics=DeviceMetrics(device='device'),
+        buckets=[]
+      ),
+      msg='Returns the encrypted file retrieved when the backup options have an encryption'
+    )
     self.assertEqual(
-      first=expected_behaviour,
-      second=mock_ssh.mock_calls,
-      msg='Calls the exec_command on the ssh passed with the command acquired from the backup_command function'
+      first=[call(encryption={'key_filename': '/backups.key'})],
+      second=mock_encryption_key.call_args_list,
+      msg='Reads the key of the encryption of the backup options'
+    )
+    self.assertEqual(
+      first=('/backups/file.rsc.enc', b'k' * 32),
+      second=(mock_retrieved.call_args.kwargs['localpath'], mock_retrieved.call_args.kwargs['key']),
+      msg='Encrypts the file with the key as it is retrieved'
     )
 
+  @patch(target='backup.routerboard.retrieved')
   @patch(target='backup.routerboard.remote_file_is_ready_to_be_retrieved')
-  @patch(target='backup.routerboard.localpath', return_value='local path')
   @patch(target='backup.routerboard.RemotePath')
-  def test_retrieve_file(self, mock_remotepath, mock_localpath, mock_remote_file_is_ready_to_be_retrieved):
+  def test_retrieve_file(
+    self,
+    mock_remotepath,
+    mock_remote_file_is_ready_to_be_retrieved,
+    mock_retrieved
+  ):
     backup_options = {
       'backups_directory': '/backup/files/directory/path/',
       'assertion_options': {
@@ -209,39 +345,60 @@ class TestBackupFunctions(TestCase):
     }
     mock_sftp_session = MagicMock()
     filename = 'some filename'
+    metrics = DeviceMetrics(device='device')
+    storage = MagicMock()
+    storage.location.return_value = 'local path'
 
     mock_remote_file_is_ready_to_be_retrieved.return_value = True
     self.assertEqual(
-      first=mock_localpath.return_value,
+      first='local path',
       second=retrieve_file(
         filename=filename,
         backup_options=backup_options,
-        sftp=mock_sftp_session
+        sftp=mock_sftp_session,
+        metrics=metrics,
+        buckets=[],
+        storage=storage
       ),
-      msg='When the remote file exists, returns the localpath of the file retrieved (acquired with localpath function)'
+      msg='When the remote file exists, returns the localpath of the file retrieved (acquired from the storage passed)'
     )
     self.assertEqual(
-      first=[
-        call(
-          filename=filename,
-          backups_directory=backup_options['backups_directory']
-        )
-      ],
-      second=mock_localpath.mock_calls,
-      msg='Creates the localpath using the filename and backups_directory passed'
+      first=[call(directory=backup_options['backups_directory'], filename=filename)],
+      second=storage.location.call_args_list,
+      msg='Locates the file on the storage passed using the filename and backups_directory passed'
     )
     self.assertEqual(
-      first=[
-        call.get(remotepath=mock_remotepath().without_root, localpath=mock_localpath.return_value),
-        call.unlink(path=mock_remotepath().without_root)
-      ],
-      second=mock_sftp_session.mock_calls,
+      first=[call(
+        sftp=mock_sftp_session,
+        remotepath=mock_remotepath().without_root,
+        localpath='local path',
+        callback=ANY,
+        buckets=[],
+        key=None,
+        storage=storage
+      )],
+      second=mock_retrieved.call_args_list,
       msg=str(
-        'Calls .get method on the sftp passed with the remote path without root and localpath acquired from the '
-        'localpath function and the .unlink method is called with the remote path without root as the path parameter,'
-        'in that order'
+        'Retrieves the remote path without root to the localpath acquired from the storage with the sftp and the '
+        'storage passed'
       )
     )
+    self.assertEqual(
+      first=[call.unlink(path=mock_remotepath().without_root)],
+      second=mock_sftp_session.mock_calls,
+      msg='Unlinks the remote path without root once it is retrieved'
+    )
+
+    self.assertIsInstance(
+      obj=mock_retrieved.call_args.kwargs['callback'],
+      cls=TransferProgress,
+      msg='Accounts the bytes transferred on the metrics passed'
+    )
+    self.assertEqual(
+      first=['wait', 'download', 'delete'],
+      second=list(metrics.phases),
+      msg='Measures the time spent waiting for, downloading and deleting the remote file'
+    )
 
     self.assertIn(
       member=call(path=filename),
@@ -254,7 +411,9 @@ class TestBackupFunctions(TestCase):
       obj=retrieve_file(
         filename=filename,
         backup_options=backup_options,
-        sftp=mock_sftp_session
+        sftp=mock_sftp_session,
+        metrics=metrics,
+        buckets=[]
       ),
       msg='When remote file does not exists, return None'
     )
@@ -270,13 +429,17 @@ class TestBackupFunctions(TestCase):
       }
     }
     sftp_session = 'sftp session'
+    metrics = 'metrics'
+    buckets = ['bucket']
 
     self.assertEqual(
       first=[mock_retrieve_file.return_value for _ in range(0, len(filenames))],
       second=retrieve_backup_files(
         filenames=filenames,
         backup_options=backup_options,
-        sftp=sftp_session
+        sftp=sftp_session,
+        metrics=metrics,
+        buckets=buckets
       ),
       msg='Returns the filepaths acquired on the retrieve_file function with each filename passed'
     )
@@ -285,17 +448,58 @@ class TestBackupFunctions(TestCase):
       first=[call(
         filename=filename,
         backup_options=backup_options,
-        sftp=sftp_session
+        sftp=sftp_session,
+        metrics=metrics,
+        buckets=buckets,
+        storage=None
       ) for filename in filenames],
       second=mock_retrieve_file.mock_calls,
       msg='Calls the retrieve_file function with each filename passed as well as with the sftp passed'
     )
 
-  @patch(target='backup.routerboard.retrieve_backup_files', return_value=['first localpath', 'second localpath'])
   @patch(target='backup.routerboard.generate_backup', return_value='backup filename')
   @patch(target='backup.routerboard.generate_export_script', return_value='script filename')
-  def test_backup(self, mock_generate_export_script, mock_generate_backup, mock_retrieve_backup_files):
+  def test_generated_files(self, mock_generate_export_script, mock_generate_backup):
+    ssh = MagicMock()
+    routerboard = {
+      'name': 'router-identification',
+      'backup_options': {'assertion_options': {'seconds_to_timeout': 10}},
+      'backup_password': 'pass'
+    }
+    metrics = DeviceMetrics(device=routerboard['name'])
+
+    self.assertEqual(
+      first=[mock_generate_backup.return_value, mock_generate_export_script.return_value],
+      second=generated_files(routerboard=routerboard, ssh=ssh, metrics=metrics),
+      msg='Returns the filenames of the backup and of the script generated on the routerboard'
+    )
+    self.assertEqual(
+      first=[call(
+        device_id=routerboard['name'],
+        backup_password=routerboard['backup_password'],
+        ssh=ssh,
+        seconds_to_timeout=10
+      )],
+      second=mock_generate_backup.mock_calls,
+      msg='The generate_backup function is called with the device_id passed'
+    )
+    self.assertEqual(
+      first=[call(device_id=routerboard['name'], ssh=ssh, seconds_to_timeout=10)],
+      second=mock_generate_export_script.mock_calls,
+      msg='The generate_export_script function is called with the device_id passed'
+    )
+    self.assertIn(
+      member='generate',
+      container=metrics.phases,
+      msg='Measures the time spent generating the files on the metrics passed'
+    )
+
+  @patch(target='backup.routerboard.retrieve_backup_files', return_value=['first localpath', 'second localpath'])
+  @patch(target='backup.routerboard.generated_files', return_value=['backup filename', 'script filename'])
+  def test_backup(self, mock_generated_files, mock_retrieve_backup_files):
     ssh = MagicMock()
+    metrics = 'metrics'
+    buckets = ['bucket']
     routerboard = {
       'name': 'router-identification',
       'backup_options': {
@@ -312,37 +516,345 @@ class TestBackupFunctions(TestCase):
       first=mock_retrieve_backup_files.return_value,
       second=backup(
         routerboard=routerboard,
-        ssh=ssh
+        ssh=ssh,
+        sftp=ssh.open_sftp.return_value,
+        metrics=metrics,
+        buckets=buckets
       ),
       msg='Returns the list of files that were retrieved (acquired from the function retrieve_backup_files)'
     )
     self.assertEqual(
       first=[call(
-        filenames=[
-          mock_generate_backup.return_value,
-          mock_generate_export_script.return_value
-        ],
+        filenames=mock_generated_files.return_value,
         backup_options=routerboard['backup_options'],
-        sftp=ssh.open_sftp.return_value
+        sftp=ssh.open_sftp.return_value,
+        metrics=metrics,
+        buckets=buckets,
+        storage=None
       )],
       second=mock_retrieve_backup_files.mock_calls,
       msg='Retrieves the backup files generated'
     )
+    self.assertEqual(
+      first=[call(routerboard=routerboard, ssh=ssh, metrics=metrics)],
+      second=mock_generated_files.mock_calls,
+      msg='Generates the files on the routerboard passed'
+    )
+
+  @patch(target='backup.routerboard.changed_configuration_backup', return_value=['backup', 'script'])
+  def test_backup_skipping_unchanged(self, mock_changed_configuration_backup):
+    ssh = MagicMock()
+    routerboard = {
+      'name': 'router-identification',
+      'backup_options': {'backups_directory': '/backups/', 'skip_unchanged_backups': True}
+    }
+    self.assertEqual(
+      first=mock_changed_configuration_backup.return_value,
+      second=backup(routerboard=routerboard, ssh=ssh, sftp=ssh.open_sftp.return_value, metrics='metrics', buckets=['bucket']),
+      msg='Returns the files of the changed configuration backup when unchanged backups are skipped'
+    )
     self.assertEqual(
       first=[call(
-        device_id=routerboard['name'],
-        backup_password=routerboard['backup_password'],
-        ssh=ssh
+        routerboard=routerboard,
+        ssh=ssh,
+        sftp=ssh.open_sftp.return_value,
+        metrics='metrics',
+        buckets=['bucket'],
+        storage=None
       )],
+      second=mock_changed_configuration_backup.call_args_list,
+      msg='Backs up only the changed configuration of the routerboard passed'
+    )
+
+  @patch(target='backup.routerboard.saved_fingerprint')
+  @patch(target='backup.routerboard.unchanged_backup')
+  @patch(target='backup.routerboard.export_fingerprint', return_value='fingerprint')
+  @patch(target='backup.routerboard.retrieve_file', side_effect=lambda filename, **_: 'local ' + filename)
+  @patch(target='backup.routerboard.generate_backup', return_value='backup filename')
+  @patch(target='backup.routerboard.generate_export_script', return_value='script filename')
+  def test_changed_configuration_backup(
+    self,
+    mock_generate_export_script,
+    mock_generate_backup,
+    mock_retrieve_file,
+    mock_export_fingerprint,
+    mock_unchanged_backup,
+    mock_saved_fingerprint
+  ):
+    ssh = MagicMock()
+    sftp = MagicMock()
+    metrics = DeviceMetrics(device='router-identification')
+    routerboard = {
+      'name': 'router-identification',
+      'backup_options': {
+        'backups_directory': '/backups/',
+        'assertion_options': {'seconds_to_timeout': 10},
+        'skip_unchanged_backups': True
+      },
+      'backup_password': 'pass'
+    }
+
+    mock_unchanged_backup.return_value = '/backups/last.backup'
+    self.assertEqual(
+      first=['/backups/last.backup', 'local script filename'],
+      second=changed_configuration_backup(
+        routerboard=routerboard,
+        ssh=ssh,
+        sftp=sftp,
+        metrics=metrics,
+        buckets=['bucket']
+      ),
+      msg='Returns the last backup and the export when the configuration did not change'
+    )
+    self.assertEqual(
+      first=[call(
+        filename='/backups/router-identification.fingerprint',
+        fingerprint='fingerprint',
+        maximum_age_seconds=604800
+      )],
+      second=mock_unchanged_backup.call_args_list,
+      msg='Compares the fingerprint of the export with the one stored for the routerboard, for a week by default'
+    )
+    self.assertEqual(
+      first=[call(filename='local script filename', key=None)],
+      second=mock_export_fingerprint.call_args_list,
+      msg='Fingerprints the export retrieved'
+    )
+    self.assertEqual(
+      first=[],
       second=mock_generate_backup.mock_calls,
-      msg='The generate_backup function is called with the device_id passed'
+      msg='Does not generate the backup when the configuration did not change'
     )
+    self.assertIn(
+      member='generate',
+      container=metrics.phases,
+      msg='Measures the time spent generating the export'
+    )
+
+    mock_unchanged_backup.return_value = None
     self.assertEqual(
-      first=[call(device_id=routerboard['name'], ssh=ssh)],
-      second=mock_generate_export_script.mock_calls,
-      msg='The generate_export_script function is called with the device_id passed'
+      first=['local backup filename', 'local script filename'],
+      second=changed_configuration_backup(
+        routerboard=routerboard,
+        ssh=ssh,
+        sftp=sftp,
+        metrics=metrics,
+        buckets=['bucket']
+      ),
+      msg='Returns the new backup and the export when the configuration changed'
+    )
+    self.assertEqual(
+      first=[call(device_id='router-identification', backup_password='pass', ssh=ssh, seconds_to_timeout=10)],
+      second=mock_generate_backup.call_args_list,
+      msg='Generates the backup when the configuration changed'
+    )
+    self.assertEqual(
+      first=call(
+        filename='backup filename',
+        backup_options=routerboard['backup_options'],
+        sftp=sftp,
+        metrics=metrics,
+        buckets=['bucket'],
+        storage=None
+      ),
+      second=mock_retrieve_file.call_args_list[-1],
+      msg='Retrieves the backup generated'
+    )
+    self.assertEqual(
+      first=[call(
+        filename='/backups/router-identification.fingerprint',
+        fingerprint='fingerprint',
+        backup_localpath='local backup filename'
+      )],
+      second=mock_saved_fingerprint.call_args_list,
+      msg='Stores the fingerprint of the export with the backup retrieved'
+    )
+
+    mock_saved_fingerprint.reset_mock()
+    mock_retrieve_file.side_effect = None
+    mock_retrieve_file.return_value = None
+    self.assertEqual(
+      first=[None, None],
+      second=changed_configuration_backup(
+        routerboard=routerboard,
+        ssh=ssh,
+        sftp=sftp,
+        metrics=metrics,
+        buckets=['bucket']
+      ),
+      msg='Returns None for the files that could not be retrieved'
+    )
+    self.assertEqual(
+      first=call(filename='/backups/router-identification.fingerprint', fingerprint=None, maximum_age_seconds=604800),
+      second=mock_unchanged_backup.call_args_list[-1],
+      msg='Has no fingerprint to compare when the export could not be retrieved'
+    )
+    self.assertEqual(
+      first=[],
+      second=mock_saved_fingerprint.mock_calls,
+      msg='Does not store a fingerprint without a backup retrieved'
+    )
+
+    routerboard['backup_options']['maximum_unchanged_age_seconds'] = 86400
+    changed_configuration_backup(routerboard=routerboard, ssh=ssh, sftp=sftp, metrics=metrics, buckets=['bucket'])
+    self.assertEqual(
+      first=86400,
+      second=mock_unchanged_backup.call_args.kwargs['maximum_age_seconds'],
+      msg='Keeps the last backup for the maximum unchanged age of the backup options'
+    )
+
+  @patch(target='backup.routerboard.routerboard_export_indexed')
+  def test_with_indexed_export(self, mock_routerboard_export_indexed):
+    metrics = DeviceMetrics(device='router-identification')
+    routerboard = {'name': 'router-identification', 'backup_options': {}}
+    self.assertEqual(
+      first=['backup', 'script'],
+      second=with_indexed_export(routerboard=routerboard, backup_files=['backup', 'script'], metrics=metrics),
+      msg='Returns the files passed'
+    )
+    routerboard['backup_options']['export_index'] = {'filename': 'index.sqlite'}
+    with_indexed_export(routerboard=routerboard, backup_files=['backup', None], metrics=metrics)
+    self.assertEqual(
+      first=[],
+      second=mock_routerboard_export_indexed.mock_calls,
+      msg='Indexes nothing without an export index or without an export'
+    )
+    self.assertEqual(
+      first=['backup', 'script'],
+      second=with_indexed_export(routerboard=routerboard, backup_files=['backup', 'script'], metrics=metrics),
+      msg='Returns the files passed after indexing the export'
+    )
+    self.assertEqual(
+      first=[call(routerboard=routerboard, script_localpath='script')],
+      second=mock_routerboard_export_indexed.mock_calls,
+      msg='Indexes the export retrieved on the export index'
+    )
+    self.assertIn(
+      member='index',
+      container=metrics.phases,
+      msg='Measures the time spent indexing the export'
+    )
+
+  def test_with_processed_files(self):
+    metrics = DeviceMetrics(device='router-identification')
+    routerboard = {'name': 'router-identification', 'backup_options': {}}
+    self.assertEqual(
+      first=['backup', 'script'],
+      second=with_processed_files(
+        routerboard=routerboard,
+        backup_files=['backup', 'script'],
+        metrics=metrics,
+        cpu_stage=None
+      ),
+      msg='Returns the files passed when there is no cpu stage'
+    )
+
+    cpu_stage = MagicMock()
+    cpu_stage.pending_files.side_effect = lambda localpaths: [localpath + '.gz' for localpath in localpaths]
+    self.assertEqual(
+      first=['backup.gz', 'script.gz'],
+      second=with_processed_files(
+        routerboard=routerboard,
+        backup_files=['backup', 'script'],
+        metrics=metrics,
+        cpu_stage=cpu_stage
+      ),
+      msg='Returns the files pending on the cpu stage passed'
+    )
+    self.assertIn(
+      member='process',
+      container=metrics.phases,
+      msg='Measures the time spent waiting for room on the cpu stage'
+    )
+
+    routerboard['backup_options']['export_store'] = {'directory': '/store'}
+    self.assertEqual(
+      first=['backup.gz', 'script'],
+      second=with_processed_files(
+        routerboard=routerboard,
+        backup_files=['backup', 'script'],
+        metrics=metrics,
+        cpu_stage=cpu_stage
+      ),
+      msg='Leaves the export to the export store, which reads it plain'
     )
 
+  @patch(target='backup.routerboard.device_retention')
+  def test_with_local_retention(self, mock_device_retention):
+    routerboard = {'name': 'router-identification', 'backup_options': {}}
+    self.assertEqual(
+      first=['backup', 'script'],
+      second=with_local_retention(routerboard=routerboard, backup_files=['backup', 'script'], metrics='metrics'),
+      msg='Returns the files passed'
+    )
+    self.assertEqual(
+      first=[],
+      second=mock_device_retention.mock_calls,
+      msg='Does not apply a retention when there is none'
+    )
+
+    routerboard['backup_options']['retention'] = {'catalogue_filename': 'catalogue.sqlite', 'policy': {'daily': 7}}
+    with_local_retention(routerboard=routerboard, backup_files=['backup', 'script'], metrics='metrics')
+    self.assertEqual(
+      first=[call(
+        retention=routerboard['backup_options']['retention'],
+        device_id='router-identification',
+        filenames=['backup', 'script'],
+        metrics='metrics'
+      )],
+      second=mock_device_retention.mock_calls,
+      msg='Applies the retention of the routerboard to the files retrieved'
+    )
+
+  def test_with_stored_export(self):
+    metrics = DeviceMetrics(device='router-identification')
+    with TemporaryDirectory() as directory:
+      script_localpath = path.join(directory, 'router-identification.rsc')
+      with open(script_localpath, 'w') as script:
+        script.write('/interface bridge\nadd name=bridge1\n')
+      routerboard = {
+        'name': 'router-identification',
+        'backup_options': {'backups_directory': directory}
+      }
+
+      self.assertEqual(
+        first=['backup', script_localpath],
+        second=with_stored_export(routerboard=routerboard, backup_files=['backup', script_localpath], metrics=metrics),
+        msg='Returns the files passed when there is no export store'
+      )
+
+      routerboard['backup_options']['export_store'] = {'directory': path.join(directory, 'exports')}
+      self.assertEqual(
+        first=['backup', None],
+        second=with_stored_export(routerboard=routerboard, backup_files=['backup', None], metrics=metrics),
+        msg='Returns the files passed when there is no export to store'
+      )
+      self.assertEqual(
+        first=['backup', script_localpath],
+        second=with_stored_export(routerboard=routerboard, backup_files=['backup', script_localpath], metrics=metrics),
+        msg='Keeps the export retrieved when the plain exports are not removed'
+      )
+      self.assertTrue(
+        expr=path.exists(path.join(directory, 'exports', 'router-identification', '00000000.rsc')),
+        msg='Stores the export on the export store'
+      )
+      self.assertIn(
+        member='store',
+        container=metrics.phases,
+        msg='Measures the time spent storing the export'
+      )
+
+      routerboard['backup_options']['export_store']['remove_plain_exports'] = True
+      self.assertEqual(
+        first=['backup', path.join(directory, 'exports', 'router-identification', '00000001.json')],
+        second=with_stored_export(routerboard=routerboard, backup_files=['backup', script_localpath], metrics=metrics),
+        msg='Returns the version stored in place of the export when the plain exports are removed'
+      )
+      self.assertFalse(
+        expr=path.exists(script_localpath),
+        msg='Removes the export retrieved once it is stored'
+      )
+
   def test_remote_file_exists(self):
     sftp = MagicMock()
     assertion_options = {
@@ -392,6 +904,41 @@ class TestBackupFunctions(TestCase):
       msg='Returns True if the amount of seconds has passed starting from the start_time passed'
     )
 
+  def test_polled_evaluation(self):
+    evaluation_params = {
+      'evaluation_function': MagicMock(),
+      'assertion_options': {
+        'seconds_to_timeout': 10,
+        'minimum_size_in_bytes': 77
+      }
+    }
+    metrics = DeviceMetrics(device='device')
+
+    self.assertEqual(
+      first=evaluation_params['evaluation_function'].return_value,
+      second=polled_evaluation(
+        evaluation_params=evaluation_params,
+        remotepath='remotepath',
+        sftp='sftp',
+        metrics=metrics
+      ),
+      msg='Returns the result of the evaluation function'
+    )
+    self.assertEqual(
+      first=[call(
+        assertion_options=evaluation_params['assertion_options'],
+        remotepath='remotepath',
+        sftp='sftp'
+      )],
+      second=evaluation_params['evaluation_function'].call_args_list,
+      msg='Evaluates the remote file with the assertion options passed'
+    )
+    self.assertEqual(
+      first=1,
+      second=metrics.polls,
+      msg='Counts the poll on the metrics passed'
+    )
+
   @patch(target='backup.routerboard.timeout')
   def test_assertion_on_remote_file(self, mock_timeout):
     evaluation_params = {
@@ -408,7 +955,8 @@ class TestBackupFunctions(TestCase):
       expr=assertion_on_remote_file(
         evaluation_params=evaluation_params,
         remotepath='',
-        sftp=''
+        sftp='',
+        metrics=DeviceMetrics(device='device')
       ),
       msg='Returns False when the timeout has passed and the evaluation fails'
     )
@@ -419,7 +967,8 @@ class TestBackupFunctions(TestCase):
       expr=assertion_on_remote_file(
         evaluation_params=evaluation_params,
         remotepath='',
-        sftp=''
+        sftp='',
+        metrics=DeviceMetrics(device='device')
       ),
       msg='Returns True if the evaluation passes, regardless of the timeout being expired'
     )
@@ -430,7 +979,8 @@ class TestBackupFunctions(TestCase):
       expr=assertion_on_remote_file(
         evaluation_params=evaluation_params,
         remotepath='',
-        sftp=''
+        sftp='',
+        metrics=DeviceMetrics(device='device')
       ),
       msg='Returns True if the evaluation passes and the timeout has not expired'
     )
@@ -441,7 +991,8 @@ class TestBackupFunctions(TestCase):
       expr=assertion_on_remote_file(
         evaluation_params=evaluation_params,
         remotepath='',
-        sftp=''
+        sftp='',
+        metrics=DeviceMetrics(device='device')
       ),
       msg=str(
         'Returns True even if the evaluation fails the first time that the check was made, just the timeout needs to '
@@ -465,13 +1016,15 @@ class TestBackupFunctions(TestCase):
     }
     remotepath = MagicMock()
     sftp = MagicMock()
+    metrics = 'metrics'
 
     mock_assertion_on_remote_file.side_effect = [True, True]
     self.assertTrue(
       expr=remote_file_is_ready_to_be_retrieved(
         assertion_options=assertion_options,
         remotepath=remotepath,
-        sftp=sftp
+        sftp=sftp,
+        metrics=metrics
       ),
       msg='Returns False when both assertions on the remote file fail'
     )
@@ -480,12 +1033,14 @@ class TestBackupFunctions(TestCase):
         call(
           evaluation_params=evaluation_params_remote_file_exists,
           remotepath=remotepath,
-          sftp=sftp
+          sftp=sftp,
+          metrics=metrics
         ),
         call(
           evaluation_params=evaluation_params_remote_file_size_is_greater_than,
           remotepath=remotepath,
-          sftp=sftp
+          sftp=sftp,
+          metrics=metrics
         )
       ],
       container=mock_assertion_on_remote_file.mock_calls,
@@ -497,7 +1052,8 @@ class TestBackupFunctions(TestCase):
       expr=remote_file_is_ready_to_be_retrieved(
         assertion_options=assertion_options,
         remotepath=remotepath,
-        sftp=sftp
+        sftp=sftp,
+        metrics=metrics
       ),
       msg='Returns False when both assertions on the remote file fail'
     )
@@ -507,7 +1063,8 @@ class TestBackupFunctions(TestCase):
       expr=remote_file_is_ready_to_be_retrieved(
         assertion_options=assertion_options,
         remotepath=remotepath,
-        sftp=sftp
+        sftp=sftp,
+        metrics=metrics
       ),
       msg='Returns False when both assertions on the remote file fail'
     )
@@ -517,7 +1074,8 @@ class TestBackupFunctions(TestCase):
       expr=remote_file_is_ready_to_be_retrieved(
         assertion_options=assertion_options,
         remotepath=remotepath,
-        sftp=sftp
+        sftp=sftp,
+        metrics=metrics
       ),
       msg='Returns False when both assertions on the remote file fail'
     )
@@ -601,60 +1159,931 @@ class TestBackupFunctions(TestCase):
 
   @patch(target='backup.routerboard.open_ssh_session')
   @patch(target='backup.routerboard.backup')
-  def test_routerboards_backups(self, mock_backup, mock_open_ssh_session):
+  def test_routerboard_backup(self, mock_backup, mock_open_ssh_session):
     ssh_client_options = {
       'hosts_keys_filename': 'tests/hosts_keys',
     }
+    routerboard = {
+      'name': 'rtr',
+      'site': 'tower-a',
+      'backup_options': {},
+      'credentials': {
+        'username': 'user',
+        'hostname': 'host',
+        'port': 1234,
+        'pkey': 'key'
+      }
+    }
+    hooks = [MagicMock()]
+    site_bucket = TokenBucket(bytes_per_second=1)
+    global_bucket = TokenBucket(bytes_per_second=2)
+    fleet = {
+      'hooks': hooks,
+      'buckets': {'global': global_bucket, 'sites': {'tower-a': site_bucket}}
+    }
+    metrics = DeviceMetrics(device='rtr')
+
     self.assertEqual(
-      first=[],
-      second=routerboards_backups(
-        routerboards=[],
-        ssh_client_options=ssh_client_options
+      first=mock_backup.return_value,
+      second=routerboard_backup(
+        routerboard=routerboard,
+        ssh_client_options=ssh_client_options,
+        fleet=fleet,
+        metrics=metrics
       ),
-      msg='Returns an empty list when there is no routerboards to backup'
+      msg='Returns the backup of the routerboard passed'
+    )
+    self.assertEqual(
+      first=[call(
+        client_options=ssh_client_options,
+        credentials=routerboard['credentials'],
+        metrics=metrics
+      )],
+      second=mock_open_ssh_session.call_args_list,
+      msg='Opens a ssh session with the routerboard credentials measuring it on the same metrics'
+    )
+    self.assertEqual(
+      first=[call(
+        routerboard=routerboard,
+        ssh=mock_open_ssh_session.return_value.__enter__.return_value,
+        sftp=mock_open_ssh_session.return_value.__enter__.return_value.open_sftp.return_value,
+        metrics=metrics,
+        buckets=[site_bucket, global_bucket],
+        cpu_stage=None,
+        storage=None
+      )],
+      second=mock_backup.call_args_list,
+      msg='Backups the routerboard using the ssh session opened limited by the buckets of its site and the global one'
+    )
+    self.assertEqual(
+      first=[call.close()],
+      second=mock_open_ssh_session.return_value.__enter__.return_value.open_sftp.return_value.mock_calls,
+      msg='Closes the sftp channel of the session once the routerboard is backed up'
     )
 
-    routerboards = [
-      {
-        'name': 'rtr',
-        'backup_password': 'pass',
-        'backups_directory': '/backups/',
-        'credentials': {
-          'username': 'user',
-          'hostname': 'host',
-          'port': 1234,
-          'pkey': 'key'
-        }
-      }
-    ]
+  @patch(target='backup.routerboard.routerboard_backup')
+  def test_started_routerboard_backup(self, mock_routerboard_backup):
+    routerboard = {'name': 'rtr'}
+    fleet = {'hooks': []}
+    unfinished = started_routerboard_backup(routerboard=routerboard, ssh_client_options='options', fleet=fleet)
+    self.assertEqual(
+      first={
+        'routerboard': routerboard,
+        'fleet': fleet,
+        'metrics': mock_routerboard_backup.call_args.kwargs['metrics'],
+        'files': mock_routerboard_backup.return_value,
+        'error': None
+      },
+      second=unfinished,
+      msg='Returns the files of the routerboard passed, which may be still on the cpu stage, to be finished later'
+    )
+    self.assertEqual(
+      first=routerboard['name'],
+      second=unfinished['metrics'].device,
+      msg='Measures the backup on metrics identified by the routerboard name'
+    )
+
+    error = RemoteCommandError('not enough space')
+    mock_routerboard_backup.side_effect = error
+    unfinished = started_routerboard_backup(routerboard=routerboard, ssh_client_options='options', fleet=fleet)
+    self.assertEqual(
+      first=([], error),
+      second=(unfinished['files'], unfinished['error']),
+      msg='Keeps the error raised instead of the files when the backup of the routerboard fails'
+    )
+
+  @patch(target='backup.routerboard.reported_metrics')
+  @patch(target='backup.routerboard.finished_backup')
+  def test_routerboard_backup_result(self, mock_finished_backup, mock_reported_metrics):
+    hooks = [MagicMock()]
+    journal = MagicMock()
+    metrics = DeviceMetrics(device='rtr')
+    unfinished = {
+      'routerboard': {'name': 'rtr'},
+      'fleet': {'hooks': hooks, 'journal': journal},
+      'metrics': metrics,
+      'files': ['backup', 'script'],
+      'error': None
+    }
+    self.assertEqual(
+      first={'name': 'rtr', 'backups': mock_finished_backup.return_value, 'error': None},
+      second=routerboard_backup_result(unfinished=unfinished),
+      msg='Returns the backups of the routerboard identified by its name'
+    )
+    self.assertEqual(
+      first=[call(routerboard={'name': 'rtr'}, backup_files=['backup', 'script'], journal=journal, metrics=metrics)],
+      second=mock_finished_backup.call_args_list,
+      msg='Finishes the files of the routerboard'
+    )
+    self.assertEqual(
+      first=[call(metrics=metrics, hooks=hooks)],
+      second=mock_reported_metrics.call_args_list,
+      msg='Reports the metrics of the routerboard to the hooks of the fleet once it is finished'
+    )
+
+    error = OSError('the gzip failed')
+    mock_finished_backup.side_effect = error
+    self.assertEqual(
+      first={'name': 'rtr', 'backups': None, 'error': error},
+      second=routerboard_backup_result(unfinished=unfinished),
+      msg='Returns the error raised when the files of the routerboard can not be finished'
+    )
+
+    error = RemoteCommandError('not enough space')
+    metrics = DeviceMetrics(device='rtr')
+    self.assertEqual(
+      first={'name': 'rtr', 'backups': None, 'error': error},
+      second=routerboard_backup_result(unfinished={**unfinished, 'metrics': metrics, 'files': [], 'error': error}),
+      msg='Returns the error raised instead of the backups when the backup of the routerboard fails'
+    )
+    self.assertEqual(
+      first=(2, 'RemoteCommandError: not enough space', call(metrics=metrics, hooks=hooks)),
+      second=(mock_finished_backup.call_count, metrics.error, mock_reported_metrics.call_args),
+      msg='Reports the metrics of the failed backup too, with its error, without finishing it'
+    )
+
+  @patch(target='backup.routerboard.with_stored_export', side_effect=lambda backup_files, **_: backup_files)
+  @patch(target='backup.routerboard.with_local_retention', side_effect=lambda backup_files, **_: backup_files)
+  def test_finished_backup(self, mock_with_local_retention, mock_with_stored_export):
+    routerboard = {'name': 'rtr', 'backup_options': {}}
+    metrics = DeviceMetrics(device='rtr')
+    with TemporaryDirectory() as directory:
+      journal = CheckpointJournal(filename=path.join(directory, 'journal.jsonl'))
+      script_localpath = path.join(directory, 'rtr.rsc.gz')
+      with open(script_localpath, 'w') as script_file:
+        script_file.write('script')
+      future = MagicMock()
+      future.result.return_value = script_localpath
+      self.assertEqual(
+        first=[None, script_localpath],
+        second=finished_backup(
+          routerboard=routerboard,
+          backup_files=[None, PendingFile(localpath=path.join(directory, 'rtr.rsc'), future=future)],
+          journal=journal,
+          metrics=metrics
+        ),
+        msg='Returns the files processed by the cpu stage'
+      )
+      self.assertEqual(
+        first=[call(routerboard=routerboard, backup_files=[None, script_localpath], metrics=metrics)],
+        second=mock_with_local_retention.call_args_list,
+        msg='Applies the local retention to the files processed'
+      )
+      self.assertEqual(
+        first=[call(routerboard=routerboard, backup_files=[None, script_localpath], metrics=metrics)],
+        second=mock_with_stored_export.call_args_list,
+        msg='Stores the export after the local retention'
+      )
+      self.assertEqual(
+        first=[
+          {'status': 'run', 'started': journal.run_started},
+          {'device': 'rtr', 'status': 'finished', 'files': [None, file_record(localpath=script_localpath)]}
+        ],
+        second=journal_entries(filename=journal.filename),
+        msg='Journals the routerboard as finished with its files'
+      )
+    self.assertEqual(
+      first=['backup'],
+      second=finished_backup(routerboard=routerboard, backup_files=['backup'], journal=None, metrics=metrics),
+      msg='Journals nothing without a journal'
+    )
+
+  @patch(target='backup.routerboard.reclaimed_leftovers')
+  @patch(target='backup.routerboard.open_ssh_session')
+  @patch(target='backup.routerboard.backup', return_value=[None, None])
+  def test_routerboard_backup_with_journal(
+    self,
+    mock_backup,
+    mock_open_ssh_session,
+    mock_reclaimed_leftovers
+  ):
+    ssh = mock_open_ssh_session.return_value.__enter__.return_value
+    routerboard = {'name': 'rtr', 'backup_options': {}, 'credentials': {}}
+    with TemporaryDirectory() as directory:
+      journal = CheckpointJournal(filename=path.join(directory, 'journal.jsonl'))
+      fleet = {'hooks': [], 'buckets': {'global': None, 'sites': {}}, 'journal': journal}
+
+      routerboard_backup(
+        routerboard=routerboard,
+        ssh_client_options={},
+        fleet=fleet,
+        metrics=DeviceMetrics(device='rtr')
+      )
+      self.assertEqual(
+        first=[],
+        second=mock_reclaimed_leftovers.mock_calls,
+        msg='Does not look for leftovers of a routerboard that was not interrupted'
+      )
+      self.assertEqual(
+        first=[{'status': 'run', 'started': journal.run_started}, {'device': 'rtr', 'status': 'started'}],
+        second=journal_entries(filename=journal.filename),
+        msg='Journals the routerboard as started before the backup, it is finished once its files are'
+      )
+
+      journal.interrupted.add('rtr')
+      routerboard_backup(
+        routerboard=routerboard,
+        ssh_client_options={},
+        fleet=fleet,
+        metrics=DeviceMetrics(device='rtr')
+      )
+      self.assertEqual(
+        first=[call(sftp=ssh.open_sftp.return_value, device_id='rtr', metrics=mock_backup.call_args.kwargs['metrics'])],
+        second=mock_reclaimed_leftovers.call_args_list,
+        msg='Reclaims the leftovers of the interrupted backup of the routerboard before backing it up again'
+      )
+
+  @patch(target='backup.routerboard.swept_remote_files')
+  @patch(target='backup.routerboard.open_ssh_session')
+  @patch(target='backup.routerboard.backup')
+  def test_routerboard_backup_with_sweep(self, mock_backup, mock_open_ssh_session, mock_swept_remote_files):
+    ssh = mock_open_ssh_session.return_value.__enter__.return_value
+    routerboard = {'name': 'rtr', 'backup_options': {'sweep': {'minimum_age_seconds': 60}}, 'credentials': {}}
+    routerboard_backup(
+      routerboard=routerboard,
+      ssh_client_options={},
+      fleet={'hooks': [], 'buckets': {'global': None, 'sites': {}}},
+      metrics=DeviceMetrics(device='rtr')
+    )
+    self.assertEqual(
+      first=[call(
+        sftp=ssh.open_sftp.return_value,
+        device_id='rtr',
+        sweep_options={'minimum_age_seconds': 60},
+        metrics=mock_backup.call_args.kwargs['metrics']
+      )],
+      second=mock_swept_remote_files.call_args_list,
+      msg='Sweeps the stale files of the routerboard on the same session, with the sweep options of the routerboard'
+    )
+
+  @patch(target='backup.routerboard.routerboard_backup_result', side_effect=lambda unfinished: unfinished['name'])
+  @patch(target='backup.routerboard.sequential_routerboards_backups')
+  def test_iterated_routerboards_results_with_checkpoint(self, mock_sequential_routerboards_backups, _):
+    mock_sequential_routerboards_backups.side_effect = lambda routerboards, **kwargs: iter([
+      (index, {'name': routerboard['name'], 'files': []}) for index, routerboard in enumerate(routerboards)
+    ])
+    routerboards = [{'name': 'rtr-a'}, {'name': 'rtr-b'}]
+    with TemporaryDirectory() as directory:
+      journal_filename = path.join(directory, 'journal.jsonl')
+      backup_localpath = path.join(directory, 'rtr-b.backup')
+      with open(backup_localpath, 'w') as backup_file:
+        backup_file.write('backup')
+      CheckpointJournal(filename=journal_filename).finished(device='rtr-b', localpaths=[backup_localpath, None])
+
+      self.assertEqual(
+        first=[(1, {'name': 'rtr-b', 'backups': [backup_localpath, None], 'error': None}), (0, 'rtr-a')],
+        second=list(iterated_routerboards_results(
+          routerboards=routerboards,
+          ssh_client_options={},
+          fleet_options={'checkpoint': {'journal_filename': journal_filename}}
+        )),
+        msg='Yields the files journaled for the routerboards finished by the interrupted run without backing them up'
+      )
+      self.assertEqual(
+        first=[routerboards[0]],
+        second=mock_sequential_routerboards_backups.call_args.kwargs['routerboards'],
+        msg='Backs up only the routerboards not finished'
+      )
+      self.assertFalse(
+        expr=path.exists(journal_filename),
+        msg='Clears the journal once the run is complete'
+      )
 
+  @patch(target='backup.routerboard.storage_backend')
+  @patch(target='backup.routerboard.site_slots')
+  @patch(target='backup.routerboard.bandwidth_buckets')
+  def test_fleet_run(self, mock_bandwidth_buckets, mock_site_slots, mock_storage_backend):
+    hooks = [MagicMock()]
+    routerboards = [{'name': 'rtr', 'site': 'tower-a'}]
+    self.assertEqual(
+      first={
+        'hooks': hooks,
+        'buckets': mock_bandwidth_buckets.return_value,
+        'site_slots': mock_site_slots.return_value,
+        'journal': None,
+        'cpu_stage': None,
+        'storage': mock_storage_backend.return_value
+      },
+      second=fleet_run(
+        routerboards=routerboards,
+        hooks=hooks,
+        fleet_options={'bandwidth_limits': {'global_mbps': 10}, 'schedule': {'max_jobs_per_site': 2}}
+      ),
+      msg=str(
+        'Returns the hooks passed along with the bandwidth buckets and the site slots from the fleet options, without '
+        'a checkpoint journal nor a cpu stage when the fleet options have none, and the storage backend'
+      )
+    )
+    self.assertEqual(
+      first=call(storage_options=None, durability_options=None),
+      second=mock_storage_backend.call_args,
+      msg='Creates the default storage backend when the fleet options have no storage nor durability'
+    )
+    self.assertEqual(
+      first=[call(bandwidth_limits={'global_mbps': 10})],
+      second=mock_bandwidth_buckets.call_args_list,
+      msg='Creates the bandwidth buckets from the bandwidth limits of the fleet options'
+    )
+    self.assertEqual(
+      first=[call(routerboards=routerboards, max_jobs_per_site=2)],
+      second=mock_site_slots.call_args_list,
+      msg='Creates the site slots for the sites of the routerboards passed'
+    )
+    fleet_run(routerboards=routerboards, hooks=hooks, fleet_options={})
+    self.assertEqual(
+      first=call(bandwidth_limits={}),
+      second=mock_bandwidth_buckets.call_args,
+      msg='Creates no limits when the fleet options have no bandwidth limits'
+    )
+    self.assertEqual(
+      first=call(routerboards=routerboards, max_jobs_per_site=None),
+      second=mock_site_slots.call_args,
+      msg='Creates no site slots when the fleet options have no schedule'
+    )
+    with patch(target='backup.routerboard.CheckpointJournal') as mock_checkpoint_journal:
+      self.assertEqual(
+        first=mock_checkpoint_journal.return_value,
+        second=fleet_run(
+          routerboards=routerboards,
+          hooks=hooks,
+          fleet_options={'checkpoint': {'journal_filename': 'journal.jsonl'}}
+        )['journal'],
+        msg='Has a checkpoint journal when the fleet options have checkpoint options'
+      )
+      fleet_run(
+        routerboards=routerboards,
+        hooks=hooks,
+        fleet_options={'checkpoint': {'journal_filename': 'journal.jsonl', 'max_age_seconds': 3600}}
+      )
     self.assertEqual(
-      first=[mock_backup.return_value for _ in routerboards],
+      first=[
+        call(filename='journal.jsonl', max_age_seconds=86400),
+        call(filename='journal.jsonl', max_age_seconds=3600)
+      ],
+      second=mock_checkpoint_journal.call_args_list,
+      msg='Creates the journal on the journal file of the checkpoint options, resumed for a day by default'
+    )
+    with patch(target='backup.routerboard.CPUStage') as mock_cpu_stage:
+      self.assertEqual(
+        first=mock_cpu_stage.return_value,
+        second=fleet_run(
+          routerboards=routerboards,
+          hooks=hooks,
+          fleet_options={'cpu_stage': {'jobs': ['sha256'], 'workers': 2}}
+        )['cpu_stage'],
+        msg='Has a cpu stage with the cpu stage options'
+      )
+    self.assertEqual(
+      first=[call(jobs=['sha256'], workers=2)],
+      second=mock_cpu_stage.call_args_list,
+      msg='Creates the cpu stage once for the fleet run'
+    )
+    fleet_options = {'durability': {'fsync': 'file'}, 'storage': {'backend': 'tarball', 'filename': 'run.tar'}}
+    fleet_run(routerboards=[{'name': 'rtr', 'backup_options': {}}], hooks=hooks, fleet_options=fleet_options)
+    self.assertEqual(
+      first=call(storage_options=fleet_options['storage'], durability_options=fleet_options['durability']),
+      second=mock_storage_backend.call_args,
+      msg='Creates the storage backend with the storage and the durability options'
+    )
+    with self.assertRaises(expected_exception=ValueError, msg='Refuses to index the encrypted exports in plain text'):
+      fleet_run(
+        routerboards=[{'name': 'rtr', 'backup_options': {'export_index': {}, 'encryption': {}}}],
+        hooks=hooks,
+        fleet_options={}
+      )
+    with self.assertRaises(expected_exception=ValueError, msg='Refuses a feature that reads the files back'):
+      fleet_run(
+        routerboards=[{'name': 'rtr', 'backup_options': {'skip_unchanged_backups': True}}],
+        hooks=hooks,
+        fleet_options=fleet_options
+      )
+
+  @patch(target='backup.routerboard.historical_durations')
+  @patch(target='backup.routerboard.scheduled_order')
+  def test_routerboards_order(self, mock_scheduled_order, mock_historical_durations):
+    routerboards = [{'name': 'rtr-a'}, {'name': 'rtr-b'}]
+    self.assertEqual(
+      first=[0, 1],
+      second=routerboards_order(routerboards=routerboards, fleet_options={}),
+      msg='Keeps the order of the routerboards passed when the fleet options have no schedule'
+    )
+    self.assertEqual(
+      first=mock_scheduled_order.return_value,
+      second=routerboards_order(
+        routerboards=routerboards,
+        fleet_options={'schedule': {'history_filename': 'metrics.jsonl'}}
+      ),
+      msg='Returns the order scheduled from the history of durations when the fleet options have a schedule'
+    )
+    self.assertEqual(
+      first=[call(filename='metrics.jsonl')],
+      second=mock_historical_durations.call_args_list,
+      msg='Reads the durations from the history file of the schedule'
+    )
+    self.assertEqual(
+      first=[call(routerboards=routerboards, durations=mock_historical_durations.return_value)],
+      second=mock_scheduled_order.call_args_list,
+      msg='Schedules the routerboards passed with the historical durations'
+    )
+
+  @patch(target='backup.routerboard.started_routerboard_backup')
+  def test_sequential_routerboards_backups(self, mock_routerboard_backup):
+    mock_routerboard_backup.side_effect = lambda routerboard, **kwargs: routerboard['name']
+    routerboards = [{'name': 'rtr-a'}, {'name': 'rtr-b'}]
+
+    self.assertEqual(
+      first=[(0, 'rtr-a'), (1, 'rtr-b')],
+      second=list(sequential_routerboards_backups(
+        routerboards=routerboards,
+        ssh_client_options='options',
+        fleet='fleet'
+      )),
+      msg='Yields the index and the backup of each routerboard in the routerboards passed as it finishes'
+    )
+    self.assertEqual(
+      first=[
+        call(routerboard=routerboard, ssh_client_options='options', fleet='fleet')
+        for routerboard in routerboards
+      ],
+      second=mock_routerboard_backup.mock_calls,
+      msg='Backups each routerboard in the routerboards passed, one after the other, as part of the fleet run'
+    )
+
+  @patch(target='backup.routerboard.iterated_routerboards_backups', return_value=iter([(1, 'rtr-b'), (0, 'rtr-a')]))
+  def test_routerboards_backups(self, mock_iterated_routerboards_backups):
+    routerboards = [{'name': 'rtr-a'}, {'name': 'rtr-b'}]
+    hooks = [MagicMock()]
+
+    self.assertEqual(
+      first=['rtr-a', 'rtr-b'],
       second=routerboards_backups(
         routerboards=routerboards,
-        ssh_client_options=ssh_client_options
+        ssh_client_options='options',
+        hooks=hooks,
+        fleet_options='fleet options'
       ),
-      msg='Returns the backup for each routerboard in the routerboards passed'
+      msg='Returns the backup for each routerboard in the same order of the routerboards passed'
+    )
+    self.assertEqual(
+      first=[call(routerboards=routerboards, ssh_client_options='options', hooks=hooks, fleet_options='fleet options')],
+      second=mock_iterated_routerboards_backups.call_args_list,
+      msg='Backups the routerboards passed'
     )
 
-    self.assertIn(
-      member=[
-        call(
-          routerboard=routerboard,
-          ssh=mock_open_ssh_session.return_value.__enter__.return_value
-        ) for routerboard in routerboards
+  @patch(target='backup.routerboard.routerboard_backup')
+  def test_routerboards_results_with_failures(self, mock_routerboard_backup):
+    error = RemoteCommandError('not enough space')
+    mock_routerboard_backup.side_effect = [error, ['rtr-b.backup', 'rtr-b.rsc']]
+    hook = MagicMock()
+    self.assertEqual(
+      first=[
+        {'name': 'rtr-a', 'backups': None, 'error': error},
+        {'name': 'rtr-b', 'backups': ['rtr-b.backup', 'rtr-b.rsc'], 'error': None}
       ],
-      container=mock_backup.mock_calls,
-      msg='Backups each routerboard in the routerboards passed'
+      second=routerboards_results(
+        routerboards=[{'name': 'rtr-a', 'backup_options': {}}, {'name': 'rtr-b', 'backup_options': {}}],
+        ssh_client_options='options',
+        hooks=[hook]
+      ),
+      msg='Backs up the rest of the routerboards when one of them fails, returning its error'
+    )
+    self.assertEqual(
+      first=2,
+      second=hook.call_count,
+      msg='Reports the metrics of every routerboard, failed or not'
+    )
+
+  @patch(target='backup.routerboard.iterated_routerboards_results', return_value=iter([(1, 'rtr-b'), (0, 'rtr-a')]))
+  def test_routerboards_results(self, mock_iterated_routerboards_results):
+    routerboards = [{'name': 'rtr-a'}, {'name': 'rtr-b'}]
+    self.assertEqual(
+      first=['rtr-a', 'rtr-b'],
+      second=routerboards_results(routerboards=routerboards, ssh_client_options='options'),
+      msg='Returns the result for each routerboard in the same order of the routerboards passed'
+    )
+    self.assertEqual(
+      first=[call(routerboards=routerboards, ssh_client_options='options', hooks=(), fleet_options=None)],
+      second=mock_iterated_routerboards_results.call_args_list,
+      msg='Backups the routerboards passed'
+    )
+
+  @patch(target='backup.routerboard.routerboard_backup')
+  def test_routerboards_backups_with_failures(self, mock_routerboard_backup):
+    error = RemoteCommandError('not enough space')
+    mock_routerboard_backup.side_effect = [error, ['rtr-b.backup', 'rtr-b.rsc']]
+    with self.assertRaises(expected_exception=RemoteCommandError) as context:
+      routerboards_backups(
+        routerboards=[{'name': 'rtr-a', 'backup_options': {}}, {'name': 'rtr-b', 'backup_options': {}}],
+        ssh_client_options='options'
+      )
+    self.assertEqual(
+      first=error,
+      second=context.exception,
+      msg='Raises the error of the routerboard that fails'
+    )
+
+  @patch(target='backup.routerboard.iterated_routerboards_results')
+  def test_iterated_routerboards_backups(self, mock_iterated_routerboards_results):
+    error = RemoteCommandError('not enough space')
+    closed = []
+
+    def results():
+      try:
+        yield 1, {'name': 'rtr-b', 'backups': ['rtr-b.backup'], 'error': None}
+        yield 0, {'name': 'rtr-a', 'backups': None, 'error': error}
+        yield 2, {'name': 'rtr-c', 'backups': ['rtr-c.backup'], 'error': None}
+      finally:
+        closed.append(True)
+
+    mock_iterated_routerboards_results.return_value = results()
+    backups = iterated_routerboards_backups(routerboards='routerboards', ssh_client_options='options')
+    self.assertEqual(
+      first=(1, ['rtr-b.backup']),
+      second=next(backups),
+      msg='Yields the index and the backups of each routerboard as it finishes'
+    )
+    with self.assertRaises(expected_exception=RemoteCommandError) as context:
+      next(backups)
+    self.assertEqual(
+      first=error,
+      second=context.exception,
+      msg='Raises the error of the first routerboard that fails'
+    )
+    self.assertEqual(
+      first=[True],
+      second=closed,
+      msg='Closes the results of the run when a routerboard fails, so it is cleaned up'
+    )
+    mock_iterated_routerboards_results.return_value = (
+      result for result in [(0, {'name': 'rtr-a', 'backups': ['rtr-a.backup'], 'error': None})]
+    )
+    self.assertEqual(
+      first=[(0, ['rtr-a.backup'])],
+      second=list(iterated_routerboards_backups(routerboards='routerboards', ssh_client_options='options')),
+      msg='Yields the backups of every routerboard when none of them fails'
+    )
+    self.assertEqual(
+      first=call(routerboards='routerboards', ssh_client_options='options', hooks=(), fleet_options=None),
+      second=mock_iterated_routerboards_results.call_args,
+      msg='Backups the routerboards passed'
     )
 
+  @patch(target='backup.routerboard.routerboard_backup_result')
+  @patch(target='backup.routerboard.fleet_run')
+  @patch(target='backup.routerboard.sequential_routerboards_backups')
+  def test_iterated_routerboards_results_with_cpu_stage(self, mock_sequential_routerboards_backups, mock_fleet_run, _):
+    cpu_stage = MagicMock()
+    mock_fleet_run.return_value = {'hooks': [], 'journal': None, 'cpu_stage': cpu_stage}
+    mock_sequential_routerboards_backups.return_value = iter([(0, {'files': []})])
+    results = iterated_routerboards_results(routerboards=[{'name': 'rtr'}], ssh_client_options={})
+    next(results)
+    self.assertEqual(
+      first=[],
+      second=cpu_stage.shutdown.mock_calls,
+      msg='Keeps the cpu stage while the routerboards are backed up'
+    )
+    list(results)
+    self.assertEqual(
+      first=[call()],
+      second=cpu_stage.shutdown.mock_calls,
+      msg='Shuts the cpu stage down once the run is over'
+    )
+
+  @patch(target='backup.routerboard.routerboard_backup_result')
+  @patch(target='backup.routerboard.fleet_run')
+  @patch(target='backup.routerboard.sequential_routerboards_backups')
+  def test_iterated_routerboards_results_with_storage(self, mock_sequential_routerboards_backups, mock_fleet_run, _):
+    storage = MagicMock()
+    mock_fleet_run.return_value = {'hooks': [], 'journal': None, 'storage': storage}
+    mock_sequential_routerboards_backups.return_value = iter([(0, {'files': []})])
+    list(iterated_routerboards_results(routerboards=[{'name': 'rtr'}], ssh_client_options={}))
+    self.assertEqual(
+      first=[call()],
+      second=storage.closed.mock_calls,
+      msg='Closes the storage once the run is over'
+    )
+
+  @patch(target='backup.routerboard.routerboard_backup_result', side_effect=lambda unfinished: unfinished['name'])
+  @patch(target='backup.routerboard.fleet_run')
+  @patch(target='backup.routerboard.routerboards_order', return_value=[1, 0])
+  @patch(target='backup.routerboard.sequential_routerboards_backups')
+  def test_iterated_routerboards_results(
+    self,
+    mock_sequential_routerboards_backups,
+    mock_routerboards_order,
+    mock_fleet_run,
+    mock_routerboard_backup_result
+  ):
+    mock_fleet_run.return_value = {'hooks': [], 'journal': None}
+    mock_sequential_routerboards_backups.side_effect = lambda routerboards, **kwargs: iter([
+      (index, {'name': routerboard['name'], 'files': []})
+      for index, routerboard in reversed(list(enumerate(routerboards)))
+    ])
+    ssh_client_options = {
+      'hosts_keys_filename': 'tests/hosts_keys',
+    }
+    routerboards = [{'name': 'rtr-a'}, {'name': 'rtr-b'}]
+    hooks = [MagicMock()]
+
+    self.assertEqual(
+      first=[(0, 'rtr-a'), (1, 'rtr-b')],
+      second=list(iterated_routerboards_results(
+        routerboards=routerboards,
+        ssh_client_options=ssh_client_options,
+        hooks=hooks
+      )),
+      msg='Yields the index on the routerboards passed and the result of each routerboard as it finishes'
+    )
+    self.assertEqual(
+      first=[call(unfinished={'name': 'rtr-a', 'files': []}), call(unfinished={'name': 'rtr-b', 'files': []})],
+      second=mock_routerboard_backup_result.call_args_list,
+      msg='Finishes the backup of each routerboard once its files are processed'
+    )
+    self.assertEqual(
+      first=[call(
+        routerboards=[routerboards[1], routerboards[0]],
+        ssh_client_options=ssh_client_options,
+        fleet=mock_fleet_run.return_value
+      )],
+      second=mock_sequential_routerboards_backups.mock_calls,
+      msg='Backups the routerboards one after the other in the order scheduled when there is no concurrency'
+    )
+    self.assertEqual(
+      first=[call(routerboards=routerboards, hooks=hooks, fleet_options={})],
+      second=mock_fleet_run.call_args_list,
+      msg='Sets up the fleet run with the routerboards and the hooks passed'
+    )
+    self.assertEqual(
+      first=[call(routerboards=routerboards, fleet_options={})],
+      second=mock_routerboards_order.call_args_list,
+      msg='Schedules the routerboards passed'
+    )
+
+  @patch(target='backup.routerboard.disk_write_latency', return_value=0.001)
+  @patch(target='backup.routerboard.started_routerboard_backup')
+  def test_adaptive_routerboard_backup(self, mock_routerboard_backup, mock_disk_write_latency):
+    routerboard = {'name': 'rtr', 'site': 'tower-a', 'backup_options': {'backups_directory': '/backups/'}}
+    ssh_client_options = {'hosts_keys_filename': 'tests/hosts_keys'}
+    hooks = [MagicMock()]
+    fleet = {'hooks': hooks, 'buckets': 'buckets', 'site_slots': {}}
+    concurrency = MagicMock()
+    concurrency.slot.return_value.__enter__.return_value = 3
+
+    self.assertEqual(
+      first=mock_routerboard_backup.return_value,
+      second=adaptive_routerboard_backup(
+        routerboard=routerboard,
+        ssh_client_options=ssh_client_options,
+        fleet=fleet,
+        concurrency=concurrency
+      ),
+      msg='Returns the backup of the routerboard passed'
+    )
     self.assertIn(
-      member=[
-        call(
-          client_options=ssh_client_options,
-          credentials=routerboard['credentials']
-        ) for routerboard in routerboards
+      member=call.slot(),
+      container=concurrency.mock_calls,
+      msg='Waits for a slot on the concurrency passed before the backup'
+    )
+    current_fleet = mock_routerboard_backup.call_args.kwargs['fleet']
+    current_hooks = current_fleet['hooks']
+    self.assertEqual(
+      first=hooks,
+      second=current_hooks[:-1],
+      msg='Reports the metrics to the hooks of the fleet passed'
+    )
+    self.assertEqual(
+      first='buckets',
+      second=current_fleet['buckets'],
+      msg='Keeps the rest of the fleet passed'
+    )
+
+    metrics = DeviceMetrics(device='rtr')
+    metrics.transferred(size=10)
+    metrics.phases['download'] = 2
+    current_hooks[-1](metrics=metrics)
+    self.assertIn(
+      member=call.observed(epoch=3, failed=False, device='rtr', throughput=5, disk_write_latency=0.001),
+      container=concurrency.mock_calls,
+      msg='Reports the throughput and the disk write latency of the backup to the concurrency passed'
+    )
+    self.assertEqual(
+      first=[call(directory=routerboard['backup_options']['backups_directory'])],
+      second=mock_disk_write_latency.mock_calls,
+      msg='Probes the disk write latency on the backups directory of the routerboard'
+    )
+
+    metrics = DeviceMetrics(device='rtr')
+    metrics.failed(error=OSError('unreachable'))
+    current_hooks[-1](metrics=metrics)
+    self.assertIn(
+      member=call.observed(epoch=3, failed=True, device='rtr', throughput=None, disk_write_latency=0.001),
+      container=concurrency.mock_calls,
+      msg='Reports the failure of the backup to the concurrency passed'
+    )
+
+  @patch(target='backup.routerboard.adaptive_routerboard_backup')
+  def test_adaptive_routerboards_backups(self, mock_adaptive_routerboard_backup):
+    mock_adaptive_routerboard_backup.side_effect = lambda routerboard, **kwargs: routerboard['name']
+    routerboards = [{'name': 'rtr-{index}'.format(index=index)} for index in range(5)]
+    concurrency = MagicMock(ceiling=2)
+    fleet = {'site_slots': {}}
+
+    self.assertCountEqual(
+      first=[(index, routerboard['name']) for index, routerboard in enumerate(routerboards)],
+      second=list(adaptive_routerboards_backups(
+        routerboards=routerboards,
+        ssh_client_options='options',
+        fleet=fleet,
+        concurrency=concurrency
+      )),
+      msg='Yields the index and the backup of each routerboard in the routerboards passed as it finishes'
+    )
+    self.assertCountEqual(
+      first=[
+        call(routerboard=routerboard, ssh_client_options='options', fleet=fleet, concurrency=concurrency)
+        for routerboard in routerboards
       ],
-      container=mock_open_ssh_session.mock_calls,
-      msg='Opens a ssh session for each routerboard in the routerboards passed'
+      second=mock_adaptive_routerboard_backup.mock_calls,
+      msg='Backups each routerboard under the concurrency passed'
+    )
+
+  @patch(target='backup.routerboard.adaptive_routerboard_backup')
+  def test_adaptive_routerboards_backups_as_they_finish(self, mock_adaptive_routerboard_backup):
+    slow_backup_released = Event()
+    mock_adaptive_routerboard_backup.side_effect = lambda routerboard, **kwargs: (
+      slow_backup_released.wait(timeout=5) if routerboard['name'] == 'slow' else True
+    ) and routerboard['name']
+    backups = adaptive_routerboards_backups(
+      routerboards=[{'name': 'slow'}, {'name': 'fast'}],
+      ssh_client_options='options',
+      fleet={'site_slots': {}},
+      concurrency=MagicMock(ceiling=2)
+    )
+
+    self.assertEqual(
+      first=(1, 'fast'),
+      second=next(backups),
+      msg='Yields each backup as soon as it finishes, before the slower ones'
+    )
+    slow_backup_released.set()
+    self.assertEqual(
+      first=[(0, 'slow')],
+      second=list(backups),
+      msg='Yields the slower backups when they finish'
+    )
+
+  def test_adaptive_concurrency(self):
+    self.assertEqual(
+      first=(2, {}),
+      second=(lambda concurrency: (concurrency.ceiling, concurrency.best_throughputs))(
+        adaptive_concurrency(concurrency_options={'floor': 1, 'ceiling': 2})
+      ),
+      msg='Creates the adaptive concurrency with the concurrency options, without throughputs when there is no history'
+    )
+    with TemporaryDirectory() as directory:
+      history_filename = path.join(directory, 'metrics.jsonl')
+      metrics = DeviceMetrics(device='rtr-a')
+      metrics.transferred(size=1000)
+      metrics.phases['download'] = 2
+      json_lines_hook(filename=history_filename)(metrics=metrics)
+      self.assertEqual(
+        first={'rtr-a': 500},
+        second=adaptive_concurrency(
+          concurrency_options={'floor': 1, 'ceiling': 2, 'history_filename': history_filename}
+        ).best_throughputs,
+        msg='Starts from the best throughputs recorded on the history of the concurrency options'
+      )
+
+  @patch(target='backup.routerboard.disk_write_latency', return_value=0.001)
+  @patch(target='backup.routerboard.finished_backup', return_value=['backup', 'script'])
+  @patch(target='backup.routerboard.routerboard_backup')
+  def test_adaptive_routerboards_backups_with_slower_devices(self, mock_routerboard_backup, *_):
+    def slower_backup(metrics, **kwargs):
+      metrics.transferred(size=100)
+      metrics.phases['download'] = 1
+      return ['backup', 'script']
+
+    mock_routerboard_backup.side_effect = slower_backup
+    routerboards = [
+      {'name': 'rtr-{index}'.format(index=index), 'backup_options': {'backups_directory': '/backups/'}}
+      for index in range(4)
+    ]
+    with TemporaryDirectory() as directory:
+      history_filename = path.join(directory, 'metrics.jsonl')
+      history_hook = json_lines_hook(filename=history_filename)
+      for routerboard in routerboards:  # the previous run, at 1000 bytes per second
+        metrics = DeviceMetrics(device=routerboard['name'])
+        metrics.transferred(size=1000)
+        metrics.phases['download'] = 1
+        history_hook(metrics=metrics)
+
+      limits = {}
+      for name, concurrency_options in [
+        ('without history', {'floor': 1, 'ceiling': 4, 'initial': 4}),
+        ('with history', {'floor': 1, 'ceiling': 4, 'initial': 4, 'history_filename': history_filename})
+      ]:
+        concurrency = adaptive_concurrency(concurrency_options=concurrency_options)
+        for _, unfinished in adaptive_routerboards_backups(
+          routerboards=routerboards,
+          ssh_client_options='options',
+          fleet={'hooks': [], 'site_slots': {}, 'journal': None},
+          concurrency=concurrency
+        ):
+          routerboard_backup_result(unfinished=unfinished)
+        limits[name] = concurrency.limit
+
+    self.assertEqual(
+      first=4,
+      second=limits['without history'],
+      msg='Keeps the limit without the throughputs of the previous runs, each device being backed up once'
+    )
+    self.assertLessEqual(
+      a=limits['with history'],
+      b=2,
+      msg='Lowers the limit when distinct devices, each backed up once, are slower than on the previous runs'
+    )
+
+  @patch(target='backup.routerboard.adaptive_routerboard_backup')
+  def test_adaptive_routerboards_backups_with_site_slots(self, mock_adaptive_routerboard_backup):
+    first_backup_released = Event()
+    started = []
+
+    def adaptive_routerboard_backup(routerboard, **kwargs):
+      started.append(routerboard['name'])
+      if routerboard['name'] == 'rtr-a1':
+        first_backup_released.wait(timeout=5)
+      return routerboard['name']
+
+    mock_adaptive_routerboard_backup.side_effect = adaptive_routerboard_backup
+    backups = adaptive_routerboards_backups(
+      routerboards=[
+        {'name': 'rtr-a1', 'site': 'tower-a'},
+        {'name': 'rtr-a2', 'site': 'tower-a'},
+        {'name': 'rtr-b', 'site': 'tower-b'}
+      ],
+      ssh_client_options='options',
+      fleet={'site_slots': {'tower-a': BoundedSemaphore(value=1)}},
+      concurrency=MagicMock(ceiling=2)
+    )
+
+    self.assertEqual(
+      first=(2, 'rtr-b'),
+      second=next(backups),
+      msg='Backs up the routerboards of the other sites while the slots of a site are taken'
+    )
+    self.assertEqual(
+      first=['rtr-a1', 'rtr-b'],
+      second=started,
+      msg='Holds back the routerboards of a site without free slots instead of having a worker wait for one'
+    )
+    first_backup_released.set()
+    self.assertEqual(
+      first=[(0, 'rtr-a1'), (1, 'rtr-a2')],
+      second=list(backups),
+      msg='Backs up the routerboards held back once a slot of their site is free'
+    )
+
+  @patch(target='backup.routerboard.routerboard_backup_result', side_effect=lambda unfinished: unfinished['name'])
+  @patch(target='backup.routerboard.fleet_run')
+  @patch(target='backup.routerboard.shared_client_options')
+  @patch(target='backup.routerboard.AdaptiveConcurrency')
+  @patch(target='backup.routerboard.adaptive_routerboards_backups')
+  def test_routerboards_results_with_concurrency(
+    self,
+    mock_adaptive_routerboards_backups,
+    MockAdaptiveConcurrency,
+    mock_shared_client_options,
+    mock_fleet_run,
+    _
+  ):
+    mock_adaptive_routerboards_backups.return_value = iter([(0, {'name': 'backup', 'files': []})])
+    mock_fleet_run.return_value = {'hooks': [], 'journal': None}
+    routerboards = [{'name': 'rtr'}]
+    hooks = [MagicMock()]
+    fleet_options = {'concurrency': {'floor': 1, 'ceiling': 8}}
+
+    self.assertEqual(
+      first=['backup'],
+      second=routerboards_results(
+        routerboards=routerboards,
+        ssh_client_options='options',
+        hooks=hooks,
+        fleet_options=fleet_options
+      ),
+      msg='Returns the results of the backups made under adaptive concurrency when the fleet options have them'
+    )
+    self.assertEqual(
+      first=[call(floor=1, ceiling=8, best_throughputs=None)],
+      second=MockAdaptiveConcurrency.mock_calls,
+      msg='Creates the adaptive concurrency with the concurrency options'
+    )
+    self.assertEqual(
+      first=[call(
+        routerboards=routerboards,
+        ssh_client_options=mock_shared_client_options.return_value,
+        fleet=mock_fleet_run.return_value,
+        concurrency=MockAdaptiveConcurrency.return_value
+      )],
+      second=mock_adaptive_routerboards_backups.call_args_list,
+      msg='Backups the routerboards sharing the client options between the workers'
     )
@@ -0,0 +1,217 @@
+from json import dumps
+from os import path
+from tempfile import TemporaryDirectory
+from threading import BoundedSemaphore
+from unittest import TestCase
+
+from backup.scheduler import historical_durations, expected_durations, site_of, scheduled_order, in_original_order, \
+  site_slots, acquired_site_slot, released_site_slot, record_throughput, historical_throughputs
+
+
+def routerboard(name, site=None):
+  return {'name': name, 'site': site} if site else {'name': name}
+
+
+class TestFunctions(TestCase):
+
+  def test_historical_durations(self):
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'metrics.jsonl')
+      self.assertEqual(
+        first={},
+        second=historical_durations(filename=filename),
+        msg='Returns no durations when there is no history yet'
+      )
+
+      with open(filename, 'w') as json_lines:
+        for device, phases in [
+          ('rtr-a', {'connect': 1, 'download': 3}),
+          ('rtr-b', {'connect': 1}),
+          ('rtr-a', {'connect': 1, 'download': 5}),
+          ('rtr-a', {'connect': 1, 'download': 7})
+        ]:
+          json_lines.write('{record}\n'.format(record=dumps({'device': device, 'phases': phases})))
+
+      self.assertEqual(
+        first={'rtr-a': 6, 'rtr-b': 1},
+        second=historical_durations(filename=filename),
+        msg='Returns the mean of the total duration of the backups recorded for each device'
+      )
+      self.assertEqual(
+        first={'rtr-a': 7, 'rtr-b': 1},
+        second=historical_durations(filename=filename, history_size=2),
+        msg='Considers only the latest backups of each device up to the history size'
+      )
+
+  def test_record_throughput(self):
+    self.assertEqual(
+      first=500,
+      second=record_throughput(record={'phases': {'download': 2}, 'bytes_transferred': 1000, 'error': None}),
+      msg='Returns the bytes transferred per second of download of the record passed'
+    )
+    self.assertIsNone(
+      obj=record_throughput(record={'phases': {'connect': 1}, 'bytes_transferred': 0, 'error': None}),
+      msg='Returns None for a record without download'
+    )
+    self.assertIsNone(
+      obj=record_throughput(record={'phases': {'download': 2}, 'bytes_transferred': 10, 'error': 'OSError: reset'}),
+      msg='Returns None for a failed backup'
+    )
+
+  def test_historical_throughputs(self):
+    with TemporaryDirectory() as directory:
+      filename = path.join(directory, 'metrics.jsonl')
+      self.assertEqual(
+        first={},
+        second=historical_throughputs(filename=filename),
+        msg='Returns no throughputs when there is no history yet'
+      )
+
+      with open(filename, 'w') as json_lines:
+        for device, download_seconds, error in [
+          ('rtr-a', 1, None),
+          ('rtr-b', 4, None),
+          ('rtr-a', 2, None),
+          ('rtr-a', 4, None),
+          ('rtr-b', 1, 'OSError: reset')
+        ]:
+          json_lines.write('{record}\n'.format(record=dumps({
+            'device': device,
+            'phases': {'connect': 1, 'download': download_seconds},
+            'bytes_transferred': 4000,
+            'error': error
+          })))
+
+      self.assertEqual(
+        first={'rtr-a': 4000, 'rtr-b': 1000},
+        second=historical_throughputs(filename=filename),
+        msg='Returns the best throughput of the backups recorded for each device, failed ones aside'
+      )
+      self.assertEqual(
+        first={'rtr-a': 2000, 'rtr-b': 1000},
+        second=historical_throughputs(filename=filename, history_size=2),
+        msg='Considers only the latest backups of each device up to the history size'
+      )
+
+  def test_expected_durations(self):
+    routerboards = [routerboard(name='rtr-a'), routerboard(name='rtr-b'), routerboard(name='rtr-c')]
+    self.assertEqual(
+      first=[2, 5, 5],
+      second=expected_durations(routerboards=routerboards, durations={'rtr-a': 2, 'rtr-b': 5}),
+      msg='Returns the duration of each routerboard, assuming the longest known duration for the unknown ones'
+    )
+    self.assertEqual(
+      first=[0, 0, 0],
+      second=expected_durations(routerboards=routerboards, durations={}),
+      msg='Returns zero for every routerboard when no duration is known'
+    )
+
+  def test_site_of(self):
+    routerboards = [routerboard(name='rtr-a', site='tower-a'), routerboard(name='rtr-b')]
+    self.assertEqual(
+      first='tower-a',
+      second=site_of(routerboards=routerboards, index=0),
+      msg='Returns the site of the routerboard on the index passed'
+    )
+    self.assertEqual(
+      first=('no site', 1),
+      second=site_of(routerboards=routerboards, index=1),
+      msg='Returns a site of its own for a routerboard without site'
+    )
+
+  def test_scheduled_order(self):
+    self.assertEqual(
+      first=[],
+      second=scheduled_order(routerboards=[], durations={}),
+      msg='Returns an empty order when there are no routerboards'
+    )
+
+    routerboards = [
+      routerboard(name='small'),
+      routerboard(name='medium'),
+      routerboard(name='core'),
+    ]
+    self.assertEqual(
+      first=[2, 1, 0],
+      second=scheduled_order(routerboards=routerboards, durations={'small': 1, 'medium': 5, 'core': 30}),
+      msg='Orders the routerboards from the longest to the shortest expected duration'
+    )
+
+    routerboards = [
+      routerboard(name='a-core', site='tower-a'),
+      routerboard(name='a-edge', site='tower-a'),
+      routerboard(name='b-core', site='tower-b'),
+      routerboard(name='a-small', site='tower-a'),
+    ]
+    self.assertEqual(
+      first=[0, 2, 1, 3],
+      second=scheduled_order(
+        routerboards=routerboards,
+        durations={'a-core': 30, 'a-edge': 20, 'b-core': 10, 'a-small': 1}
+      ),
+      msg=str(
+        'Avoids scheduling routerboards of the same site one after the other while another site has routerboards '
+        'waiting, otherwise keeps the longest first'
+      )
+    )
+
+  def test_in_original_order(self):
+    self.assertEqual(
+      first=['a', 'b', 'c'],
+      second=in_original_order(results=['c', 'a', 'b'], order=[2, 0, 1]),
+      msg='Puts each result back on the index it was scheduled from'
+    )
+
+  def test_site_slots(self):
+    routerboards = [
+      routerboard(name='rtr-a', site='tower-a'),
+      routerboard(name='rtr-b', site='tower-a'),
+      routerboard(name='rtr-c')
+    ]
+    self.assertEqual(
+      first={},
+      second=site_slots(routerboards=routerboards, max_jobs_per_site=None),
+      msg='Has no slots when there is no maximum of jobs per site'
+    )
+    slots = site_slots(routerboards=routerboards, max_jobs_per_site=2)
+    self.assertEqual(
+      first=['tower-a'],
+      second=list(slots),
+      msg='Has slots for each site of the routerboards passed'
+    )
+    self.assertTrue(
+      expr=slots['tower-a'].acquire(blocking=False) and slots['tower-a'].acquire(blocking=False),
+      msg='Lets the maximum of jobs per site run at the same time'
+    )
+    self.assertFalse(
+      expr=slots['tower-a'].acquire(blocking=False),
+      msg='Does not let more than the maximum of jobs per site run at the same time'
+    )
+
+  def test_acquired_site_slot(self):
+    slots = {'tower-a': BoundedSemaphore(value=1)}
+    self.assertTrue(
+      expr=acquired_site_slot(slots=slots, site='tower-a'),
+      msg='Takes a free slot of the site passed'
+    )
+    self.assertFalse(
+      expr=acquired_site_slot(slots=slots, site='tower-a'),
+      msg='Does not wait for a slot when the slots of the site passed are taken'
+    )
+    self.assertTrue(
+      expr=acquired_site_slot(slots=slots, site=None),
+      msg='Always has a slot for a site without slots'
+    )
+
+  def test_released_site_slot(self):
+    slots = {'tower-a': BoundedSemaphore(value=1)}
+    slots['tower-a'].acquire()
+    released_site_slot(slots=slots, site='tower-a')
+    self.assertTrue(
+      expr=slots['tower-a'].acquire(blocking=False),
+      msg='Frees the slot of the site passed'
+    )
+    self.assertIsNone(
+      obj=released_site_slot(slots=slots, site=None),
+      msg='Does nothing for a site without slots'
+    )
@@ -1,9 +1,16 @@
 from pathlib import PurePath
+from socket import socketpair
+from threading import Event
 from unittest import TestCase
-from unittest.mock import MagicMock, call, patch
+from unittest.mock import ANY, MagicMock, call, patch
 
+from paramiko import AuthenticationException, Packetizer, SSHException
+
+from backup.metrics import DeviceMetrics
 from backup.ssh_client import open_ssh_session, close_ssh_session, setup_client, active_ssh_session, localpath, \
-  open_sftp
+  open_sftp_channels, open_sftp, shared_client_options, unlinked, completed_command, SFTPChannels, host_client_options, \
+  transport_profile, transport_profiles, preferred_algorithms, profiled_transport, default_window_size, \
+  default_max_packet_size
 
 
 class TestFunctions(TestCase):
@@ -12,9 +19,14 @@ class TestFunctions(TestCase):
   @patch(target='backup.ssh_client.setup_client')
   @patch(target='backup.ssh_client.active_ssh_session')
   def test_open_ssh_session(self, mock_active_ssh_session, mock_setup_client, mock_close_connection):
-    client_options = 'options'
-    credentials = 'username, password and stuff'
-    with open_ssh_session(client_options=client_options, credentials=credentials) as ssh:
+    client_options = {
+      'hosts_keys_filename': 'tests/hosts_keys',
+      'retry_policy': {'attempts': 3},
+      'hosts': {'host': {'timeouts': {'banner_seconds': 60}}}
+    }
+    credentials = {'hostname': 'host'}
+    metrics = DeviceMetrics(device='device')
+    with open_ssh_session(client_options=client_options, credentials=credentials, metrics=metrics) as ssh:
       self.assertEqual(
         first=mock_active_ssh_session.return_value,
         second=ssh,
@@ -23,13 +35,15 @@ class TestFunctions(TestCase):
       self.assertIn(
         member=call(
           ssh=mock_setup_client.return_value,
-          credentials=credentials
+          credentials=credentials,
+          metrics=metrics,
+          client_options={**client_options, 'timeouts': {'banner_seconds': 60}}
         ),
         container=mock_active_ssh_session.mock_calls,
-        msg='Calls for an active session using the ssh object and the credentials passed'
+        msg='Calls for an active session using the ssh object, the credentials and the options of the host passed'
       )
       self.assertIn(
-        member=call(client_options=client_options),
+        member=call(client_options={**client_options, 'timeouts': {'banner_seconds': 60}}),
         container=mock_setup_client.mock_calls,
         msg='Setup the ssh client with the options passed'
       )
@@ -39,12 +53,25 @@ class TestFunctions(TestCase):
         msg='Does not close the session while the context is open'
       )
     self.assertEqual(
-      first=[call(ssh=ssh)],
+      first=[call(ssh=ssh, teardown={})],
       second=mock_close_connection.mock_calls,
       msg='Closes the ssh session after the context is closed'
     )
+    self.assertIn(
+      member='close',
+      container=metrics.phases,
+      msg='Measures the time spent closing the session on the metrics passed'
+    )
+    with open_ssh_session(client_options=client_options, credentials=credentials):
+      pass
+    self.assertEqual(
+      first='host',
+      second=mock_active_ssh_session.call_args.kwargs['metrics'].device,
+      msg='Measures the session on metrics of its own when none are passed'
+    )
 
-  def test_active_ssh_session(self):
+  @patch(target='backup.ssh_client.create_connection')
+  def test_active_ssh_session(self, mock_create_connection):
     ssh = MagicMock()
     credentials = {
       'username': 'user',
@@ -52,21 +79,293 @@ class TestFunctions(TestCase):
       'port': 1234,
       'pkey': 'key',
     }
+    metrics = DeviceMetrics(device='device')
 
     self.assertEqual(
       first=ssh,
-      second=active_ssh_session(ssh=ssh, credentials=credentials),
+      second=active_ssh_session(ssh=ssh, credentials=credentials, metrics=metrics, client_options={}),
       msg='Returns the ssh object passed'
     )
-    self.assertIn(
-      member=call.connect(
+    self.assertEqual(
+      first=[call(address=(credentials['hostname'], credentials['port']), timeout=None)],
+      second=mock_create_connection.mock_calls,
+      msg='Opens the socket to the hostname and port from the credentials passed'
+    )
+    self.assertEqual(
+      first=[call(
         username=credentials['username'],
         hostname=credentials['hostname'],
         port=credentials['port'],
-        pkey=credentials['pkey']
-      ),
-      container=ssh.mock_calls,
-      msg='Connects the ssh object using the ssh credentials passed'
+        pkey=credentials['pkey'],
+        sock=mock_create_connection.return_value,
+        banner_timeout=None,
+        auth_timeout=None,
+        channel_timeout=None,
+        compress=False,
+        transport_factory=ANY
+      )],
+      second=ssh.connect.call_args_list,
+      msg='Connects the ssh object over the socket opened using the ssh credentials passed'
+    )
+    self.assertEqual(
+      first=[],
+      second=ssh.get_transport.mock_calls,
+      msg='Does not send keepalives by default'
+    )
+    self.assertEqual(
+      first=['connect', 'auth'],
+      second=list(metrics.phases),
+      msg='Measures the socket connection and the ssh handshake with authentication as separate phases'
+    )
+
+    mock_create_connection.reset_mock()
+    mock_create_connection.side_effect = [ConnectionResetError, 'socket']
+    with patch(target='backup.retry.sleep'):
+      active_ssh_session(ssh=ssh, credentials=credentials, metrics=metrics, client_options={
+        'retry_policy': {'attempts': 2}
+      })
+    self.assertEqual(
+      first='socket',
+      second=ssh.connect.call_args.kwargs['sock'],
+      msg='Opens a new socket to retry the connection with the retry policy passed'
+    )
+
+  @patch(target='backup.ssh_client.create_connection')
+  def test_active_ssh_session_failed(self, mock_create_connection):
+    ssh = MagicMock()
+    ssh.connect.side_effect = [SSHException('Error reading SSH protocol banner'), None]
+    sockets = [MagicMock(), MagicMock()]
+    mock_create_connection.side_effect = sockets
+    credentials = {'username': 'user', 'hostname': 'host', 'port': 1234, 'pkey': 'key'}
+    with patch(target='backup.retry.sleep'):
+      active_ssh_session(ssh=ssh, credentials=credentials, metrics=DeviceMetrics(device='device'), client_options={
+        'retry_policy': {'attempts': 2}
+      })
+    self.assertEqual(
+      first=([call.close()], []),
+      second=(sockets[0].mock_calls, sockets[1].mock_calls),
+      msg='Closes the socket of the handshake that failed before retrying on a new one'
+    )
+    self.assertEqual(
+      first=1,
+      second=ssh.close.call_count,
+      msg='Closes the transport started on the socket of the handshake that failed'
+    )
+
+    ssh.connect.side_effect = AuthenticationException('Authentication failed.')
+    mock_create_connection.side_effect = None
+    with self.assertRaises(expected_exception=AuthenticationException):
+      active_ssh_session(ssh=ssh, credentials=credentials, metrics=DeviceMetrics(device='device'), client_options={})
+    self.assertEqual(
+      first=[call.close()],
+      second=mock_create_connection.return_value.mock_calls,
+      msg='Closes the socket when the session can not be opened'
+    )
+
+  @patch(target='backup.ssh_client.create_connection')
+  def test_active_ssh_session_with_deadlines(self, mock_create_connection):
+    ssh = MagicMock()
+    credentials = {'username': 'user', 'hostname': 'host', 'port': 1234, 'pkey': 'key'}
+    active_ssh_session(ssh=ssh, credentials=credentials, metrics=DeviceMetrics(device='device'), client_options={
+      'timeouts': {'connect_seconds': 5, 'banner_seconds': 10, 'auth_seconds': 15, 'channel_seconds': 20},
+      'keepalive_seconds': 30
+    })
+    self.assertEqual(
+      first=5,
+      second=mock_create_connection.call_args.kwargs['timeout'],
+      msg='Gives up opening the socket after the connect timeout passed'
+    )
+    self.assertEqual(
+      first={'banner_timeout': 10, 'auth_timeout': 15, 'channel_timeout': 20},
+      second={
+        option: ssh.connect.call_args.kwargs[option]
+        for option in ['banner_timeout', 'auth_timeout', 'channel_timeout']
+      },
+      msg='Connects with the banner, auth and channel deadlines passed'
+    )
+    self.assertEqual(
+      first=[call(interval=30)],
+      second=ssh.get_transport.return_value.set_keepalive.call_args_list,
+      msg='Sends keepalives on the transport at the interval passed'
+    )
+
+  @patch(target='backup.ssh_client.profiled_transport')
+  @patch(target='backup.ssh_client.create_connection')
+  def test_active_ssh_session_with_transport_profile(self, _, mock_profiled_transport):
+    ssh = MagicMock()
+    credentials = {'username': 'user', 'hostname': 'host', 'port': 1234, 'pkey': 'key'}
+    active_ssh_session(ssh=ssh, credentials=credentials, metrics=DeviceMetrics(device='device'), client_options={
+      'transport_profile': 'compressed'
+    })
+    self.assertTrue(
+      expr=ssh.connect.call_args.kwargs['compress'],
+      msg='Negotiates the compression of the transport profile passed'
+    )
+    self.assertEqual(
+      first=mock_profiled_transport.return_value,
+      second=ssh.connect.call_args.kwargs['transport_factory']('sock', gss_kex=False, disabled_algorithms=None),
+      msg='Creates the transport of the session with the algorithms of the transport profile passed'
+    )
+    self.assertEqual(
+      first=[call(sock='sock', profile=transport_profiles['compressed'], gss_kex=False, disabled_algorithms=None)],
+      second=mock_profiled_transport.call_args_list,
+      msg='Passes the transport profile and the options of the ssh client to the transport'
+    )
+
+  def test_transport_profile(self):
+    self.assertEqual(
+      first={},
+      second=transport_profile(client_options={}),
+      msg='Returns no preferences when there is no transport profile'
+    )
+    self.assertEqual(
+      first=transport_profiles['light'],
+      second=transport_profile(client_options={'transport_profile': 'light'}),
+      msg='Returns the transport profile named on the client options passed'
+    )
+    self.assertEqual(
+      first={'ciphers': ['aes256-ctr']},
+      second=transport_profile(client_options={'transport_profile': {'ciphers': ['aes256-ctr']}}),
+      msg='Returns the transport profile set on the client options passed'
+    )
+
+  def test_preferred_algorithms(self):
+    self.assertEqual(
+      first=('c', 'a', 'b', 'd'),
+      second=preferred_algorithms(algorithms=['c', 'a'], defaults=('a', 'b', 'c', 'd')),
+      msg='Returns the algorithms passed first and the other defaults after them'
+    )
+
+  def test_profiled_transport(self):
+    for profile in transport_profiles.values():
+      sock, other_end = socketpair()
+      transport = profiled_transport(sock=sock, profile=profile)
+      options = transport.get_security_options()
+      for option, name in [('ciphers', 'ciphers'), ('macs', 'digests'), ('kex', 'kex')]:
+        self.assertEqual(
+          first=tuple(profile.get(option, [])),
+          second=getattr(options, name)[:len(profile.get(option, []))],
+          msg='Prefers the algorithms of the transport profile, all of them known to the transport'
+        )
+      transport.close()
+      sock.close()  # not closed by a transport that was never started
+      other_end.close()
+    sock, other_end = socketpair()
+    transport = profiled_transport(sock=sock, profile={
+      'window_size': 64 * 1024 * 1024,
+      'max_packet_size': 16 * 1024,
+      'rekey_bytes': 2 ** 32,
+      'rekey_packets': 2 ** 31
+    })
+    self.assertEqual(
+      first=(64 * 1024 * 1024, 16 * 1024),
+      second=(transport.default_window_size, transport.default_max_packet_size),
+      msg='Opens the channels with the window and the packet size of the transport profile passed'
+    )
+    self.assertEqual(
+      first=(2 ** 32, 2 ** 31),
+      second=(transport.packetizer.REKEY_BYTES, transport.packetizer.REKEY_PACKETS),
+      msg='Renegotiates the keys after the bytes and the packets of the transport profile passed'
+    )
+    transport.close()
+    sock.close()
+    other_end.close()
+
+    sock, other_end = socketpair()
+    transport = profiled_transport(sock=sock, profile={}, disabled_algorithms={'ciphers': ['3des-cbc']})
+    self.assertEqual(
+      first=(default_window_size, default_max_packet_size),
+      second=(transport.default_window_size, transport.default_max_packet_size),
+      msg='Opens the channels with a window sized for the links with a high bandwidth-delay product by default'
+    )
+    self.assertEqual(
+      first=(Packetizer.REKEY_BYTES, Packetizer.REKEY_PACKETS),
+      second=(transport.packetizer.REKEY_BYTES, transport.packetizer.REKEY_PACKETS),
+      msg='Keeps the rekey thresholds of paramiko by default'
+    )
+    self.assertEqual(
+      first={'ciphers': ['3des-cbc']},
+      second=transport.disabled_algorithms,
+      msg='Creates the transport with the algorithms disabled passed'
+    )
+    transport.close()
+    sock.close()
+    other_end.close()
+
+  def test_host_client_options(self):
+    client_options = {
+      'hosts_keys_filename': 'known_hosts',
+      'timeouts': {'connect_seconds': 5, 'banner_seconds': 10},
+      'hosts': {'slow-host': {'timeouts': {'banner_seconds': 60}, 'keepalive_seconds': 15}}
+    }
+    self.assertEqual(
+      first=client_options,
+      second=host_client_options(client_options=client_options, hostname='host'),
+      msg='Returns the client options passed for a host without overrides'
+    )
+    self.assertEqual(
+      first={
+        **client_options,
+        'timeouts': {'connect_seconds': 5, 'banner_seconds': 60},
+        'keepalive_seconds': 15
+      },
+      second=host_client_options(client_options=client_options, hostname='slow-host'),
+      msg='Overrides the client options passed with the ones of the host, merging the nested ones'
+    )
+    client_options = {
+      'transport_profile': 'light',
+      'hosts': {
+        'myauth': {'transport_profile': {'ciphers': ['aes128-gcm@openssh.com']}},
+        'rtr': {'transport_profile': 'bulk'}
+      }
+    }
+    self.assertEqual(
+      first={**transport_profiles['light'], 'ciphers': ['aes128-gcm@openssh.com']},
+      second=host_client_options(client_options=client_options, hostname='myauth')['transport_profile'],
+      msg='Merges the transport profile of the host over the preferences of the profile named on the client options'
+    )
+    self.assertEqual(
+      first='bulk',
+      second=host_client_options(client_options=client_options, hostname='rtr')['transport_profile'],
+      msg='Replaces the transport profile with the one named for the host'
+    )
+
+  def test_completed_command(self):
+    ssh = MagicMock()
+    stdout = MagicMock()
+    stderr = MagicMock()
+    stdout.read.return_value = b'output\r\n'
+    stderr.read.return_value = b'failure: not enough space\r\n'
+    stdout.channel.recv_exit_status.return_value = 0
+    ssh.exec_command.return_value = (MagicMock(), stdout, stderr)
+    self.assertEqual(
+      first={'exit_status': 0, 'output': 'output\r\nfailure: not enough space\r\n'},
+      second=completed_command(ssh=ssh, command='/ export file=rtr', seconds_to_timeout=10),
+      msg='Returns the exit status and the output of the command once it completed'
+    )
+    self.assertEqual(
+      first=[call(command='/ export file=rtr', timeout=10)],
+      second=ssh.exec_command.call_args_list,
+      msg='Executes the command passed with the timeout passed on its channel'
+    )
+
+  def test_unlinked(self):
+    sftp = MagicMock()
+    self.assertEqual(
+      first='/file',
+      second=unlinked(sftp=sftp, path='/file'),
+      msg='Returns the path passed'
+    )
+    self.assertEqual(
+      first=[call.unlink(path='/file')],
+      second=sftp.mock_calls,
+      msg='Deletes the remote file passed'
+    )
+    sftp.unlink.side_effect = FileNotFoundError
+    self.assertEqual(
+      first='/file',
+      second=unlinked(sftp=sftp, path='/file'),
+      msg='Counts a remote file already gone as deleted'
     )
 
   def test_close_connection(self):
@@ -82,6 +381,27 @@ class TestFunctions(TestCase):
       msg='Calls the command "quit" in the SSH session and closes the session'
     )
 
+    mock_ssh = MagicMock()
+    close_ssh_session(ssh=mock_ssh, teardown={'send_quit': False, 'timeout_seconds': 1})
+    self.assertEqual(
+      first=[call.close()],
+      second=mock_ssh.mock_calls,
+      msg='Closes the transport directly without sending the command "quit"'
+    )
+
+    mock_ssh = MagicMock()
+    closing = Event()
+    mock_ssh.close.side_effect = lambda: closing.wait(timeout=5)
+    self.assertTrue(
+      expr=close_ssh_session(ssh=mock_ssh, teardown={'timeout_seconds': 0.01}).is_alive(),
+      msg='Stops waiting for the teardown after the timeout passed'
+    )
+    self.assertTrue(
+      expr=close_ssh_session(ssh=mock_ssh, teardown={'background': True}).is_alive(),
+      msg='Does not wait for the teardown in the background'
+    )
+    closing.set()
+
   @patch(target='backup.ssh_client.SSHClient')
   def test_setup_client(self, MockSSHClient):
     client_options = {
@@ -98,6 +418,62 @@ class TestFunctions(TestCase):
       msg='Loads the host keys from the client_options passed'
     )
 
+    MockSSHClient.reset_mock()
+    client_options = {
+      'hosts_keys_filename': 'tests/hosts_keys',
+      'host_keys': {'host': 'keys'}
+    }
+    setup_client(client_options=client_options)
+    self.assertEqual(
+      first=[
+        call(),
+        call().get_host_keys(),
+        call().get_host_keys().update(client_options['host_keys'])
+      ],
+      second=MockSSHClient.mock_calls,
+      msg='Uses the host keys already loaded on the client_options passed instead of reading the file again'
+    )
+
+  @patch(target='backup.ssh_client.HostKeys')
+  def test_shared_client_options(self, MockHostKeys):
+    client_options = {
+      'hosts_keys_filename': 'tests/hosts_keys',
+    }
+    self.assertEqual(
+      first={
+        'hosts_keys_filename': 'tests/hosts_keys',
+        'host_keys': MockHostKeys.return_value
+      },
+      second=shared_client_options(client_options=client_options),
+      msg='Returns the client options passed with the host keys loaded from the hosts keys file'
+    )
+    self.assertEqual(
+      first=[call(filename=client_options['hosts_keys_filename'])],
+      second=MockHostKeys.mock_calls,
+      msg='Loads the host keys file only once'
+    )
+    self.assertNotIn(
+      member='host_keys',
+      container=client_options,
+      msg='Does not change the client options passed'
+    )
+
+    MockHostKeys.reset_mock()
+    client_options = shared_client_options(client_options={
+      'hosts_keys_filename': 'tests/hosts_keys',
+      'host_keys': 'keys'
+    })
+    self.assertEqual(
+      first='keys',
+      second=client_options['host_keys'],
+      msg='Keeps the host keys already loaded'
+    )
+    self.assertEqual(
+      first=[],
+      second=MockHostKeys.mock_calls,
+      msg='Does not load the host keys file again when they are already loaded'
+    )
+
   def test_localpath(self):
     filename = 'file name'
     backups_directory = '/some/directory/'
@@ -110,6 +486,26 @@ class TestFunctions(TestCase):
       msg='Returns a PurePath with the filename passed on the directory from backups_directory passed'
     )
 
+  def test_open_sftp_channels(self):
+    ssh = MagicMock()
+    with open_sftp_channels(ssh=ssh) as channels:
+      self.assertEqual(
+        first=ssh,
+        second=channels.ssh,
+        msg='Returns the sftp channels of the ssh passed'
+      )
+      sftp = channels.sftp
+      self.assertEqual(
+        first=[],
+        second=sftp.close.mock_calls,
+        msg='Does not close the sftp channels while the context is open'
+      )
+    self.assertEqual(
+      first=[call()],
+      second=sftp.close.mock_calls,
+      msg='Closes the sftp channels after the context is closed'
+    )
+
   def test_open_sftp(self):
     ssh = MagicMock()
     with open_sftp(ssh=ssh) as sftp:
@@ -118,11 +514,6 @@ class TestFunctions(TestCase):
         second=sftp,
         msg='Returns an sftp opened from the ssh passed'
       )
-      self.assertIn(
-        member=call.open_sftp(),
-        container=ssh.mock_calls,
-        msg='Opens the sftp from the ssh passed'
-      )
       self.assertNotIn(
         member=call.close(),
         container=sftp.mock_calls,
@@ -133,3 +524,61 @@ class TestFunctions(TestCase):
       container=sftp.mock_calls,
       msg='Closes the sftp after the context is closed'
     )
+
+
+class TestSFTPChannels(TestCase):
+
+  def test_sftp(self):
+    ssh = MagicMock()
+    channels = SFTPChannels(ssh=ssh)
+    self.assertEqual(
+      first=[],
+      second=ssh.open_sftp.mock_calls,
+      msg='Does not open a channel before it is used'
+    )
+    self.assertEqual(
+      first=[ssh.open_sftp.return_value] * 2,
+      second=[channels.sftp, channels.sftp],
+      msg='Returns the sftp channel opened from the ssh passed'
+    )
+    self.assertEqual(
+      first=[call()],
+      second=ssh.open_sftp.mock_calls,
+      msg='Opens the channel once and reuses it after'
+    )
+
+  def test_additional(self):
+    ssh = MagicMock()
+    ssh.open_sftp.side_effect = ['first', 'second', 'third']
+    channels = SFTPChannels(ssh=ssh)
+    self.assertEqual(
+      first=['first', 'second', 'first'],
+      second=[channels.sftp, channels.additional(), channels.sftp],
+      msg='Opens a channel apart from the one reused for parallel transfers'
+    )
+    self.assertEqual(
+      first='third',
+      second=SFTPChannels(ssh=ssh).additional(),
+      msg='Opens an additional channel even when the one reused was not opened'
+    )
+
+  def test_closed(self):
+    ssh = MagicMock()
+    ssh.open_sftp.side_effect = [MagicMock(), MagicMock()]
+    channels = SFTPChannels(ssh=ssh)
+    opened = [channels.sftp, channels.additional()]
+    self.assertEqual(
+      first=2,
+      second=channels.closed(),
+      msg='Returns how many channels were closed'
+    )
+    self.assertEqual(
+      first=[[call.close()], [call.close()]],
+      second=[sftp.mock_calls for sftp in opened],
+      msg='Closes every channel opened'
+    )
+    self.assertEqual(
+      first=0,
+      second=channels.closed(),
+      msg='Does not close the channels again'
+    )
@@ -0,0 +1,281 @@
+from os import listdir, path
+from tarfile import open as open_tarball
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock, call, patch
+
+from backup.durability import AtomicFile
+from backup.ssh_client import localpath
+from backup.storage import FilesystemStorage, TarballStorage, ObjectStorage, object_store_client, storage_backend, \
+  unsupported_features, open_storage
+
+
+class TestFilesystemStorage(TestCase):
+
+  def test_location(self):
+    self.assertEqual(
+      first=localpath(filename='rtr.backup', backups_directory='/backups/'),
+      second=FilesystemStorage().location(directory='/backups/', filename='rtr.backup'),
+      msg='Locates the file on the directory passed'
+    )
+
+  def test_opened(self):
+    durability = MagicMock()
+    with TemporaryDirectory() as directory:
+      storage = FilesystemStorage(durability=durability)
+      with storage.opened(location=path.join(directory, 'rtr.backup')) as local_file:
+        self.assertIsInstance(
+          obj=local_file,
+          cls=AtomicFile,
+          msg='Writes the file atomically'
+        )
+        local_file.write(b'backup')
+      self.assertEqual(
+        first=['rtr.backup'],
+        second=listdir(directory),
+        msg='Names the file once it is complete'
+      )
+      storage.closed()
+    self.assertEqual(
+      first=[call()],
+      second=durability.synced_directories.mock_calls,
+      msg='Syncs the directories left from the last batch when it is closed'
+    )
+    FilesystemStorage().closed()
+
+
+class TestTarballStorage(TestCase):
+
+  def test_opened(self):
+    durability = MagicMock()
+    with TemporaryDirectory() as directory:
+      storage = TarballStorage(
+        filename=path.join(directory, 'backups-{datetime:%Y}.tar'),
+        durability=durability,
+        spool_bytes=4
+      )
+      self.assertFalse(
+        expr=storage.filename.endswith('{datetime:%Y}.tar'),
+        msg='Names the tarball after the time of the run'
+      )
+      location = storage.location(directory='/ignored', filename='rtr.backup')
+      self.assertEqual(
+        first='{tarball}:rtr.backup'.format(tarball=storage.filename),
+        second=location,
+        msg='Locates the file as a member of the tarball'
+      )
+      with storage.opened(location=location) as member_file:
+        member_file.write(b'backup')
+      with self.assertRaises(expected_exception=EOFError):
+        with storage.opened(location=storage.location(directory='/ignored', filename='rtr.rsc')) as member_file:
+          member_file.write(b'partial')
+          raise EOFError
+      self.assertEqual(
+        first=[path.basename(storage.file.temporary_filename)],
+        second=listdir(directory),
+        msg='Writes the tarball to a temporary file until the run is over'
+      )
+      storage.closed()
+      with open_tarball(storage.filename) as tarball:
+        self.assertEqual(
+          first=['rtr.backup'],
+          second=tarball.getnames(),
+          msg='Adds only the files complete to the tarball'
+        )
+        self.assertEqual(
+          first=b'backup',
+          second=tarball.extractfile('rtr.backup').read(),
+          msg='Keeps the content of the file'
+        )
+    self.assertEqual(
+      first=[call()],
+      second=durability.synced_directories.mock_calls,
+      msg='Syncs the directory of the tarball renamed once it is closed'
+    )
+    with TemporaryDirectory() as directory:
+      TarballStorage(filename=path.join(directory, 'run.tar')).closed()
+
+
+class TestObjectStorage(TestCase):
+
+  @patch(target='backup.storage.object_store_client')
+  def test_opened(self, mock_object_store_client):
+    client = mock_object_store_client.return_value
+    client.create_multipart_upload.return_value = {'UploadId': 'upload'}
+    client.upload_part.side_effect = lambda Body, PartNumber, **_: {'ETag': 'etag-{number}'.format(number=PartNumber)}
+    storage = ObjectStorage(
+      bucket='backups',
+      prefix='fleet/',
+      client_options={'endpoint_url': 'http://minio:9000'},
+      part_size=4,
+      max_concurrency=2
+    )
+    self.assertEqual(
+      first=[call(client_options={'endpoint_url': 'http://minio:9000'})],
+      second=mock_object_store_client.call_args_list,
+      msg='Creates the client with the client options passed'
+    )
+    location = storage.location(directory='/ignored', filename='rtr.backup')
+    self.assertEqual(
+      first='s3://backups/fleet/rtr.backup',
+      second=location,
+      msg='Locates the file as an object under the prefix of the bucket'
+    )
+    with storage.opened(location=location) as object_file:
+      self.assertEqual(
+        first=10,
+        second=object_file.write(b'0123456789'),
+        msg='Returns the size of the data written'
+      )
+    self.assertEqual(
+      first=[
+        call(Bucket='backups', Key='fleet/rtr.backup', UploadId='upload', PartNumber=number, Body=body)
+        for number, body in [(1, b'0123'), (2, b'4567'), (3, b'89')]
+      ],
+      second=sorted(client.upload_part.call_args_list, key=lambda part: part.kwargs['PartNumber']),
+      msg='Uploads the file in parts of the part size as it is written'
+    )
+    self.assertEqual(
+      first=[call(
+        Bucket='backups',
+        Key='fleet/rtr.backup',
+        UploadId='upload',
+        MultipartUpload={'Parts': [
+          {'ETag': 'etag-{number}'.format(number=number), 'PartNumber': number} for number in [1, 2, 3]
+        ]}
+      )],
+      second=client.complete_multipart_upload.call_args_list,
+      msg='Completes the upload with the parts in order'
+    )
+
+    with storage.opened(location=storage.location(directory='/ignored', filename='rtr.rsc')) as object_file:
+      object_file.write(b'/ip')
+    self.assertEqual(
+      first=[call(Bucket='backups', Key='fleet/rtr.rsc', Body=b'/ip')],
+      second=client.put_object.call_args_list,
+      msg='Puts a file smaller than a part in a single request'
+    )
+    storage.closed()
+
+  @patch(target='backup.storage.object_store_client')
+  def test_discarded(self, mock_object_store_client):
+    client = mock_object_store_client.return_value
+    client.create_multipart_upload.return_value = {'UploadId': 'upload'}
+    storage = ObjectStorage(bucket='backups', part_size=4)
+    with self.assertRaises(expected_exception=EOFError):
+      with storage.opened(location=storage.location(directory='/ignored', filename='cut.backup')) as object_file:
+        object_file.write(b'01234')
+        raise EOFError
+    with self.assertRaises(expected_exception=EOFError):
+      with storage.opened(location=storage.location(directory='/ignored', filename='small.backup')) as object_file:
+        object_file.write(b'0')
+        raise EOFError
+    client.upload_part.side_effect = OSError('unreachable')
+    with self.assertRaises(expected_exception=OSError):
+      with storage.opened(location=storage.location(directory='/ignored', filename='failed.backup')) as object_file:
+        object_file.write(b'01234567')
+    client.upload_part.side_effect = lambda **_: {'ETag': 'etag'}
+    client.complete_multipart_upload.side_effect = OSError('unreachable')
+    with self.assertRaises(expected_exception=OSError):
+      with storage.opened(location=storage.location(directory='/ignored', filename='uncompleted.backup')) as upload:
+        upload.write(b'01234567')
+    client.complete_multipart_upload.side_effect = None
+    self.assertEqual(
+      first=[
+        call(Bucket='backups', Key='cut.backup', UploadId='upload'),
+        call(Bucket='backups', Key='failed.backup', UploadId='upload'),
+        call(Bucket='backups', Key='uncompleted.backup', UploadId='upload')
+      ],
+      second=client.abort_multipart_upload.call_args_list,
+      msg='Aborts the uploads not complete, leaving no object behind'
+    )
+    self.assertEqual(
+      first=([], ['uncompleted.backup']),
+      second=(
+        client.put_object.call_args_list,
+        [upload.kwargs['Key'] for upload in client.complete_multipart_upload.call_args_list]
+      ),
+      msg='Stores no object when the file is not complete, and aborts the upload that could not be completed'
+    )
+    storage.closed()
+
+
+class TestFunctions(TestCase):
+
+  def test_object_store_client(self):
+    boto3 = MagicMock()
+    with patch.dict(in_dict='sys.modules', values={'boto3': boto3}):
+      self.assertEqual(
+        first=boto3.client.return_value,
+        second=object_store_client(client_options={'endpoint_url': 'http://minio:9000'}),
+        msg='Returns the s3 client of boto3'
+      )
+    self.assertEqual(
+      first=[call('s3', endpoint_url='http://minio:9000')],
+      second=boto3.client.call_args_list,
+      msg='Creates the s3 client with the client options passed'
+    )
+
+  @patch(target='backup.storage.ObjectStorage')
+  def test_storage_backend(self, mock_object_storage):
+    storage = storage_backend()
+    self.assertEqual(
+      first=(FilesystemStorage, None),
+      second=(type(storage), storage.durability),
+      msg='Stores the files on the filesystem without a durability by default'
+    )
+    self.assertEqual(
+      first='file',
+      second=storage_backend(durability_options={'fsync': 'file'}).durability.fsync,
+      msg='Syncs the files with the durability options passed'
+    )
+    with TemporaryDirectory() as directory:
+      storage = storage_backend(storage_options={'backend': 'tarball', 'filename': path.join(directory, 'run.tar')})
+      self.assertIsInstance(
+        obj=storage,
+        cls=TarballStorage,
+        msg='Stores the files on a tarball with the storage options passed'
+      )
+      storage.closed()
+    self.assertEqual(
+      first=mock_object_storage.return_value,
+      second=storage_backend(
+        storage_options={'backend': 'object_store', 'bucket': 'backups'},
+        durability_options={'fsync': 'file'}
+      ),
+      msg='Stores the files on an object store'
+    )
+    self.assertEqual(
+      first=[call(bucket='backups')],
+      second=mock_object_storage.call_args_list,
+      msg='Creates the object store with the storage options passed, without the durability options'
+    )
+
+  def test_unsupported_features(self):
+    options = ['retention', 'export_store', 'encryption']
+    self.assertEqual(
+      first=[],
+      second=unsupported_features(storage_options=None, options=options),
+      msg='Supports every feature on the filesystem'
+    )
+    self.assertEqual(
+      first=['export_store', 'retention'],
+      second=unsupported_features(storage_options={'backend': 'object_store'}, options=options),
+      msg='Returns the features that read the files retrieved back from the filesystem'
+    )
+
+  @patch(target='backup.storage.storage_backend')
+  def test_open_storage(self, mock_storage_backend):
+    with self.assertRaises(expected_exception=EOFError):
+      with open_storage(storage_options={'backend': 'tarball'}, durability_options={'fsync': 'none'}) as storage:
+        self.assertEqual(
+          first=mock_storage_backend.return_value,
+          second=storage,
+          msg='Yields the storage backend'
+        )
+        raise EOFError
+    self.assertEqual(
+      first=([call(storage_options={'backend': 'tarball'}, durability_options={'fsync': 'none'})], [call()]),
+      second=(mock_storage_backend.call_args_list, storage.closed.mock_calls),
+      msg='Creates the storage backend with the options passed and closes it even when the backups fail'
+    )
@@ -0,0 +1,147 @@
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import MagicMock, call, patch
+
+from paramiko import SFTPAttributes
+
+from backup.metrics import DeviceMetrics
+from backup.sweeper import generated_file_datetime, stale_remote_files, swept_remote_files, routerboard_sweep, \
+  routerboards_sweeps
+
+
+def sftp_attributes(filename, size):
+  attributes = SFTPAttributes()
+  attributes.filename = filename
+  attributes.st_size = size
+  return attributes
+
+
+def sftp_with_files():
+  sftp = MagicMock()
+  sftp.listdir_attr.return_value = [
+    sftp_attributes(filename='rtr.a_2020-01-01-10-00-00.backup', size=100),
+    sftp_attributes(filename='rtr.a_2020-01-01-10-00-00.rsc', size=10),
+    sftp_attributes(filename='rtr.a_2020-01-01-11-59-00.rsc', size=10),
+    sftp_attributes(filename='rtrxa_2020-01-01-10-00-00.rsc', size=10),
+    sftp_attributes(filename='rtr.a-b_2020-01-01-10-00-00.rsc', size=10),
+    sftp_attributes(filename='flash', size=0)
+  ]
+  return sftp
+
+
+class TestFunctions(TestCase):
+
+  def test_generated_file_datetime(self):
+    self.assertEqual(
+      first=datetime(year=2020, month=1, day=2, hour=3, minute=4, second=5),
+      second=generated_file_datetime(filename='rtr.a_2020-01-02-03-04-05.backup', device_id='rtr.a'),
+      msg='Returns when the file was generated for a backup of the routerboard passed'
+    )
+    for filename in [
+      'rtrxa_2020-01-02-03-04-05.backup',
+      'rtr.a_2020-01-02-03-04-05.npk',
+      'rtr.a_2020-01-02.backup',
+      'rtr.a-b_2020-01-02-03-04-05.rsc'
+    ]:
+      self.assertIsNone(
+        obj=generated_file_datetime(filename=filename, device_id='rtr.a'),
+        msg='Returns None for a file not generated for a backup of the routerboard passed'
+      )
+
+  def test_stale_remote_files(self):
+    sftp = sftp_with_files()
+    self.assertEqual(
+      first=['rtr.a_2020-01-01-10-00-00.backup', 'rtr.a_2020-01-01-10-00-00.rsc'],
+      second=[attributes.filename for attributes in stale_remote_files(
+        sftp=sftp,
+        device_id='rtr.a',
+        minimum_age_seconds=3600,
+        now=datetime(year=2020, month=1, day=1, hour=12)
+      )],
+      msg='Returns the files generated for the routerboard passed older than the minimum age'
+    )
+    self.assertEqual(
+      first=[call.listdir_attr(path='.')],
+      second=sftp.mock_calls,
+      msg='Lists the directory where the files are generated once'
+    )
+
+  @patch(target='backup.sweeper.datetime')
+  def test_swept_remote_files(self, mock_datetime):
+    mock_datetime.now.return_value = datetime(year=2020, month=1, day=1, hour=12)
+    mock_datetime.strptime = datetime.strptime
+    metrics = DeviceMetrics(device='rtr.a')
+
+    sftp = sftp_with_files()
+    self.assertEqual(
+      first={
+        'device': 'rtr.a',
+        'files': ['rtr.a_2020-01-01-10-00-00.backup', 'rtr.a_2020-01-01-10-00-00.rsc'],
+        'size': 110,
+        'dry_run': True
+      },
+      second=swept_remote_files(sftp=sftp, device_id='rtr.a', sweep_options={'dry_run': True}, metrics=metrics),
+      msg='Reports the stale files found, an hour old by default, with their size'
+    )
+    self.assertEqual(
+      first=[],
+      second=sftp.unlink.mock_calls,
+      msg='Does not delete the stale files on a dry run'
+    )
+    self.assertEqual(
+      first=0,
+      second=metrics.swept_bytes,
+      msg='Does not account the size of the stale files on a dry run'
+    )
+
+    sftp = sftp_with_files()
+    report = swept_remote_files(sftp=sftp, device_id='rtr.a', sweep_options={'minimum_age_seconds': 0}, metrics=metrics)
+    self.assertEqual(
+      first=[call(path=filename) for filename in report['files']],
+      second=sftp.unlink.mock_calls,
+      msg='Deletes the stale files older than the minimum age passed'
+    )
+    self.assertEqual(
+      first=120,
+      second=metrics.swept_bytes,
+      msg='Accounts the size of the stale files deleted on the metrics passed'
+    )
+    self.assertIn(
+      member='sweep',
+      container=metrics.phases,
+      msg='Measures the time spent sweeping the stale files'
+    )
+
+  @patch(target='backup.sweeper.swept_remote_files')
+  @patch(target='backup.sweeper.open_ssh_session')
+  def test_routerboard_sweep(self, mock_open_ssh_session, mock_swept_remote_files):
+    routerboard = {'name': 'rtr', 'backup_options': {'sweep': {'minimum_age_seconds': 60}}, 'credentials': {}}
+    self.assertEqual(
+      first=mock_swept_remote_files.return_value,
+      second=routerboard_sweep(routerboard=routerboard, ssh_client_options={}, dry_run=True),
+      msg='Returns the report of the sweep of the routerboard passed'
+    )
+    self.assertEqual(
+      first=call(
+        sftp=mock_open_ssh_session.return_value.__enter__.return_value.open_sftp.return_value,
+        device_id='rtr',
+        sweep_options={'minimum_age_seconds': 60, 'dry_run': True},
+        metrics=mock_open_ssh_session.call_args.kwargs['metrics']
+      ),
+      second=mock_swept_remote_files.call_args,
+      msg='Sweeps the routerboard over a session of its own with its sweep options and the dry run passed'
+    )
+
+  @patch(target='backup.sweeper.routerboard_sweep')
+  def test_routerboards_sweeps(self, mock_routerboard_sweep):
+    routerboards = [{'name': 'rtr-a'}, {'name': 'rtr-b'}]
+    self.assertEqual(
+      first=[mock_routerboard_sweep.return_value] * 2,
+      second=routerboards_sweeps(routerboards=routerboards, ssh_client_options='options'),
+      msg='Returns the report of the sweep of each routerboard passed'
+    )
+    self.assertEqual(
+      first=[call(routerboard=routerboard, ssh_client_options='options', dry_run=True) for routerboard in routerboards],
+      second=mock_routerboard_sweep.call_args_list,
+      msg='Sweeps each routerboard passed, as a dry run by default'
+    )
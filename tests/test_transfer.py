@@ -0,0 +1,283 @@
+from os import listdir, path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock, call, patch
+
+from backup.durability import AtomicFile
+from backup.encryption import EncryptedFile, decrypted_chunks
+from backup.transfer import TokenBucket, bytes_per_second, bandwidth_buckets, site_buckets, throttled, \
+  opened_local_file, ThrottledProgress, retrieved
+
+key = b'k' * 32
+
+class TestTokenBucket(TestCase):
+
+  @patch(target='backup.transfer.monotonic', return_value=100.0)
+  def test_init(self, _):
+    bucket = TokenBucket(bytes_per_second=10)
+    self.assertEqual(
+      first=10,
+      second=bucket.capacity,
+      msg='Holds up to one second of tokens when no burst is passed'
+    )
+    self.assertEqual(
+      first=10,
+      second=bucket.tokens,
+      msg='Starts full'
+    )
+    self.assertEqual(
+      first=50,
+      second=TokenBucket(bytes_per_second=10, burst_bytes=50).capacity,
+      msg='Holds up to the burst passed'
+    )
+
+  @patch(target='backup.transfer.monotonic')
+  def test_reserved(self, mock_monotonic):
+    mock_monotonic.return_value = 100.0
+    bucket = TokenBucket(bytes_per_second=10)
+
+    self.assertEqual(
+      first=0,
+      second=bucket.reserved(size=10),
+      msg='Does not wait when there are enough tokens'
+    )
+    self.assertEqual(
+      first=0.5,
+      second=bucket.reserved(size=5),
+      msg='Returns the seconds to wait for the missing tokens, keeping them as debt'
+    )
+    mock_monotonic.return_value = 101.0
+    self.assertEqual(
+      first=0,
+      second=bucket.reserved(size=5),
+      msg='Refills the tokens at the rate passed, paying the debt first'
+    )
+    mock_monotonic.return_value = 1000.0
+    bucket.reserved(size=0)
+    self.assertEqual(
+      first=10,
+      second=bucket.tokens,
+      msg='Never refills over the capacity'
+    )
+
+
+class TestFunctions(TestCase):
+
+  def test_bytes_per_second(self):
+    self.assertEqual(
+      first=1250000,
+      second=bytes_per_second(mbps=10),
+      msg='Converts megabits per second to bytes per second'
+    )
+
+  def test_bandwidth_buckets(self):
+    self.assertEqual(
+      first={'global': None, 'sites': {}},
+      second=bandwidth_buckets(bandwidth_limits={}),
+      msg='Has no buckets when there are no limits'
+    )
+    buckets = bandwidth_buckets(bandwidth_limits={'global_mbps': 80, 'sites_mbps': {'tower-a': 8}})
+    self.assertEqual(
+      first=10000000,
+      second=buckets['global'].bytes_per_second,
+      msg='Has a global bucket with the global limit'
+    )
+    self.assertEqual(
+      first=1000000,
+      second=buckets['sites']['tower-a'].bytes_per_second,
+      msg='Has a bucket for each site with the limit of the site'
+    )
+
+  def test_site_buckets(self):
+    site_bucket = TokenBucket(bytes_per_second=1)
+    global_bucket = TokenBucket(bytes_per_second=2)
+    buckets = {'global': global_bucket, 'sites': {'tower-a': site_bucket}}
+
+    self.assertEqual(
+      first=[site_bucket, global_bucket],
+      second=site_buckets(buckets=buckets, site='tower-a'),
+      msg='Returns the bucket of the site and the global bucket'
+    )
+    self.assertEqual(
+      first=[global_bucket],
+      second=site_buckets(buckets=buckets, site=None),
+      msg='Returns only the global bucket when the site has no limit'
+    )
+    self.assertEqual(
+      first=[],
+      second=site_buckets(buckets={'global': None, 'sites': {}}, site='tower-a'),
+      msg='Returns no buckets when there are no limits'
+    )
+
+  @patch(target='backup.transfer.sleep')
+  def test_throttled(self, mock_sleep):
+    buckets = [MagicMock(), MagicMock()]
+    buckets[0].reserved.return_value = 0.5
+    buckets[1].reserved.return_value = 2
+
+    self.assertEqual(
+      first=2,
+      second=throttled(buckets=buckets, size=10),
+      msg='Returns the longest wait among the buckets'
+    )
+    self.assertEqual(
+      first=[call(2)],
+      second=mock_sleep.mock_calls,
+      msg='Waits once for the slowest bucket'
+    )
+    for bucket in buckets:
+      self.assertEqual(
+        first=[call(size=10)],
+        second=bucket.reserved.mock_calls,
+        msg='Reserves the size passed on every bucket'
+      )
+
+    mock_sleep.reset_mock()
+    self.assertEqual(
+      first=0,
+      second=throttled(buckets=[], size=10),
+      msg='Does not wait without buckets'
+    )
+    self.assertEqual(
+      first=[],
+      second=mock_sleep.mock_calls,
+      msg='Does not sleep when there is nothing to wait for'
+    )
+
+  @patch(target='backup.transfer.throttled')
+  def test_throttled_progress(self, mock_throttled):
+    callback = MagicMock()
+    buckets = ['bucket']
+    progress = ThrottledProgress(callback=callback, buckets=buckets)
+    progress(32768, 40000)
+    progress(40000, 40000)
+    self.assertEqual(
+      first=[call(buckets=buckets, size=32768), call(buckets=buckets, size=7232)],
+      second=mock_throttled.mock_calls,
+      msg='Throttles the bytes that arrived since the last progress on the buckets passed'
+    )
+    self.assertEqual(
+      first=[call(32768, 40000), call(40000, 40000)],
+      second=callback.mock_calls,
+      msg='Reports the progress of the transfer to the callback passed'
+    )
+
+  @patch(target='backup.transfer.opened_local_file')
+  def test_retrieved(self, mock_opened_local_file):
+    sftp = MagicMock()
+    callback = MagicMock()
+    storage = MagicMock()
+
+    self.assertEqual(
+      first='local.enc',
+      second=retrieved(
+        sftp=sftp,
+        remotepath='remote',
+        localpath='local.enc',
+        callback=callback,
+        buckets=[],
+        key=key,
+        storage=storage
+      ),
+      msg='Returns the localpath passed'
+    )
+    self.assertEqual(
+      first=[call(localpath='local.enc', key=key, storage=storage)],
+      second=mock_opened_local_file.call_args_list,
+      msg='Opens the local file with the key and the storage passed'
+    )
+    self.assertEqual(
+      first=[call.getfo(
+        remotepath='remote',
+        fl=mock_opened_local_file.return_value.__enter__.return_value,
+        callback=callback
+      )],
+      second=sftp.mock_calls,
+      msg='Streams the remote file to the local file with the sftp passed when there are no buckets'
+    )
+
+    sftp.reset_mock()
+    self.assertEqual(
+      first='local',
+      second=retrieved(sftp=sftp, remotepath='remote', localpath='local', callback=callback, buckets=['bucket']),
+      msg='Returns the localpath passed when the transfer is limited'
+    )
+    throttled_callback = sftp.getfo.call_args.kwargs['callback']
+    self.assertEqual(
+      first=(ThrottledProgress, callback, ['bucket']),
+      second=(type(throttled_callback), throttled_callback.callback, throttled_callback.buckets),
+      msg='Streams the remote file with paramiko prefetch, throttling its progress on the buckets passed'
+    )
+
+  @patch(target='backup.transfer.sleep')
+  def test_retrieved_limited(self, mock_sleep):
+    def getfo(remotepath, fl, callback):
+      for transferred in (500, 1000):
+        fl.write(b'x' * 500)
+        callback(transferred, 1000)
+
+    sftp = MagicMock()
+    sftp.getfo.side_effect = getfo
+    with TemporaryDirectory() as directory:
+      localpath = path.join(directory, 'file')
+      retrieved(
+        sftp=sftp,
+        remotepath='remote',
+        localpath=localpath,
+        callback=MagicMock(),
+        buckets=[TokenBucket(bytes_per_second=500)]
+      )
+      with open(localpath, 'rb') as local_file:
+        self.assertEqual(
+          first=b'x' * 1000,
+          second=local_file.read(),
+          msg='Writes the whole remote file to the localpath'
+        )
+    self.assertEqual(
+      first=1,
+      second=round(sum(sleep_call.args[0] for sleep_call in mock_sleep.mock_calls)),
+      msg='Waits for the bytes transferred beyond the burst of the buckets passed'
+    )
+
+  def test_opened_local_file(self):
+    with TemporaryDirectory() as directory:
+      localpath = path.join(directory, 'plain')
+      with opened_local_file(localpath=localpath, key=None, storage=None) as local_file:
+        local_file.write(b'plain')
+        self.assertFalse(
+          expr=path.exists(localpath),
+          msg='Writes to a temporary file until the local file is complete'
+        )
+      with open(localpath, 'rb') as plain:
+        self.assertEqual(
+          first=b'plain',
+          second=plain.read(),
+          msg='Writes the plain file without a key'
+        )
+      with opened_local_file(localpath=path.join(directory, 'encrypted'), key=key, storage=None) as local_file:
+        self.assertEqual(
+          first=(EncryptedFile, AtomicFile),
+          second=(type(local_file), type(local_file.file)),
+          msg='Encrypts the file with the key passed before writing it to the temporary file'
+        )
+
+      with self.assertRaises(expected_exception=EOFError):
+        with opened_local_file(localpath=path.join(directory, 'cut'), key=key, storage=None) as local_file:
+          local_file.write(b'partial')
+          raise EOFError
+      self.assertEqual(
+        first=['encrypted', 'plain'],
+        second=sorted(listdir(directory)),
+        msg='Leaves nothing behind when the transfer is interrupted'
+      )
+    storage = MagicMock()
+    self.assertEqual(
+      first=storage.opened.return_value,
+      second=opened_local_file(localpath='s3://backups/rtr.backup', key=None, storage=storage),
+      msg='Opens the local file on the storage passed'
+    )
+    self.assertEqual(
+      first=[call(location='s3://backups/rtr.backup')],
+      second=storage.opened.call_args_list,
+      msg='Opens the location passed on the storage'
+    )